@@ -12,11 +12,13 @@ project_dir = os.path.dirname(os.path.abspath(__file__))
 root = os.path.join(project_dir, "src")
 
 # Needed to properly mock cloud db
-from src.database import Database
+from src.database import Database, ensure_mongod
 
 with open(f"{project_dir}/data/competition.txt") as event_key_file:
     TEST_DATABASE_NAME = "test" + event_key_file.read().rstrip()
 
+# mongod is started the first time the local database is used
+ensure_mongod()
 DB = MongoClient(port=1678)[TEST_DATABASE_NAME]
 
 
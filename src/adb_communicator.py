@@ -2,10 +2,11 @@
 
 """Holds functions that use ADB."""
 
+import concurrent.futures
 import json
 import os
+import posixpath
 import re
-import shutil
 import time
 
 import database
@@ -109,39 +110,104 @@ def uninstall_app(device, app_name="com.frc1678.match_collection"):
         )
 
 
+def get_device_files(device, tablet_file_path):
+    """Lists the files in `tablet_file_path` on `device` with their sizes and modification times.
+
+    Returns a dict of {path relative to `tablet_file_path`: [size, mtime]}.
+    """
+    # Each line of output is "<size> <mtime> <path>"
+    output = utils.run_command(
+        f"adb -s {device} shell find {tablet_file_path} -type f -exec stat -c '%s %Y %n' {{}} +",
+        return_output=True,
+    )
+    device_files = {}
+    for line in output.strip("\n").split("\n"):
+        if not line:
+            continue
+        size, mtime, path = line.split(" ", 2)
+        device_files[posixpath.relpath(path, tablet_file_path)] = [int(size), int(mtime)]
+    return device_files
+
+
+def sync_device_files(local_file_path, tablet_file_path, device):
+    """Pulls the files in `tablet_file_path` on `device` that are new or changed since the last pull.
+
+    Files are pulled to a directory named by the serial number of the device in `local_file_path`.
+    The size and modification time of each pulled file is kept in a manifest next to that
+    directory, files that were deleted from the device are also deleted locally.
+    Returns the paths of the pulled files relative to `tablet_file_path`.
+    """
+    full_local_path = os.path.join(local_file_path, device)
+    manifest_path = os.path.join(local_file_path, f"{device}_manifest.json")
+    manifests = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as manifest_file:
+            manifests = json.load(manifest_file)
+    # Manifests are kept per tablet path since stand strategist devices pull a different folder
+    manifest = manifests.get(tablet_file_path, {})
+
+    device_files = get_device_files(device, tablet_file_path)
+    pulled = []
+    for file, file_info in device_files.items():
+        local_path = os.path.join(full_local_path, file)
+        if manifest.get(file) == file_info and os.path.exists(local_path):
+            continue
+        os.makedirs(os.path.dirname(local_path), exist_ok=True)
+        # The -s flag specifies the device by its serial number.
+        utils.run_command(
+            f"adb -s {device} pull {posixpath.join(tablet_file_path, file)} {local_path}"
+        )
+        manifest[file] = file_info
+        pulled.append(file)
+    for file in set(manifest) - set(device_files):
+        if os.path.exists(local_path := os.path.join(full_local_path, file)):
+            os.remove(local_path)
+        manifest.pop(file)
+
+    manifests[tablet_file_path] = manifest
+    with open(manifest_path, "w") as manifest_file:
+        json.dump(manifests, manifest_file)
+    return pulled
+
+
 def pull_device_files(local_file_path, tablet_file_path, devices=[]):
     """pull_device_files is a function for pulling data off tablets.
 
     pull_device_files is given a local path and a tablet path.
-    It takes the file or directory that is specified as tablet path and
-    puts in the directory specified as local path.
-    The directory that is put in the local path is
+    It takes the files in the directory that is specified as tablet path and
+    puts them in the directory specified as local path.
+    The files that are put in the local path are in
     a subdirectory of a directory with the name of
     the serial number of the tablet that was pulled from.
+    Devices are pulled from at the same time, and only new or changed files are pulled, see
+    `sync_device_files`.
 
     Usage:
     pull_device_files('/path/to/output/directory', '/path/to/tablet/data')
     """
     # Wait for USB connection to initialize
     time.sleep(0.1)
-    # List of devices that have been pulled from (finished)
-    devices_finished = []
-    for device in devices:
-        # Checks if device is finished
-        if device not in devices_finished:
-            # Creates directory for each tablet in data/
-            full_local_path = os.path.join(local_file_path, device)
-            utils.create_file_path(full_local_path)
-            # Deletes and re-creates pull directory, using adb pull to a directory with pre-existing
-            # files, adb pull creates another folder inside of directory and pulls to that directory
-            if os.path.exists(full_local_path):
-                shutil.rmtree(full_local_path)
-                utils.create_file_path(full_local_path, True)
-            # Calls 'adb push' command, which uses the Android Debug
-            # Bridge (ADB) to copy the match schedule file to the tablet.
-            # The -s flag specifies the device by its serial number.
-            utils.run_command(f"adb -s {device} pull {tablet_file_path} {full_local_path}")
-            devices_finished.append(device)
+    # Each device is only pulled from once
+    devices = list(dict.fromkeys(devices))
+    if not devices:
+        return {}
+    pulled = {}
+    # Pulling is waiting on ADB, so each device gets its own thread
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(devices)) as executor:
+        futures = {
+            executor.submit(sync_device_files, local_file_path, tablet_file_path, device): device
+            for device in devices
+        }
+        for future in concurrent.futures.as_completed(futures):
+            device = futures[future]
+            try:
+                pulled[device] = future.result()
+            except Exception as err:
+                log.error(f"Error pulling {tablet_file_path} from {device}: {err}")
+    log.info(
+        f"Pulled {sum(len(files) for files in pulled.values())} new files from {len(pulled)} devices"
+    )
+    return pulled
 
 
 def adb_remove_files(tablet_file_path):
@@ -173,14 +239,15 @@ def pull_device_data():
     devices = _has_devices[0]
     ss_devices = _has_devices[1]
 
-    device_file_paths = []
-    # Stand strategists file paths
-    ss_device_file_paths = []
+    # Files pulled from each device, only new or changed files are read
+    pulled = {}
+    # Stand strategist files pulled from each device
+    ss_pulled = {}
     device_file_path = utils.create_file_path("data/devices/")
     # Pull all files from the 'StandStrategist' folder on the device (if plugged in)
     if ss_devices:
         try:
-            pull_device_files(
+            ss_pulled = pull_device_files(
                 device_file_path,
                 "/storage/emulated/0/Documents/StandStrategist/profiles",
                 ss_devices,
@@ -192,45 +259,39 @@ def pull_device_data():
     # Pull all files from the 'Download' folder on the device (if tablets are plugged in)
     if devices:
         try:
-            pull_device_files(device_file_path, "/storage/emulated/0/Download", devices)
+            pulled = pull_device_files(device_file_path, "/storage/emulated/0/Download", devices)
         except Exception:
             log.error("Error in pulling data from tablet. Make sure it is authorizied")
-    # Iterates through the 'data' folder
-    for device_dir in os.listdir(device_file_path):
-        if device_dir in DEVICE_SERIAL_NUMBERS.keys():
-            if device_dir[:1] == "R":
-                ss_device_file_paths.append(device_dir)
-            else:
-                device_file_paths.append(device_dir)
-
-    for device in device_file_paths:
-        # Iterate through the downloads folder in the device folder
+
+    for device, files in pulled.items():
+        if device not in DEVICE_SERIAL_NUMBERS:
+            continue
+        # Iterate through the files pulled to the device folder
         download_directory = os.path.join(device_file_path, device)
-        for file in os.listdir(download_directory):
-            if re.fullmatch(FILENAME_REGEXES["qr"], file):
+        for file in files:
+            directory, file_name = posixpath.split(file)
+            if not directory and re.fullmatch(FILENAME_REGEXES["qr"], file_name):
                 # Read QR data
                 with open(os.path.join(download_directory, file)) as data_file:
                     file_contents = data_file.read().rstrip("\n")
                     data["qr"].append(file_contents)
-                    break
-            # 'file' is a folder named by an event key containing pit data
-            elif re.fullmatch(re.compile(f"^{db.name}"), file):
+            # 'directory' is a folder named by an event key containing pit data
+            elif re.fullmatch(re.compile(f"^{db.name}"), directory) and re.fullmatch(
+                FILENAME_REGEXES["raw_obj_pit"], file_name
+            ):
                 # Read raw_obj_pit data
-                for new_file in os.listdir(new_path := os.path.join(download_directory, file)):
-                    if re.fullmatch(FILENAME_REGEXES["raw_obj_pit"], new_file):
-                        for data_file in os.listdir(new_path):
-                            if "pit_data" in data_file:
-                                with open(os.path.join(new_path, data_file)) as f:
-                                    file_contents = json.load(f)
-                                data["raw_obj_pit"].append(file_contents)
-                            break
+                with open(os.path.join(download_directory, file)) as f:
+                    file_contents = json.load(f)
+                data["raw_obj_pit"].append(file_contents)
 
     # Pulls data from Stand Strategist (ss)
-    # Iterates through the 'data' folder
     # Iterates through the devices
-    for device in ss_device_file_paths:
+    for device, files in ss_pulled.items():
+        if device not in DEVICE_SERIAL_NUMBERS:
+            continue
         profiles_directory = os.path.join(device_file_path, device)
-        profiles = os.listdir(profiles_directory)
+        # Only profiles with new or changed files are uploaded again
+        profiles = sorted({file.split("/", 1)[0] for file in files if "/" in file})
         num_team_docs = 0
         num_tim_docs = 0
         for profile in profiles:
@@ -336,43 +397,36 @@ def pull_device_data():
 
 
 def pull_pit_data():
-    """Pulls pit data from attached tablets. Then, uploads all pit data in `data/devices` to the local DB."""
+    """Pulls pit data from attached tablets. Then, uploads the new or changed pit data to the local DB."""
     # Parses 'adb devices' to find num of devices so that don't try to pull from nothing
     db = database.Database()
     data = {"qr": [], "raw_obj_pit": []}
 
     devices = has_devices()[0]
 
-    device_file_paths = []
+    # Files pulled from each device, only new or changed files are read
+    pulled = {}
     device_file_path = utils.create_file_path("data/devices/")
     # Pull all files from the 'Download' folder on the device (if tablets are plugged in)
     if devices:
         try:
-            pull_device_files(device_file_path, "/storage/emulated/0/Download", devices)
+            pulled = pull_device_files(device_file_path, "/storage/emulated/0/Download", devices)
         except Exception:
             log.error("Error in pulling data from tablet. Make sure it is authorizied")
-    # Iterates through the 'data' folder
-    for device_dir in os.listdir(device_file_path):
-        if device_dir in DEVICE_SERIAL_NUMBERS.keys():
-            if device_dir[:1] == "R":
-                continue
-            else:
-                device_file_paths.append(device_dir)
-    for device in device_file_paths:
-        # Iterate through the downloads folder in the device folder
+    for device, files in pulled.items():
+        if device not in DEVICE_SERIAL_NUMBERS:
+            continue
+        # Iterate through the files pulled to the device folder
         download_directory = os.path.join(device_file_path, device)
-        for file in os.listdir(download_directory):
-            # 'file' is a folder named by an event key containing pit data
-            if re.fullmatch(re.compile(f"^{db.name}"), file):
+        for file in files:
+            directory, file_name = posixpath.split(file)
+            # 'directory' is a folder named by an event key containing pit data
+            if re.fullmatch(re.compile(f"^{db.name}"), directory) and "pit_data" in file_name:
                 # Read raw_obj_pit data
-                for new_file in os.listdir(new_path := os.path.join(download_directory, file)):
-                    for data_file in os.listdir(new_path):
-                        if "pit_data" in data_file:
-                            with open(os.path.join(new_path, data_file)) as f:
-                                file_contents = json.load(f)
-                            print(file_contents)
-                            data["raw_obj_pit"].append(file_contents)
-                        break
+                with open(os.path.join(download_directory, file)) as f:
+                    file_contents = json.load(f)
+                print(file_contents)
+                data["raw_obj_pit"].append(file_contents)
     """Only raw_obj_pit in the 2024 season, but other years also have raw_subj_pit which is why this iterates through datasets"""
     for dataset in ["raw_obj_pit"]:
         pit_data = data[dataset]
@@ -404,28 +458,22 @@ def pull_qr_data():
     data = {"qr": [], "raw_obj_pit": []}
     devices = has_devices()[0]
 
-    device_file_paths = []
-
-    # Stand strategists file paths
+    # Files pulled from each device, only new or changed files are read
+    pulled = {}
     device_file_path = utils.create_file_path("data/devices/")
     # Pull all files from the 'Download' folder on the device (if tablets are plugged in)
     if devices:
         try:
-            pull_device_files(device_file_path, "/storage/emulated/0/Download", devices)
+            pulled = pull_device_files(device_file_path, "/storage/emulated/0/Download", devices)
         except Exception:
             log.error("Error in pulling data from tablet. Make sure it is authorizied")
-    # Iterates through the 'data' folder
-    for device_dir in os.listdir(device_file_path):
-        if device_dir in DEVICE_SERIAL_NUMBERS.keys():
-            if device_dir[:1] == "R":
-                continue
-            else:
-                device_file_paths.append(device_dir)
 
-    for device in device_file_paths:
-        # Iterate through the downloads folder in the device folder
+    for device, files in pulled.items():
+        if device not in DEVICE_SERIAL_NUMBERS:
+            continue
+        # Iterate through the files pulled to the device folder
         download_directory = os.path.join(device_file_path, device)
-        for file in os.listdir(download_directory):
+        for file in files:
             if re.fullmatch(FILENAME_REGEXES["qr"], file):
                 # Read QR data
                 with open(os.path.join(download_directory, file)) as data_file:
@@ -437,20 +485,19 @@ def pull_qr_data():
 
 
 def pull_ss_data(db):
-    """Pulls stand strategist data from attached tablets. Then, uploads all stand strategist data in `data/devices` to the local DB."""
+    """Pulls stand strategist data from attached tablets. Then, uploads the profiles with new or changed data to the local DB."""
     _has_devices = has_devices()
 
     devices = _has_devices[0]
     ss_devices = _has_devices[1]
 
-    device_file_paths = []
-    # Stand strategists file paths
-    ss_device_file_paths = []
+    # Stand strategist files pulled from each device, only new or changed files are read
+    ss_pulled = {}
     device_file_path = utils.create_file_path("data/devices/")
     # Pull all files from the 'StandStrategist' folder on the device (if plugged in)
     if ss_devices:
         try:
-            pull_device_files(
+            ss_pulled = pull_device_files(
                 device_file_path,
                 "/storage/emulated/0/Documents/StandStrategist/profiles",
                 ss_devices,
@@ -465,20 +512,15 @@ def pull_ss_data(db):
             pull_device_files(device_file_path, "/storage/emulated/0/Download", devices)
         except Exception:
             log.error("Error in pulling data from tablet. Make sure it is authorizied")
-    # Iterates through the 'data' folder
-    for device_dir in os.listdir(device_file_path):
-        if device_dir in DEVICE_SERIAL_NUMBERS.keys():
-            if device_dir[:1] == "R":
-                ss_device_file_paths.append(device_dir)
-            else:
-                device_file_paths.append(device_dir)
 
     # Pulls data from Stand Strategist (ss)
-    # Iterates through the 'data' folder
     # Iterates through the devices
-    for device in ss_device_file_paths:
+    for device, files in ss_pulled.items():
+        if device not in DEVICE_SERIAL_NUMBERS:
+            continue
         profiles_directory = os.path.join(device_file_path, device)
-        profiles = os.listdir(profiles_directory)
+        # Only profiles with new or changed files are uploaded again
+        profiles = sorted({file.split("/", 1)[0] for file in files if "/" in file})
         num_team_docs = 0
         num_tim_docs = 0
         for profile in profiles:
@@ -612,29 +654,26 @@ def get_tablet_file_path_hash(device_id, tablet_file_path):
 def pull_qrs():
     """If tablets are connected, pulls QR data from attached tablets and stores them in `data/devices`.
 
-    Then, uploads all QRs in `data/devices` to the local DB."""
+    Then, uploads the QRs in new or changed files to the local DB."""
     qrs = []
 
     device_file_path = utils.create_file_path("data/devices/")
     devices = has_devices()[0]
+    # Files pulled from each device, only new or changed files are read
+    pulled = {}
     if devices:
         # Pull all files from the 'Download' folder on the device (if tablets are plugged in)
         try:
-            pull_device_files(device_file_path, "/storage/emulated/0/Download", devices)
+            pulled = pull_device_files(device_file_path, "/storage/emulated/0/Download", devices)
         except Exception as err:
             log.info(f"Error pulling tablet files: {err}")
 
-    device_file_paths = []
-    # Iterates through the 'data' folder
-    for device_dir in os.listdir(device_file_path):
-        if device_dir in DEVICE_SERIAL_NUMBERS.keys():
-            if device_dir[:1] != "R":
-                device_file_paths.append(device_dir)
-
-    for device in device_file_paths:
-        # Iterate through the downloads folder in the device folder
+    for device, files in pulled.items():
+        if device not in DEVICE_SERIAL_NUMBERS:
+            continue
+        # Iterate through the files pulled to the device folder
         download_directory = os.path.join(device_file_path, device)
-        for file in os.listdir(download_directory):
+        for file in files:
             if re.fullmatch(FILENAME_REGEXES["qr"], file):
                 # Read QR data
                 with open(os.path.join(download_directory, file)) as data_file:
@@ -665,10 +704,8 @@ event_key = utils.TBA_EVENT_KEY
 
 # Store regex patterns to match files containing either pit or match data
 FILENAME_REGEXES = {
-    # Matches either objective or subjective QR filenames
-    # Format of objective QR file pattern: <qual_num>_<team_num>_<timestamp>.txt
-    # Format of subjective QR file pattern: <qual_num>_<timestamp>.txt
-    "qr": re.compile(r"([0-9]{1,3}_[0-9]{1,5}_[0-9]+\.txt)|([0-9]{1,3}_[0-9]+\.txt)"),
+    # Matches either objective or subjective QR filenames, also used by qr_ingest.py
+    "qr": qr_code_uploader.QR_FILENAME_REGEX,
     # All data is located in <event_key>_pit_data.json
     "raw_obj_pit": re.compile(r"pit_data\.json"),
 }
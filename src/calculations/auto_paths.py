@@ -22,6 +22,7 @@ log = logging.getLogger(__name__)
 
 class AutoPathCalc(BaseCalculations):
     schema = utils.read_schema("schema/calc_auto_paths.yml")
+    INCREMENTAL = True
 
     def __init__(self, server):
         super().__init__(server)
@@ -198,11 +199,17 @@ class AutoPathCalc(BaseCalculations):
         # Filter duplicate pims
         unique_empty_pims = utils.unique_ld(empty_pims)
 
-        self.server.local_db.delete_data("auto_paths")
+        # Paths are grouped by team, so regroup every pim of a team with a changed pim
+        query = {}
+        if (dirty_teams := self.get_dirty_teams()) is not None:
+            unique_empty_pims = [
+                pim for pim in unique_empty_pims if pim["team_number"] in dirty_teams
+            ]
+            query = {"team_number": {"$in": dirty_teams}}
 
-        # Upload data to MongoDB
-        self.server.local_db.insert_documents(
-            "auto_paths", self.calculate_auto_paths(unique_empty_pims)
+        # Upload data to MongoDB, only writing the paths that changed
+        self.server.local_db.replace_collection_contents(
+            "auto_paths", self.calculate_auto_paths(unique_empty_pims), query=query
         )
 
         override.apply_override("auto_paths")
@@ -2,7 +2,7 @@
 # Copyright (c) 2024 FRC Team 1678: Citrus Circuits
 """Holds functions used to determine auto scoring and paths in each match"""
 
-from typing import List, Dict, Union, Any, Tuple
+from typing import List, Dict, Optional, Union, Any, Tuple
 from calculations.base_calculations import BaseCalculations
 import logging
 import utils
@@ -16,16 +16,27 @@ log = logging.getLogger(__name__)
 class AutoPIMCalc(BaseCalculations):
     schema = utils.read_schema("schema/calc_auto_pim.yml")
     obj_tim_schema = utils.read_schema("schema/calc_obj_tim_schema.yml")
+    INCREMENTAL = True
 
     def __init__(self, server):
         super().__init__(server)
-        self.watched_collections = ["unconsolidated_obj_tim", "sim_precision"]
+        self.watched_collections = ["unconsolidated_obj_tim", "sim_precision", "obj_tim", "tba_tim"]
 
     def get_unconsolidated_auto_timelines(
-        self, unconsolidated_obj_tims: List[Dict[str, List[dict]]]
+        self,
+        unconsolidated_obj_tims: List[Dict[str, List[dict]]],
+        grouped_sim_precisions: Optional[Dict[tuple, List[dict]]] = None,
     ) -> Tuple[List[List[dict]], Union[int, None]]:
         """Given unconsolidated_obj_tims, returns unconsolidated auto timelines
-        and the index of the best scout's timeline"""
+        and the index of the best scout's timeline
+
+        `grouped_sim_precisions` is sim_precision grouped by team number, match number, and scout
+        name. It is loaded from the database if not given.
+        """
+        if grouped_sim_precisions is None:
+            grouped_sim_precisions = self.server.local_db.group_by(
+                "sim_precision", ("team_number", "match_number", "scout_name")
+            )
 
         unconsolidated_auto_timelines = []
         best_sim_precision, best_scout_index = None, 0
@@ -42,7 +53,9 @@ class AutoPIMCalc(BaseCalculations):
                     if action["in_teleop"] == False
                 ]
             )
-            sim_precision: List[Dict[str, float]] = self.server.local_db.find("sim_precision", sim)
+            sim_precision: List[Dict[str, float]] = grouped_sim_precisions.get(
+                (sim["team_number"], sim["match_number"], sim["scout_name"]), []
+            )
             if len(sim_precision) == 0:
                 continue
             elif "sim_precision" not in sim_precision[0]:
@@ -138,10 +151,18 @@ class AutoPIMCalc(BaseCalculations):
 
         return consolidated_timeline, is_sus
 
-    def get_consolidated_tim_fields(self, calculated_tim: dict) -> dict:
-        "Given a calculated_tim, return tim fields directly from other collections"
+    def get_consolidated_tim_fields(
+        self, calculated_tim: dict, grouped_collections: Optional[Dict[str, dict]] = None
+    ) -> dict:
+        """Given a calculated_tim, return tim fields directly from other collections
+
+        `grouped_collections` maps collection names to the collection grouped by team number and
+        match number. Collections that aren't in it are loaded from the database.
+        """
         # Auto variables we collect
         tim_fields = self.schema["tim_fields"]
+        if grouped_collections is None:
+            grouped_collections = {}
 
         tim_auto_values = {}
         for field in tim_fields:
@@ -150,12 +171,12 @@ class AutoPIMCalc(BaseCalculations):
                 tim_auto_values[datapoint] = calculated_tim[datapoint]
             else:
                 # Get data from other collections, such as subj_team or tba_tim
-                data: List[dict] = self.server.local_db.find(
-                    collection,
-                    {
-                        "match_number": calculated_tim["match_number"],
-                        "team_number": calculated_tim["team_number"],
-                    },
+                if collection not in grouped_collections:
+                    grouped_collections[collection] = self.server.local_db.group_by(
+                        collection, ("team_number", "match_number")
+                    )
+                data: List[dict] = grouped_collections[collection].get(
+                    (calculated_tim["team_number"], calculated_tim["match_number"]), []
                 )
                 try:
                     tim_auto_values[datapoint] = data[0][datapoint]
@@ -235,14 +256,22 @@ class AutoPIMCalc(BaseCalculations):
         [{"team_number": 1678, "match_number": 42}, {"team_number": 1706, "match_number": 56}, ...]
         """
         calculated_pims = []
+        # Load each collection once instead of once per tim
+        grouped_unconsolidated_obj_tims = self.server.local_db.group_by(
+            "unconsolidated_obj_tim", ("team_number", "match_number")
+        )
+        grouped_obj_tims = self.server.local_db.group_by("obj_tim", ("team_number", "match_number"))
+        grouped_sim_precisions = self.server.local_db.group_by(
+            "sim_precision", ("team_number", "match_number", "scout_name")
+        )
+        grouped_collections = {}
         for tim in tims:
+            tim_key = (tim["team_number"], tim["match_number"])
             # Get data for the tim from MongoDB
-            unconsolidated_obj_tims: List[dict] = self.server.local_db.find(
-                "unconsolidated_obj_tim", tim
-            )
-            obj_tim: dict = self.server.local_db.find("obj_tim", tim)
-            if len(obj_tim) > 0:
-                obj_tim = obj_tim[0]
+            unconsolidated_obj_tims: List[dict] = grouped_unconsolidated_obj_tims.get(tim_key, [])
+            obj_tims: List[dict] = grouped_obj_tims.get(tim_key, [])
+            if len(obj_tims) > 0:
+                obj_tim: dict = obj_tims[0]
             else:
                 log.critical(
                     f"no obj_tim data for {tim['team_number']} in match {tim['match_number']}"
@@ -250,18 +279,15 @@ class AutoPIMCalc(BaseCalculations):
                 continue
 
             # Run calculations on the team in match
-            tim.update(self.get_consolidated_tim_fields(obj_tim))
+            tim.update(self.get_consolidated_tim_fields(obj_tim, grouped_collections))
             timeline, is_sus = self.consolidate_timelines(
                 self.get_unconsolidated_auto_timelines(
-                    self.score_fail_type(unconsolidated_obj_tims)
+                    self.score_fail_type(unconsolidated_obj_tims), grouped_sim_precisions
                 )[0],
                 obj_tim["has_preload"],
             )
             tim.update({"auto_timeline": timeline, "is_sus": is_sus})
             tim.update(self.create_auto_fields(tim))
-            obj_tims = self.server.local_db.find(
-                "obj_tim", {"team_number": tim["team_number"], "match_number": tim["match_number"]}
-            )
             # Data that is later updated by auto_paths
             tim.update(
                 {
@@ -313,9 +339,16 @@ class AutoPIMCalc(BaseCalculations):
         # Filter duplicate tims
         unique_tims = utils.unique_ld(tims)
 
-        self.server.local_db.delete_data("auto_pim")
+        # Replace the changed documents, only for TIMs with changed inputs when running incrementally
+        query = {}
+        if (dirty_tims := self.get_dirty_tims()) is not None:
+            unique_tims = [tim for tim in unique_tims if tim in dirty_tims]
+            # An empty dirty list leaves every existing document alone
+            query = {"$or": dirty_tims} if dirty_tims else {"team_number": {"$in": []}}
 
-        self.server.local_db.insert_documents("auto_pim", self.calculate_auto_pims(unique_tims))
+        self.server.local_db.replace_collection_contents(
+            "auto_pim", self.calculate_auto_pims(unique_tims), query=query
+        )
 
         override.apply_override("auto_pim")
 
@@ -1,4 +1,5 @@
 import json
+from typing import Dict, List, Optional, Union
 import pymongo
 import statistics
 import server
@@ -11,11 +12,54 @@ log = logging.getLogger(__name__)
 class BaseCalculations:
     # Used for converting to a type that is given as a string
     STR_TYPES = {"str": str, "float": float, "int": int, "bool": bool}
+    # Calculations that can recalculate only the documents affected by changes to their watched
+    # collections should set this to True
+    INCREMENTAL = False
 
     def __init__(self, server: "server.Server"):
         self.server = server
         self.watched_collections = NotImplemented  # Calculations should override this attribute
         self.teams_list = self.get_teams_list()
+        # Set by the server before each run. Maps each watched collection to the set of
+        # (team_number, match_number) keys that changed since the last run, or None if everything
+        # needs to be recalculated
+        self.dirty_keys = None
+        # Collections read from and written to by the calculation, set by the server from
+        # `calculations.yml`. None means unknown
+        self.inputs = None
+        self.outputs = None
+
+    def get_dirty_tims(self) -> Optional[List[Dict[str, Union[str, int]]]]:
+        """Returns the TIMs whose inputs changed since the last run, or None if every TIM needs to
+        be recalculated"""
+        if self.dirty_keys is None:
+            return None
+        tims = set()
+        for keys in self.dirty_keys.values():
+            tims.update(key for key in keys if key[0] is not None and key[1] is not None)
+        return [
+            {"team_number": team_number, "match_number": match_number}
+            for team_number, match_number in sorted(tims, key=str)
+        ]
+
+    def get_dirty_teams(self) -> Optional[List[str]]:
+        """Returns the teams whose inputs changed since the last run, or None if every team needs to
+        be recalculated"""
+        if self.dirty_keys is None:
+            return None
+        teams = set()
+        for keys in self.dirty_keys.values():
+            teams.update(key[0] for key in keys if key[0] is not None)
+        return sorted(teams)
+
+    def get_external_hashes(self) -> Dict[str, Dict[tuple, str]]:
+        """Returns hashes of inputs that aren't in the watched collections (e.g. TBA data), by
+        (team_number, match_number) key, under a name for each input
+
+        These are compared between runs like the hashes of the watched collections, so incremental
+        calculations whose output depends on other inputs should override this.
+        """
+        return {}
 
     @staticmethod
     def avg(nums, weights=None, default=None):
@@ -8,6 +8,7 @@ import tba_communicator as tba
 import utils
 import json
 import os
+from match_index import MatchIndex
 from timer import Timer
 
 from typing import Union, List, Dict
@@ -33,7 +34,7 @@ class AnomalyDetection(BaseCalculations):
         return low_cutoff, high_cutoff
 
     def run(self):
-        self.server.local_db.delete_data("anomalous_data")
+        anomalies = []
         collections = ["auto_pim", "obj_tim", "obj_team"]
 
         for c in collections:
@@ -70,7 +71,11 @@ class AnomalyDetection(BaseCalculations):
                                 "high": high_thresh,
                                 data_key: entry[data_key],
                             }
-                            self.server.local_db.insert_documents("anomalous_data", data_to_add)
+                            anomalies.append(data_to_add)
+
+        self.server.local_db.replace_collection_contents(
+            "anomalous_data", anomalies, key_fields=("collection", "team_number", "match_number")
+        )
 
 
 # TODO Add functionality to write flagged matches from DataAccuracy and ScoutDisagreements to data_status.txt
@@ -97,8 +102,7 @@ class DataStatus(BaseCalculations):
     def calc_match_summaries(self):
         match_summaries = []
 
-        tba_data = tba.tba_request(f"event/{utils.TBA_EVENT_KEY}/matches")
-        obj_tim_data = self.server.local_db.find("obj_tim")
+        index = self.server.get_match_index()
         qr_data = list(
             map(lambda doc: get_qr_identifiers(doc["data"]), self.server.local_db.find("raw_qr"))
         )
@@ -112,10 +116,11 @@ class DataStatus(BaseCalculations):
                     {"match_number": qr["match_number"], "scout_name": qr["scout_name"]}
                 )
 
-        for tba_match in sorted(
-            list(filter(lambda doc: doc["comp_level"] == "qm", tba_data)),
-            key=lambda doc: doc["match_number"],
-        ):
+        qrs_by_match = {}
+        for qr in qr_data:
+            qrs_by_match.setdefault(qr["match_number"], []).append(qr)
+
+        for tba_match in index.get_tba_matches():
             match_summary = {
                 "match_number": tba_match["match_number"],
                 "missing_qrs": [],
@@ -124,17 +129,13 @@ class DataStatus(BaseCalculations):
             scout_ids = []
             teams = []
 
-            obj_tim_match = list(
-                filter(lambda doc: doc["match_number"] == tba_match["match_number"], obj_tim_data)
-            )
+            obj_tim_match = index.get_obj_tims(tba_match["match_number"])
             if not obj_tim_match:
                 match_summaries.append(match_summary)
                 continue
             else:
                 match_summary["played"] = True
-            qr_match = list(
-                filter(lambda doc: doc["match_number"] == tba_match["match_number"], qr_data)
-            )
+            qr_match = qrs_by_match.get(tba_match["match_number"], [])
 
             for qr in qr_match:
                 if qr["scout_id"]:
@@ -249,10 +250,10 @@ class DataAccuracy(BaseCalculations):
     def __init__(self, server):
         super().__init__(server)
 
-    def calc_data_accuracy(self, obj_tims: List[dict], tba_matches: List[dict]) -> List[dict]:
+    def calc_data_accuracy(self, index: MatchIndex) -> List[dict]:
         documents = []
 
-        for match_tba in list(filter(lambda t: t["comp_level"] == "qm", tba_matches)):
+        for match_tba in index.get_tba_matches():
             teams = tba.get_teams_in_match(match_tba)
 
             for color in ["red", "blue"]:
@@ -262,13 +263,7 @@ class DataAccuracy(BaseCalculations):
                     "team_numbers": teams[color],
                 }
 
-                alliance_tims = list(
-                    filter(
-                        lambda t: t["team_number"] in teams[color]
-                        and t["match_number"] == match_tba["match_number"],
-                        obj_tims,
-                    )
-                )
+                alliance_tims = index.get_obj_tims(match_tba["match_number"], teams[color])
                 if not alliance_tims:
                     continue
 
@@ -298,13 +293,9 @@ class DataAccuracy(BaseCalculations):
     def run(self):
         timer = Timer()
 
-        updates = self.calc_data_accuracy(
-            self.server.local_db.find("obj_tim"),
-            tba.tba_request(f"event/{utils.TBA_EVENT_KEY}/matches"),
-        )
+        updates = self.calc_data_accuracy(self.server.get_match_index())
 
-        self.server.local_db.delete_data("data_accuracy")
-        self.server.local_db.insert_documents("data_accuracy", updates)
+        self.server.local_db.replace_collection_contents("data_accuracy", updates)
 
         timer.end_timer("data_validation.DataAccuracy")
 
@@ -316,6 +307,9 @@ class ScoutDisagreements(BaseCalculations):
 
     def calc_disagreements(self, sims: List[Dict], tba_matches: List[Dict]) -> List[Dict]:
         result = []
+        sims_by_tim = {}
+        for sim in sims:
+            sims_by_tim.setdefault((sim["match_number"], sim["team_number"]), []).append(sim)
 
         for match_tba in list(filter(lambda t: t["comp_level"] == "qm", tba_matches)):
             teams = tba.get_teams_in_match(match_tba)
@@ -327,13 +321,7 @@ class ScoutDisagreements(BaseCalculations):
                         "alliance_color": color,
                         "team_number": team,
                     }
-                    team_sims = list(
-                        filter(
-                            lambda s: s["match_number"] == match_tba["match_number"]
-                            and s["team_number"] == team,
-                            sims,
-                        )
-                    )
+                    team_sims = sims_by_tim.get((match_tba["match_number"], team), [])
                     if not team_sims:
                         continue
 
@@ -355,12 +343,11 @@ class ScoutDisagreements(BaseCalculations):
     def run(self):
         timer = Timer()
 
-        self.server.local_db.delete_data("scout_disagreements")
-        self.server.local_db.insert_documents(
+        self.server.local_db.replace_collection_contents(
             "scout_disagreements",
             self.calc_disagreements(
                 self.server.local_db.find("unconsolidated_totals"),
-                tba.tba_request(f"event/{self.server.TBA_EVENT_KEY}/matches"),
+                self.server.get_match_index().get_tba_matches(),
             ),
         )
 
@@ -404,22 +391,20 @@ class DataFlagging(BaseCalculations):
 
     def flag_data(self, data_to_flag: Dict[str, List[Dict]], tba_matches: List[Dict]) -> List[Dict]:
         result = []
+        # Group the documents to flag by match number
+        grouped_data = {}
+        for collection, documents in data_to_flag.items():
+            grouped_data[collection] = {}
+            for document in documents:
+                grouped_data[collection].setdefault(document["match_number"], []).append(document)
 
         for match_tba in list(filter(lambda t: t["comp_level"] == "qm", tba_matches)):
             match_doc = {"match_number": match_tba["match_number"], "flagged": False, "flags": []}
 
-            match_disagreements = list(
-                filter(
-                    lambda t: t["match_number"] == match_tba["match_number"],
-                    data_to_flag["scout_disagreements"],
-                )
-            )
-            match_accuracy = list(
-                filter(
-                    lambda t: t["match_number"] == match_tba["match_number"],
-                    data_to_flag["data_accuracy"],
-                )
+            match_disagreements = grouped_data["scout_disagreements"].get(
+                match_tba["match_number"], []
             )
+            match_accuracy = grouped_data["data_accuracy"].get(match_tba["match_number"], [])
             if not match_disagreements and not match_accuracy:
                 continue
 
@@ -455,34 +440,47 @@ class DataFlagging(BaseCalculations):
         return result
 
     def flag_in_obj_tims(self, flags: list[dict]) -> None:
-        count = 0
+        """Sets `flagged` on the obj_tims of `flags`, and clears it on every other obj_tim
+
+        obj_tims are only rewritten when their inputs change, so flags of data that has been fixed
+        since the last run are cleared here.
+        """
+        # Query for the obj_tims of each flag
+        queries = []
         for flagged_match in flags:
             if not flagged_match["flagged"]:
                 continue
             for flag in flagged_match["flags"]:
                 if "diff" in flag["datapoint"]:
-                    operation = self.server.local_db.update_document(
-                        "obj_tim",
-                        {"flagged": True},
+                    queries.append(
                         {
                             "match_number": flagged_match["match_number"],
                             "alliance_color_is_red": flag["alliance_color"] == "red",
-                        },
-                        many=True,
+                        }
                     )
-                    count += operation.modified_count
                 elif "range" in flag["datapoint"]:
-                    operation = self.server.local_db.update_document(
-                        "obj_tim",
-                        {"flagged": True},
+                    queries.append(
                         {
                             "match_number": flagged_match["match_number"],
                             "team_number": flag["team_number"],
-                        },
+                        }
                     )
-                    count += operation.modified_count
                 else:
                     log.error(f"Flag type not recognized: {flag}")
+        # Only documents that change are written, so unchanged flags don't show up in the oplog
+        operation = self.server.local_db.update_document(
+            "obj_tim",
+            {"flagged": False},
+            {"flagged": True, "$nor": queries} if queries else {"flagged": True},
+            many=True,
+        )
+        log.info(f"Cleared the flags of {operation.modified_count} documents in obj_tim")
+        count = 0
+        for query in queries:
+            operation = self.server.local_db.update_document(
+                "obj_tim", {"flagged": True}, {**query, "flagged": {"$ne": True}}, many=True
+            )
+            count += operation.modified_count
         log.info(f"Flagged {count} documents in obj_tim")
 
     def run(self):
@@ -493,11 +491,10 @@ class DataFlagging(BaseCalculations):
                 "data_accuracy": self.server.local_db.find("data_accuracy"),
                 "scout_disagreements": self.server.local_db.find("scout_disagreements"),
             },
-            tba.tba_request(f"event/{self.server.TBA_EVENT_KEY}/matches"),
+            self.server.get_match_index().get_tba_matches(),
         )
 
-        self.server.local_db.delete_data("flagged_data")
-        self.server.local_db.insert_documents(
+        self.server.local_db.replace_collection_contents(
             "flagged_data",
             list(filter(lambda t: t["flagged"], flags)),
         )
@@ -3,6 +3,8 @@
 """Decompresses objective and subjective match collection QR codes."""
 
 import enum
+import hashlib
+import json
 import os
 import re
 
@@ -59,6 +61,50 @@ def get_qr_identifiers(qr) -> dict:
     return data
 
 
+def compile_decompressed_names(schema) -> Dict[str, dict]:
+    """Maps the compressed names in each section of `schema` to their decompressed names.
+
+    Compressed names are the first item of list values or the value itself. If a compressed name
+    appears more than once in a section, the first decompressed name is used.
+    """
+    decompressed_names = {}
+    for section, fields in schema.items():
+        if not isinstance(fields, dict):
+            continue
+        names = {}
+        for name, value in fields.items():
+            compressed_name = value[0] if isinstance(value, list) else value
+            # Super compressed actions are nested dicts, they can't be looked up by value
+            if isinstance(compressed_name, (dict, list)):
+                continue
+            names.setdefault(compressed_name, name)
+        decompressed_names[section] = names
+    return decompressed_names
+
+
+def compile_field_decoders(schema) -> Dict[str, dict]:
+    """Maps the compressed names of the data fields in each section of `schema` to a decoder.
+
+    Decoders are tuples of (decompressed name, data type, splitter). The splitter is only used for
+    lists of none-dicts, and is either the length of each item or the separator between items.
+    """
+    field_decoders = {}
+    for section, names in compile_decompressed_names(schema).items():
+        decoders = {}
+        for compressed_name, name in names.items():
+            value = schema[section][name]
+            # Fields without a type aid in (de)compression, they aren't data fields
+            if not isinstance(value, list) or len(value) < 2:
+                continue
+            type_ = value[1:] if len(value) > 2 else value[1]
+            splitter = None
+            if isinstance(type_, list) and type_[1] != "dict":
+                splitter = type_[2] if len(type_) > 2 else schema["_list_data_separator"]
+            decoders[compressed_name] = (name, type_, splitter)
+        field_decoders[section] = decoders
+    return field_decoders
+
+
 class Decompressor(base_calculations.BaseCalculations):
 
     # Load latest match collection compression QR code schema
@@ -70,6 +116,12 @@ class Decompressor(base_calculations.BaseCalculations):
     OBJECTIVE_QR_FIELDS = _GENERIC_DATA_FIELDS.union(QRState._get_data_fields("objective_tim"))
     SUBJECTIVE_QR_FIELDS = _GENERIC_DATA_FIELDS.union(QRState._get_data_fields("subjective_aim"))
     TIMELINE_FIELDS = QRState.get_timeline_info()
+    # Reverse lookups of the schema so fields aren't found by scanning their section every time
+    DECOMPRESSED_NAMES = compile_decompressed_names(SCHEMA)
+    FIELD_DECODERS = compile_field_decoders(SCHEMA)
+    # Each timeline action is a fixed length time followed by a fixed length action symbol
+    TIMELINE_TIME_LENGTH = SCHEMA["timeline"]["time"][0]
+    TIMELINE_SYMBOL_LENGTH = SCHEMA["timeline"]["action_type"][0]
 
     MISSING_TIM_IGNORE_FILE_PATH = utils.create_file_path("data/missing_tim_ignore.yml")
 
@@ -77,9 +129,14 @@ class Decompressor(base_calculations.BaseCalculations):
         super().__init__(server)
         self.watched_collections = ["raw_qr"]
         self.super_compressed_actions = []
+        # Number of data characters after each super compressed action symbol
+        self.super_compressed_lengths = {}
 
         for calc in self.SCHEMA["super_compressed"]:
             self.super_compressed_actions.append(self.SCHEMA["action_type"][calc])
+            self.super_compressed_lengths[self.SCHEMA["action_type"][calc]] = len(
+                self.SCHEMA["super_compressed"][calc]["compressed"]
+            )
 
     def convert_data_type(self, value, type_, name=None):
         """Convert from QR string representation to database data type."""
@@ -102,13 +159,9 @@ class Decompressor(base_calculations.BaseCalculations):
         compressed_name: str - Compressed variable name within QR code
         section: str - Section of schema that name comes from.
         """
-        for key, value in self.SCHEMA[section].items():
-            if isinstance(value, list):
-                if value[0] == compressed_name:
-                    return key
-            else:
-                if value == compressed_name:
-                    return key
+        names = self.DECOMPRESSED_NAMES[section]
+        if compressed_name in names:
+            return names[compressed_name]
         raise ValueError(f"Retrieving Variable Name {compressed_name} from {section} failed.")
 
     def get_decompressed_type(self, name, section):
@@ -138,9 +191,14 @@ class Decompressor(base_calculations.BaseCalculations):
 
             compressed_name = data_field[0]  # Compressed name is always first character
             value = data_field[1:]  # Actual data value is everything after the first character
-            # Get uncompressed name and the target data type
-            uncompressed_name = self.get_decompressed_name(compressed_name, section)
-            uncompressed_type = self.get_decompressed_type(uncompressed_name, section)
+            # Get uncompressed name, the target data type, and how to split lists
+            if compressed_name not in self.FIELD_DECODERS[section]:
+                raise ValueError(
+                    f"Retrieving Variable Name {compressed_name} from {section} failed."
+                )
+            uncompressed_name, uncompressed_type, splitter = self.FIELD_DECODERS[section][
+                compressed_name
+            ]
             # Detect special cases in typing (e.g. value is list)
             if isinstance(uncompressed_type, list):
                 # If second data type is dictionary, it should be handled separately
@@ -173,14 +231,13 @@ class Decompressor(base_calculations.BaseCalculations):
                         )
                 # Decompress list of none-dicts
                 elif uncompressed_type[1] in ["int", "float", "bool", "str"]:
-                    if len(uncompressed_type) == 2:
+                    if isinstance(splitter, str):
                         # Default case, use _list_data_separator to seperate value into list items
-                        split_values = value.split(self.SCHEMA["_list_data_separator"])
+                        split_values = value.split(splitter)
                     else:
                         # Use the specified length of each item to seperate
                         split_values = [
-                            value[i : i + uncompressed_type[2]]
-                            for i in range(0, len(value), uncompressed_type[2])
+                            value[i : i + splitter] for i in range(0, len(value), splitter)
                         ]
                     # Convert string to appropriate data type
                     typed_value = [
@@ -438,7 +495,10 @@ class Decompressor(base_calculations.BaseCalculations):
         return True
 
     def decompress_timeline(self, data, has_preload):
-        """Decompress the timeline based on schema."""
+        """Decompress the timeline based on schema.
+
+        The timeline is decoded in one pass, slicing each fixed length time and action symbol.
+        """
         decompressed_timeline = []  # Timeline is a list of dictionaries
 
         self.check_timeline(data)
@@ -447,85 +507,55 @@ class Decompressor(base_calculations.BaseCalculations):
         if not data:
             return decompressed_timeline
 
-        time_length = 0
-        symbol_length = 0
-
-        # get the legnths of the time and compressed symbol fields
-        for entry in self.TIMELINE_FIELDS:
-            if entry["name"] == "time":
-                time_length = entry["length"]
-            elif entry["name"] == "action_type":
-                symbol_length = entry["length"]
+        time_length = self.TIMELINE_TIME_LENGTH
+        symbol_length = self.TIMELINE_SYMBOL_LENGTH
+        action_names = self.DECOMPRESSED_NAMES["action_type"]
+        to_teleop = self.SCHEMA["action_type"]["to_teleop"]
 
-        # initilize the current position in the timeline as well as the next one
+        # initilize the current position in the timeline
         current_position = 0
 
         # Start in auto
         in_teleop = False
         # Loop through the entire timeline
         while current_position < len(data):
-
-            # Initilize the decompressed action
-            decompressed_action = {"time": 0, "action_type": "", "in_teleop": False}
-
-            # split the time (like 007 or 012) from the current action
+            # split the time (like 007 or 012) and the compressed symbol (like AC or BA)
             action_time = data[current_position : current_position + time_length]
             current_position += time_length
-
-            # Split the compressed symbol (like AC or BA) from the current action
             action_symbol = data[current_position : current_position + symbol_length]
-
-            # advance the next position by one symbol
             current_position += symbol_length
 
-            # Set the decompressed actions time
-            decompressed_action["time"] = int(action_time)
+            if action_symbol not in action_names:
+                raise ValueError(
+                    f"Retrieving Variable Name {action_symbol} from action_type failed."
+                )
+            action_name = action_names[action_symbol]
 
             # change to teleop if the action is to teleop
-            if action_symbol == self.SCHEMA["action_type"]["to_teleop"]:
+            if action_symbol == to_teleop:
                 in_teleop = True
 
-            # Set whether the decompressed action is in teleop
-            decompressed_action["in_teleop"] = in_teleop
-
-            # dectect if the symbol is a super com  pressed action
-            if action_symbol in self.super_compressed_actions:
-
-                # Get the name of the super compressed action
-                action_name = self.get_decompressed_name(action_symbol, "action_type")
-
-                # Get the number of fields in the compressed action
-                super_compressed_data_length = len(
-                    self.SCHEMA["super_compressed"][action_name]["compressed"].values()
-                )
-
+            # dectect if the symbol is a super compressed action
+            if action_symbol in self.super_compressed_lengths:
+                super_compressed_data_length = self.super_compressed_lengths[action_symbol]
                 super_compressed_data = data[
                     current_position : current_position + super_compressed_data_length
                 ]
 
-                # get the rest of the super compressed data and send it through the super decompress function
-                decompressed_value = self.super_decompress(
+                # send the rest of the super compressed data through the super decompress function
+                action_name = self.super_decompress(
                     self.SCHEMA["super_compressed"], action_name, super_compressed_data
                 )
 
                 # advance over the super compressed data
                 current_position += super_compressed_data_length
-            else:
-                # Get the name of the normal timeline action
-                decompressed_value = self.get_decompressed_name(action_symbol, "action_type")
-
-            # Set the decompressed action type
-            decompressed_action["action_type"] = decompressed_value
-
-            # Add the decompressed action to the timeline
-            if (
-                "auto" in decompressed_action["action_type"] and decompressed_action["in_teleop"]
-            ) or (
-                "tele" in decompressed_action["action_type"]
-                and not decompressed_action["in_teleop"]
-            ):
+
+            # Skip auto actions in teleop and teleop actions in auto
+            if ("auto" in action_name and in_teleop) or ("tele" in action_name and not in_teleop):
                 continue
-            decompressed_timeline.append(decompressed_action)
+            decompressed_timeline.append(
+                {"time": int(action_time), "action_type": action_name, "in_teleop": in_teleop}
+            )
         decompressed_timeline = self.superposition_collapser(decompressed_timeline, has_preload)
         decompressed_timeline = self.fail_consolidator(decompressed_timeline)
 
@@ -601,17 +631,42 @@ class Decompressor(base_calculations.BaseCalculations):
             decompressed_document.update({"override": override})
         return decompressed_data
 
-    def decompress_qrs(self, split_qrs):
-        """Decompresses a list of QRs. Returns dict of decompressed QRs split by type."""
+    def get_cache_key(self, qr) -> str:
+        """Returns the key of a raw QR in the decompression cache.
+
+        Raw QRs only change when they are overridden, so the key is a hash of the QR data, the
+        override, and the schema version it was decompressed with.
+        """
+        return hashlib.sha1(
+            json.dumps(
+                [qr["data"], qr["override"], self.SCHEMA["schema_file"]["version"]],
+                sort_keys=True,
+                default=str,
+            ).encode()
+        ).hexdigest()
+
+    def decompress_qrs(self, split_qrs, cache=None):
+        """Decompresses a list of QRs. Returns dict of decompressed QRs split by type.
+
+        cache: dict - Decompressed QRs by `get_cache_key`, QRs missing from it are decompressed and
+        added to it. Bad QRs are cached as None.
+        """
         output = {"unconsolidated_obj_tim": [], "subj_tim": []}
         unique_qrs = set()
         for qr in split_qrs:
             qr_type = utils.catch_function_errors(self.get_qr_type, qr["data"][0])
             if qr_type is None:
                 continue
-            decompressed_qr = utils.catch_function_errors(
-                self.decompress_single_qr, qr["data"][1:], qr_type, qr["override"]
-            )
+            cache_key = self.get_cache_key(qr) if cache is not None else None
+            if cache is not None and cache_key in cache:
+                # Cached documents are copied since they are modified below
+                decompressed_qr = copy.deepcopy(cache[cache_key])
+            else:
+                decompressed_qr = utils.catch_function_errors(
+                    self.decompress_single_qr, qr["data"][1:], qr_type, qr["override"]
+                )
+                if cache is not None:
+                    cache[cache_key] = copy.deepcopy(decompressed_qr)
             if decompressed_qr is None:
                 log.info(f"Bad QR not decompressed:")
                 print(f"{qr['data']}")
@@ -739,7 +794,7 @@ class Decompressor(base_calculations.BaseCalculations):
         # Load matches or matches and ids to ignore from ignore file
         if os.path.exists(self.MISSING_TIM_IGNORE_FILE_PATH):
             with open(self.MISSING_TIM_IGNORE_FILE_PATH) as ignore_file:
-                items_to_ignore = yaml.load(ignore_file, Loader=yaml.Loader)
+                items_to_ignore = yaml.load(ignore_file, Loader=utils.YAML_LOADER)
         else:
             items_to_ignore = []
         matches_to_ignore = [item["match_number"] for item in items_to_ignore if len(item) == 1]
@@ -824,7 +879,15 @@ class Decompressor(base_calculations.BaseCalculations):
                 qr["data"] = qr["data"].upper()
                 modified.append(qr)
         all_qrs = modified
-        decompressed_qrs = self.decompress_qrs(all_qrs)
+        # Only QRs that were scanned or overridden since they were cached are decompressed
+        cache = self.server.local_db.get_decompression_cache()
+        cached_keys = set(cache.keys())
+        decompressed_qrs = self.decompress_qrs(all_qrs, cache)
+        # Entries of blocklisted or deleted QRs are removed
+        current_keys = {self.get_cache_key(qr) for qr in all_qrs} & set(cache.keys())
+        self.server.local_db.update_decompression_cache(
+            {key: cache[key] for key in current_keys - cached_keys}, cached_keys - current_keys
+        )
 
         # Checks if two subjective scouts scouted the same alliance in a match
         # If so, delete one of the qrs
@@ -842,8 +905,9 @@ class Decompressor(base_calculations.BaseCalculations):
         decompressed_qrs["subj_tim"] = filtered_qrs
 
         for collection in ["unconsolidated_obj_tim", "subj_tim"]:
-            self.server.local_db.delete_data(collection)
-            self.server.local_db.insert_documents(collection, decompressed_qrs[collection])
+            self.server.local_db.replace_collection_contents(
+                collection, decompressed_qrs[collection]
+            )
 
         override.apply_override("unconsolidated_obj_tim")
         override.apply_override("subj_tim")
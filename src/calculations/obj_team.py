@@ -9,9 +9,10 @@ import logging
 from timer import Timer
 import csv
 import os
-import tba_communicator as tba
 import override
 import time
+import hashlib
+import json
 
 log = logging.getLogger(__name__)
 
@@ -22,11 +23,12 @@ class OBJTeamCalc(base_calculations.BaseCalculations):
     # Get the last section of each entry (so foo.bar.baz becomes baz)
     SCHEMA = utils.unprefix_schema_dict(utils.read_schema("schema/calc_obj_team_schema.yml"))
     TIM_SCHEMA = utils.read_schema("schema/calc_obj_tim_schema.yml")
+    INCREMENTAL = True
 
     def __init__(self, server):
         """Overrides watched collections, passes server object"""
         super().__init__(server)
-        self.watched_collections = ["obj_tim", "subj_tim"]
+        self.watched_collections = ["obj_tim", "ss_tim", "auto_pim"]
 
         # For Matt's robustness ratings
         self.robustness_var_map = {
@@ -609,11 +611,34 @@ class OBJTeamCalc(base_calculations.BaseCalculations):
     #         return 0.0
     #     return total_defense_points_subtracted / len(matches_played_defense)
 
+    def get_played_matches(self) -> Dict[str, list]:
+        """Returns the played qualification matches of each team from TBA, see `MatchIndex`"""
+        return self.server.get_match_index().get_played_matches_by_team()
+
+    def get_external_hashes(self) -> Dict[str, Dict[tuple, str]]:
+        """Hashes the number of played matches (the denominator of `matches_with_data`) and the
+        robustness ratings of each team, so teams are recalculated when TBA or the ratings change
+        """
+        played_matches = self.get_played_matches()
+        ratings = {rating.get("team_number"): rating for rating in self.pull_robustness_ratings()}
+        return {
+            "tba_played_matches": {
+                (team, None): str(len(matches)) for team, matches in played_matches.items()
+            },
+            "robustness_ratings": {
+                (team, None): hashlib.sha1(
+                    json.dumps(rating, sort_keys=True, default=str).encode()
+                ).hexdigest()
+                for team, rating in ratings.items()
+            },
+        }
+
     def update_team_calcs(self, teams: list) -> list:
         """Calculate data for given team using objective calculated TIMs"""
         obj_team_updates = {}
 
         robustness_ratings = self.pull_robustness_ratings()
+        played_matches = self.get_played_matches()
 
         for team in teams:
             team_data = {}
@@ -662,18 +687,20 @@ class OBJTeamCalc(base_calculations.BaseCalculations):
             for team_rating in robustness_ratings:
                 try:
                     if team_rating["team_number"] == team:
-                        team_rating.pop("team_number")
-                        team_data.update(team_rating)
+                        team_data.update(
+                            {
+                                var: value
+                                for var, value in team_rating.items()
+                                if var != "team_number"
+                            }
+                        )
                         break
                 except:
                     continue
             else:
                 team_data.update({var: None for var in list(self.robustness_var_map.values())[1:]})
 
-            # If obj team is too slow, it might be because TBA requests are slower than usual. This happens when the internet is bad (e.g. at Champs). To fix this, remove the TBA request here and just use the number of obj tim documents. Replace the long f-string below with `f"{len(obj_tims)}/{len(obj_tims)}"`
-            team_data[
-                "matches_with_data"
-            ] = f"{len(obj_tims)}/{len([match for match in (tba.tba_request(f'event/{self.server.TBA_EVENT_KEY}/matches') or []) if team in (tba.get_teams_in_match(match)['red'] + tba.get_teams_in_match(match)['blue']) and match.get('score_breakdown') and (self.server.TBA_EVENT_KEY + '_qm') in match['key']])}"
+            team_data["matches_with_data"] = f"{len(obj_tims)}/{len(played_matches.get(team, []))}"
 
             obj_team_updates[team] = team_data
         return list(obj_team_updates.values())
@@ -684,8 +711,15 @@ class OBJTeamCalc(base_calculations.BaseCalculations):
 
         teams = self.get_teams_list()
 
-        self.server.local_db.delete_data("obj_team")
-        self.server.local_db.insert_documents("obj_team", self.update_team_calcs(teams))
+        # Only recalculate teams with changed TIMs, played matches, or robustness ratings when
+        # running incrementally, see `get_external_hashes`
+        query = {}
+        if (dirty_teams := self.get_dirty_teams()) is not None:
+            teams = [team for team in teams if team in dirty_teams]
+            query = {"team_number": {"$in": dirty_teams}}
+        self.server.local_db.replace_collection_contents(
+            "obj_team", self.update_team_calcs(teams), query=query
+        )
 
         override.apply_override("obj_team")
 
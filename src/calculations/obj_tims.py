@@ -19,10 +19,11 @@ log = logging.getLogger(__name__)
 class ObjTIMCalcs(BaseCalculations):
     schema = utils.read_schema("schema/calc_obj_tim_schema.yml")
     type_check_dict = {"float": float, "int": int, "str": str, "bool": bool}
+    INCREMENTAL = True
 
     def __init__(self, server):
         super().__init__(server)
-        self.watched_collections = ["unconsolidated_totals"]
+        self.watched_collections = ["unconsolidated_totals", "tba_tim"]
 
     def consolidate_nums(self, nums: List[Union[int, float]], decimal=False) -> int:
         """Given numbers reported by multiple scouts, estimates actual number
@@ -214,9 +215,14 @@ class ObjTIMCalcs(BaseCalculations):
         """Calculate data for each of the given TIMs. Those TIMs are represented as dictionaries:
         {'team_number': '1678', 'match_number': 69}"""
         calculated_tims = []
+        grouped_totals = self.server.local_db.group_by(
+            "unconsolidated_totals", ("team_number", "match_number")
+        )
 
         for tim in tims:
-            unconsolidated_totals = self.server.local_db.find("unconsolidated_totals", tim)
+            unconsolidated_totals = grouped_totals.get(
+                (tim["team_number"], tim["match_number"]), []
+            )
             calculated_tim = self.calculate_tim(unconsolidated_totals)
             calculated_tim["flagged"] = False
             calculated_tims.append(calculated_tim)
@@ -243,9 +249,15 @@ class ObjTIMCalcs(BaseCalculations):
             if tim not in unique_tims:
                 unique_tims.append(tim)
 
-        self.server.local_db.delete_data("obj_tim")
+        # Replace the changed documents, only for TIMs with changed inputs when running incrementally
+        query = {}
+        if (dirty_tims := self.get_dirty_tims()) is not None:
+            unique_tims = [tim for tim in unique_tims if tim in dirty_tims]
+            # An empty dirty list leaves every existing document alone
+            query = {"$or": dirty_tims} if dirty_tims else {"team_number": {"$in": []}}
 
         updates = self.update_calcs(unique_tims)
+        tba_tims = self.server.local_db.group_by("tba_tim", ("team_number", "match_number"))
         filtered = []
         if updates == None:
             pass
@@ -253,10 +265,7 @@ class ObjTIMCalcs(BaseCalculations):
             for update in updates:
                 if update:
                     if update["team_number"] in self.server.TEAM_LIST:
-                        if tba_tim := self.server.local_db.find(
-                            "tba_tim",
-                            {"team_number": team_num, "match_number": document["match_number"]},
-                        ):
+                        if tba_tim := tba_tims.get((update["team_number"], update["match_number"])):
                             update["leave"] = tba_tim[0]["leave"]
                         filtered.append(update)
                     else:
@@ -264,7 +273,7 @@ class ObjTIMCalcs(BaseCalculations):
                             f"{update['team_number']} not found in match {update['match_number']}"
                         )
 
-        self.server.local_db.insert_documents("obj_tim", filtered)
+        self.server.local_db.replace_collection_contents("obj_tim", filtered, query=query)
 
         override.apply_override("obj_tim")
 
@@ -231,8 +231,7 @@ class PickabilityCalc(base_calculations.BaseCalculations):
                 except:
                     continue
 
-        self.server.local_db.delete_data("pickability")
-        self.server.local_db.insert_documents(
+        self.server.local_db.replace_collection_contents(
             "pickability", self.update_pickability(obj_team, tba_team, auto_paths, subj_team)
         )
 
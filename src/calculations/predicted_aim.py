@@ -7,17 +7,234 @@ from statistics import NormalDist as Norm
 from calculations.base_calculations import BaseCalculations
 import tba_communicator
 import logging
-import pandas as pd
-import statsmodels.api as sm
 from timer import Timer
 import doozernet_communicator
-from typing import List
+import match_index
+from typing import Dict, List, Optional
 import copy
 import override
 
 log = logging.getLogger(__name__)
 
 
+class TeamFeatureMatrix:
+    """Each team's contribution to an alliance's predictions, stored as NumPy arrays
+
+    Built once per cycle from obj_team and tba_team, so the predicted values, scores, RPs, and win
+    chances of every alliance are calculated with array operations instead of searching obj_team
+    and tba_team for each alliance. Works for any alliance, not only scheduled ones.
+
+    Sums are done one team (or feature) at a time, in the same order as
+    `PredictedAimCalc.calc_predicted_values`, `predict_value`, and `calc_win_chance`, so the
+    results are exactly the same as theirs.
+
+    Fields that are missing or None in a team's data are read as NaN, and `value_mask` and
+    `win_chance_mask` mark the values that are known. Unknown values count as 0, so one team with
+    incomplete data doesn't stop every other alliance from being predicted.
+    """
+
+    # obj_team field each predicted value is the sum of
+    OBJ_TEAM_FIELDS = {
+        "auto_net": "auto_avg_net",
+        "auto_processor": "auto_avg_processor",
+        "auto_coral_L1": "auto_avg_coral_L1",
+        "auto_coral_L2": "auto_avg_coral_L2",
+        "auto_coral_L3": "auto_avg_coral_L3",
+        "auto_coral_L4": "auto_avg_coral_L4",
+        "tele_net": "tele_avg_net",
+        "tele_processor": "tele_avg_processor",
+        "tele_coral_L1": "tele_avg_coral_L1",
+        "tele_coral_L2": "tele_avg_coral_L2",
+        "tele_coral_L3": "tele_avg_coral_L3",
+        "tele_coral_L4": "tele_avg_coral_L4",
+        "endgame_park": "park_percent",
+        "endgame_shallow": "cage_percent_success_shallow",
+        "endgame_deep": "cage_percent_success_deep",
+    }
+    # tba_team field each predicted value is the sum of
+    TBA_TEAM_FIELDS = {"auto_leave": "leave_success_rate"}
+
+    def __init__(
+        self,
+        obj_team: List[dict],
+        tba_team: List[dict],
+        features: List[str],
+        point_values: Dict[str, float],
+        win_chance_fields: Dict[str, dict],
+        played_teams: Optional[List[str]] = None,
+    ):
+        """`features` are the predicted values in order, `point_values` are the points each one is
+        worth, and `win_chance_fields` is `--win_chance` in calc_predicted_aim_schema.yml
+
+        `played_teams` are the teams that have played a match, a critical error is logged when
+        calculating the win chance of one of them without obj_team data
+        """
+        self.features = list(features)
+        self.played_teams = set(played_teams or [])
+        self.point_values = np.array([point_values[feature] for feature in self.features])
+        tba_team_by_number = {}
+        for team_data in tba_team:
+            tba_team_by_number.setdefault(team_data["team_number"], team_data)
+
+        # Rows are in obj_team order, which is the order `calc_predicted_values` adds teams in
+        self.rows: Dict[str, int] = {}
+        values, means, variances = [], [], []
+        for team_data in obj_team:
+            if team_data["team_number"] in self.rows:
+                continue
+            self.rows[team_data["team_number"]] = len(values)
+            tba_data = tba_team_by_number.get(team_data["team_number"], {})
+            row = []
+            for feature in self.features:
+                if feature in self.TBA_TEAM_FIELDS:
+                    # Teams without tba_team data didn't leave
+                    row.append(self.get_number(tba_data, self.TBA_TEAM_FIELDS[feature], 0))
+                else:
+                    row.append(self.get_number(team_data, self.OBJ_TEAM_FIELDS[feature]))
+            values.append(row)
+            team_mean = 0
+            team_var = 0
+            for name, attrs in win_chance_fields.items():
+                team_mean += self.get_number(team_data, name) * attrs["weight"]
+                team_var += (self.get_number(team_data, attrs["sd"]) * attrs["weight"]) ** 2
+            means.append(team_mean)
+            variances.append(team_var)
+
+        # The last row is all zeros and stands in for teams without data, which add nothing
+        self.missing_row = len(values)
+        values = np.array(values, dtype=float).reshape(len(values), len(self.features))
+        means = np.array(means, dtype=float)
+        variances = np.array(variances, dtype=float)
+        self.value_mask = np.ones((len(values) + 1, len(self.features)), dtype=bool)
+        self.value_mask[:-1] = ~np.isnan(values)
+        self.win_chance_mask = np.ones(len(means) + 1, dtype=bool)
+        self.win_chance_mask[:-1] = ~(np.isnan(means) | np.isnan(variances))
+        self.values = np.zeros((len(values) + 1, len(self.features)))
+        self.values[:-1] = np.where(self.value_mask[:-1], values, 0)
+        self.means = np.zeros(len(means) + 1)
+        self.means[:-1] = np.where(self.win_chance_mask[:-1], means, 0)
+        self.variances = np.zeros(len(variances) + 1)
+        self.variances[:-1] = np.where(self.win_chance_mask[:-1], variances, 0)
+
+        for team, row in self.rows.items():
+            missing = [
+                feature
+                for feature, known in zip(self.features, self.value_mask[row].tolist())
+                if not known
+            ]
+            if missing:
+                log.warning(f"obj_team data for team {team} is missing {missing}, using 0")
+            if not self.win_chance_mask[row]:
+                log.warning(f"obj_team data for team {team} can't be used to calculate win chance")
+
+    @staticmethod
+    def get_number(team_data: dict, field: str, default: float = np.nan) -> float:
+        """Returns 'field' of 'team_data' as a number, or 'default' if it's missing or None"""
+        value = team_data.get(field)
+        return default if value is None else value
+
+    def get_rows(self, alliances: List[List[str]], sort: bool = False) -> np.ndarray:
+        """Returns the row of each team in `alliances`, with one alliance per row
+
+        Alliances are padded with the empty row, which is also used for teams without data. If
+        `sort` is set, each alliance's rows are in matrix order instead of alliance order.
+        """
+        width = max((len(alliance) for alliance in alliances), default=0)
+        rows = np.full((len(alliances), width), self.missing_row, dtype=int)
+        for alliance_num, alliance in enumerate(alliances):
+            for team_num, team in enumerate(alliance):
+                rows[alliance_num, team_num] = self.rows.get(team, self.missing_row)
+        if sort:
+            rows.sort(axis=1)
+        return rows
+
+    @staticmethod
+    def sum_rows(array: np.ndarray, rows: np.ndarray) -> np.ndarray:
+        """Adds up `array` at each alliance's `rows`, one team at a time"""
+        total = np.zeros((len(rows),) + array.shape[1:])
+        for column in range(rows.shape[1]):
+            total = total + array[rows[:, column]]
+        return total
+
+    def calc_predicted_values(self, alliances: List[List[str]]) -> np.ndarray:
+        """Returns the predicted values of each alliance, with one alliance per row and one
+        predicted value per column (in `features` order)"""
+        return self.sum_rows(self.values, self.get_rows(alliances, sort=True))
+
+    def get_columns(
+        self, predicted_values: np.ndarray, features: List[str]
+    ) -> Dict[str, np.ndarray]:
+        """Returns the columns of `features` in `predicted_values`, by feature name"""
+        return {feature: predicted_values[:, self.features.index(feature)] for feature in features}
+
+    def predict_values(
+        self, predicted_values: np.ndarray, variables: Optional[List[str]] = None
+    ) -> np.ndarray:
+        """Returns the points each alliance is predicted to score from `variables` (defaults to
+        every feature)"""
+        total = np.zeros(len(predicted_values))
+        for column, feature in enumerate(self.features):
+            if not variables or feature in variables:
+                total = total + self.point_values[column] * predicted_values[:, column]
+        return total
+
+    def calc_barge_rps(self, predicted_values: np.ndarray) -> np.ndarray:
+        """Returns the predicted barge RP of each alliance"""
+        columns = self.get_columns(
+            predicted_values, ["endgame_deep", "endgame_shallow", "endgame_park"]
+        )
+        return (
+            12 * columns["endgame_deep"]
+            + 6 * columns["endgame_shallow"]
+            + 2 * columns["endgame_park"]
+            >= 14
+        ).astype(int)
+
+    def calc_coral_rps(self, predicted_values: np.ndarray) -> np.ndarray:
+        """Returns the predicted coral RP of each alliance"""
+        total = np.zeros(len(predicted_values))
+        for column in self.get_columns(
+            predicted_values, [feature for feature in self.features if "coral" in feature]
+        ).values():
+            total = total + column
+        return (total >= 25).astype(int)
+
+    def calc_auto_rps(self, predicted_values: np.ndarray) -> np.ndarray:
+        """Returns the predicted auto RP of each alliance"""
+        columns = self.get_columns(
+            predicted_values,
+            ["auto_leave", "auto_coral_L1", "auto_coral_L2", "auto_coral_L3", "auto_coral_L4"],
+        )
+        auto_coral = np.zeros(len(predicted_values))
+        for level in range(1, 5):
+            auto_coral = auto_coral + columns[f"auto_coral_L{level}"]
+        return ((columns["auto_leave"] >= 2.5) & (auto_coral >= 1)).astype(float)
+
+    def calc_win_chances(
+        self, red_alliances: List[List[str]], blue_alliances: List[List[str]]
+    ) -> List[float]:
+        """Returns the chance of each red alliance beating the blue alliance at the same index"""
+        for team in sorted(
+            {team for alliance in red_alliances + blue_alliances for team in alliance}
+        ):
+            if team not in self.rows and team in self.played_teams:
+                log.critical(f"no obj_team data for team {team}, cannot calculate win chance")
+        red_rows = self.get_rows(red_alliances)
+        blue_rows = self.get_rows(blue_alliances)
+        means = self.sum_rows(self.means, red_rows) - self.sum_rows(self.means, blue_rows)
+        variances = self.sum_rows(self.variances, red_rows) + self.sum_rows(
+            self.variances, blue_rows
+        )
+        win_chances = []
+        # P(R - B) > 0 => 1 - phi(0)
+        for mean, var in zip(means.tolist(), variances.tolist()):
+            if var > 0:
+                win_chances.append(round(1 - Norm(mean, var**0.5).cdf(0), 3))
+            else:
+                win_chances.append(1 if mean > 0 else 0)
+        return win_chances
+
+
 class PredictedAimCalc(BaseCalculations):
     schema = utils.read_schema("schema/calc_predicted_aim_schema.yml")
 
@@ -63,6 +280,17 @@ class PredictedAimCalc(BaseCalculations):
         self.watched_collections = ["obj_team", "tba_team"]
         self.played_teams = []
 
+    def get_feature_matrix(self, obj_team, tba_team) -> TeamFeatureMatrix:
+        """Creates the feature matrix used to predict any alliance from obj_team and tba_team"""
+        return TeamFeatureMatrix(
+            obj_team,
+            tba_team,
+            list(self.PREDICTED_VALUES.keys()),
+            self.POINT_VALUES,
+            self.schema["--win_chance"],
+            self.played_teams,
+        )
+
     def calc_predicted_values(self, obj_team_data, tba_team_data, team_numbers):
         """Calculates the predicted_values dataclass for an alliance.
 
@@ -217,7 +445,9 @@ class PredictedAimCalc(BaseCalculations):
         """Pulls actual AIM data from TBA if it exists.
         Otherwise, returns dictionary with all values of 0 and has_tba_data of False.
 
-        aim is the alliance in match to pull actual data for."""
+        aim is the alliance in match to pull actual data for.
+
+        tba_match_data is either the list of TBA matches or a `MatchIndex`."""
         actual_match_dict = {
             "actual_score": 0,
             "actual_barge_rp": 0.0,
@@ -227,6 +457,9 @@ class PredictedAimCalc(BaseCalculations):
         }
         match_number = aim["match_number"]
 
+        if isinstance(tba_match_data, match_index.MatchIndex):
+            tba_match = tba_match_data.get_tba_match(match_number)
+            tba_match_data = [tba_match] if tba_match is not None else []
         for match in tba_match_data:
             # Checks the value of winning_alliance to determine if the match has data.
             # If there is no data for the match, winning_alliance is an empty string.
@@ -366,7 +599,6 @@ class PredictedAimCalc(BaseCalculations):
         updates = []
         obj_team = self.server.local_db.find("obj_team")
         tba_team = self.server.local_db.find("tba_team")
-        tba_match_data = tba_communicator.tba_request(f"event/{self.server.TBA_EVENT_KEY}/matches")
         dn_predictions = []
         if self.server.has_internet:
             dn_matches = []
@@ -395,187 +627,129 @@ class PredictedAimCalc(BaseCalculations):
             except Exception as err:
                 log.error(f"Failed to run DoozerNet model: {err}")
         else:
-            tba_match_data = []
             self.server.dn_model = None
+        # Look up obj_tims and TBA matches by match number instead of scanning them for every aim
+        index = self.server.get_match_index()
         filtered_aims_list = self.filter_aims_list(obj_team, tba_team, aims_list)
+        aims_by_match = {}
+        for some_aim in filtered_aims_list:
+            aims_by_match.setdefault(some_aim["match_number"], []).append(some_aim)
 
-        finished_matches = []
-        # Update every aim
+        # Pair every aim with the opposing alliance
+        matchups = []
+        finished_matches = set()
         for aim in filtered_aims_list:
-            if aim["match_number"] not in finished_matches:
-                # Find opposing alliance
-                other_aim = list(
-                    filter(
-                        lambda some_aim: some_aim["match_number"] == aim["match_number"]
-                        and some_aim != aim,
-                        filtered_aims_list,
-                    )
-                )
-                if other_aim:
-                    other_aim = other_aim[0]
-                else:
-                    log.critical(
-                        f"predicted_aim: alliance {aim['team_list']} has no opposing alliance in match {aim['match_number']}"
-                    )
-                    continue
-
-                # Create updates
-                update = {
-                    "match_number": aim["match_number"],
-                    "alliance_color_is_red": aim["alliance_color"] == "R",
-                }
-                other_update = {
-                    "match_number": other_aim["match_number"],
-                    "alliance_color_is_red": other_aim["alliance_color"] == "R",
-                }
-
-                # Add variables that indicate if data exists for the match
-                num_tim_docs = len(
-                    list(
-                        filter(
-                            lambda doc: doc["team_number"] in aim["team_list"]
-                            and doc["match_number"] == aim["match_number"],
-                            self.server.local_db.find("obj_tim"),
-                        )
-                    )
-                )
-                update["has_tim_data"] = num_tim_docs >= 1
-                update["full_tim_data"] = num_tim_docs == 3
-                update["has_tba_data"] = (
-                    len(
-                        list(
-                            filter(
-                                lambda tba_doc: "qm" in tba_doc["key"]
-                                and tba_doc["match_number"] == aim["match_number"],
-                                tba_match_data,
-                            )
-                        )
-                    )
-                    == 1
-                )
-
-                num_tim_docs = len(
-                    list(filter(lambda doc: doc["team_number"] in other_aim["team_list"], obj_team))
-                )
-                other_update["has_tim_data"] = num_tim_docs >= 1
-                other_update["full_tim_data"] = num_tim_docs == 3
-                other_update["has_tba_data"] = (
-                    len(
-                        list(
-                            filter(
-                                lambda tba_doc: "qm" in tba_doc["key"]
-                                and tba_doc["match_number"] == other_aim["match_number"],
-                                tba_match_data,
-                            )
-                        )
-                    )
-                    == 1
-                )
-
-                # Calculate predicted values data classes
-                aim_predicted_values = self.calc_predicted_values(
-                    obj_team, tba_team, aim["team_list"]
-                )
-                other_aim_predicted_values = self.calc_predicted_values(
-                    obj_team, tba_team, other_aim["team_list"]
+            if aim["match_number"] in finished_matches:
+                continue
+            other_aim = [
+                some_aim for some_aim in aims_by_match[aim["match_number"]] if some_aim != aim
+            ]
+            if not other_aim:
+                log.critical(
+                    f"predicted_aim: alliance {aim['team_list']} has no opposing alliance in match {aim['match_number']}"
                 )
+                continue
+            matchups.append((aim, other_aim[0]))
+            finished_matches.add(aim["match_number"])
+
+        # Predict every alliance at once, each matchup is two rows: the aim, then the other aim
+        matrix = self.get_feature_matrix(obj_team, tba_team)
+        predicted_values = matrix.calc_predicted_values(
+            [alliance["team_list"] for matchup in matchups for alliance in matchup]
+        )
+        predicted_scores = {"predicted_score": matrix.predict_values(predicted_values)}
+        for phase in ["auto", "tele", "endgame"]:
+            predicted_scores[f"predicted_{phase}_score"] = matrix.predict_values(
+                predicted_values, [key for key in self.PREDICTED_VALUES.keys() if phase in key]
+            )
+        predicted_rps = {
+            "predicted_barge_rp": matrix.calc_barge_rps(predicted_values),
+            "predicted_coral_rp": matrix.calc_coral_rps(predicted_values),
+            "predicted_auto_rp": matrix.calc_auto_rps(predicted_values),
+        }
+        red_win_chances = matrix.calc_win_chances(
+            [
+                (aim if aim["alliance_color"] == "R" else other_aim)["team_list"]
+                for aim, other_aim in matchups
+            ],
+            [
+                (other_aim if aim["alliance_color"] == "R" else aim)["team_list"]
+                for aim, other_aim in matchups
+            ],
+        )
+        for matchup_num, (aim, other_aim) in enumerate(matchups):
+            # Create updates
+            update = {
+                "match_number": aim["match_number"],
+                "alliance_color_is_red": aim["alliance_color"] == "R",
+            }
+            other_update = {
+                "match_number": other_aim["match_number"],
+                "alliance_color_is_red": other_aim["alliance_color"] == "R",
+            }
+
+            # Add variables that indicate if data exists for the match
+            num_tim_docs = len(index.get_obj_tims(aim["match_number"], aim["team_list"]))
+            update["has_tim_data"] = num_tim_docs >= 1
+            update["full_tim_data"] = num_tim_docs == 3
+            update["has_tba_data"] = index.get_tba_match(aim["match_number"]) is not None
+
+            num_tim_docs = len(
+                index.get_obj_tims(other_aim["match_number"], other_aim["team_list"])
+            )
+            other_update["has_tim_data"] = num_tim_docs >= 1
+            other_update["full_tim_data"] = num_tim_docs == 3
+            other_update["has_tba_data"] = (
+                index.get_tba_match(other_aim["match_number"]) is not None
+            )
 
+            for row, alliance_update in enumerate([update, other_update], start=2 * matchup_num):
                 # Add gamepieces
-                for action, value in aim_predicted_values.items():
-                    update[f"_{action}"] = value
-                for action, value in other_aim_predicted_values.items():
-                    other_update[f"_{action}"] = value
-
-                # Calculate predicted scores
-                update["predicted_score"] = self.predict_value(aim_predicted_values)
-                update["predicted_auto_score"] = self.predict_value(
-                    aim_predicted_values,
-                    list(filter(lambda key: "auto" in key, self.PREDICTED_VALUES.keys())),
-                )
-                update["predicted_tele_score"] = self.predict_value(
-                    aim_predicted_values,
-                    list(filter(lambda key: "tele" in key, self.PREDICTED_VALUES.keys())),
-                )
-                update["predicted_endgame_score"] = self.predict_value(
-                    aim_predicted_values,
-                    list(filter(lambda key: "endgame" in key, self.PREDICTED_VALUES.keys())),
-                )
-
-                # Other alliance
-                other_update["predicted_score"] = self.predict_value(other_aim_predicted_values)
-                other_update["predicted_auto_score"] = self.predict_value(
-                    other_aim_predicted_values,
-                    list(filter(lambda key: "auto" in key, self.PREDICTED_VALUES.keys())),
-                )
-                other_update["predicted_tele_score"] = self.predict_value(
-                    other_aim_predicted_values,
-                    list(filter(lambda key: "tele" in key, self.PREDICTED_VALUES.keys())),
-                )
-                other_update["predicted_endgame_score"] = self.predict_value(
-                    other_aim_predicted_values,
-                    list(filter(lambda key: "endgame" in key, self.PREDICTED_VALUES.keys())),
+                for action, value in zip(matrix.features, predicted_values[row].tolist()):
+                    alliance_update[f"_{action}"] = value
+                # Add predicted scores and RPs
+                for field, values in predicted_scores.items():
+                    alliance_update[field] = values[row].item()
+                for field, values in predicted_rps.items():
+                    alliance_update[field] = values[row].item()
+
+            # Calculate win chance
+            if aim["alliance_color"] == "R":
+                update["win_chance"] = red_win_chances[matchup_num]
+                other_update["win_chance"] = 1 - update["win_chance"]
+            else:
+                other_update["win_chance"] = red_win_chances[matchup_num]
+                update["win_chance"] = 1 - other_update["win_chance"]
+            if dn_predictions:
+                try:
+                    if aim["alliance_color"] == "R":
+                        update["win_chance"] = 1 - dn_predictions[aim["match_number"] - 1]
+                        other_update["win_chance"] = 1 - update["win_chance"]
+                    else:
+                        other_update["win_chance"] = (
+                            1 - dn_predictions[other_aim["match_number"] - 1]
+                        )
+                        update["win_chance"] = 1 - other_update["win_chance"]
+                except Exception as e:
+                    log.error(f"Failed to get DoozerNet prediction: {e}")
+                    dn_predictions = []
+
+            # Calculate actual values
+            update.update(self.get_actual_values(aim, index))
+            other_update.update(self.get_actual_values(other_aim, index))
+
+            # Add aim team list
+            update["team_numbers"] = aim["team_list"]
+            other_update["team_numbers"] = other_aim["team_list"]
+
+            updates.extend([update, other_update])
+            if self.server.dn_model != None:
+                dn_matches.extend(
+                    [
+                        update["team_numbers"] + other_update["team_numbers"],
+                        other_update["team_numbers"] + update["team_numbers"],
+                    ]
                 )
-
-                # Calculate RPs
-                update["predicted_barge_rp"] = self.calc_barge_rp(aim_predicted_values)
-                update["predicted_coral_rp"] = self.calc_coral_rp(aim_predicted_values)
-                update["predicted_auto_rp"] = self.calc_auto_rp(aim_predicted_values)
-                other_update["predicted_barge_rp"] = self.calc_barge_rp(aim_predicted_values)
-                other_update["predicted_coral_rp"] = self.calc_coral_rp(other_aim_predicted_values)
-                other_update["predicted_auto_rp"] = self.calc_auto_rp(other_aim_predicted_values)
-
-                # Calculate win chance
-                if aim["alliance_color"] == "R":
-                    update["win_chance"] = self.calc_win_chance(
-                        obj_team,
-                        {
-                            aim["alliance_color"]: aim["team_list"],
-                            other_aim["alliance_color"]: other_aim["team_list"],
-                        },
-                        aim["match_number"],
-                    )
-                    other_update["win_chance"] = 1 - update["win_chance"]
-                else:
-                    other_update["win_chance"] = self.calc_win_chance(
-                        obj_team,
-                        {
-                            other_aim["alliance_color"]: other_aim["team_list"],
-                            aim["alliance_color"]: aim["team_list"],
-                        },
-                        other_aim["match_number"],
-                    )
-                    update["win_chance"] = 1 - other_update["win_chance"]
-                if dn_predictions:
-                    try:
-                        if aim["alliance_color"] == "R":
-                            update["win_chance"] = 1 - dn_predictions[aim["match_number"] - 1]
-                            other_update["win_chance"] = 1 - update["win_chance"]
-                        else:
-                            other_update["win_chance"] = (
-                                1 - dn_predictions[other_aim["match_number"] - 1]
-                            )
-                            update["win_chance"] = 1 - other_update["win_chance"]
-                    except Exception as e:
-                        log.error(f"Failed to get DoozerNet prediction: {e}")
-                        dn_predictions = []
-
-                # Calculate actual values
-                update.update(self.get_actual_values(aim, tba_match_data))
-                other_update.update(self.get_actual_values(other_aim, tba_match_data))
-
-                # Add aim team list
-                update["team_numbers"] = aim["team_list"]
-                other_update["team_numbers"] = other_aim["team_list"]
-
-                updates.extend([update, other_update])
-                finished_matches.append(aim["match_number"])
-                if self.server.dn_model != None:
-                    dn_matches.extend(
-                        [
-                            update["team_numbers"] + other_update["team_numbers"],
-                            other_update["team_numbers"] + update["team_numbers"],
-                        ]
-                    )
         return updates
 
     def update_playoffs_alliances(self):
@@ -645,10 +819,10 @@ class PredictedAimCalc(BaseCalculations):
                     aims.append(alliance)
                     break
 
-        self.server.local_db.delete_data("predicted_aim")
-        self.server.local_db.delete_data("predicted_alliances")
-        self.server.local_db.insert_documents("predicted_aim", self.update_predicted_aim(aims))
-        self.server.local_db.insert_documents(
+        self.server.local_db.replace_collection_contents(
+            "predicted_aim", self.update_predicted_aim(aims)
+        )
+        self.server.local_db.replace_collection_contents(
             "predicted_alliances", self.update_playoffs_alliances()
         )
 
@@ -1,3 +1,8 @@
+import logging
+from typing import Dict, List
+
+import numpy as np
+
 import tba_communicator
 from calculations.predicted_aim import PredictedAimCalc
 from calculations.base_calculations import BaseCalculations
@@ -5,6 +10,8 @@ from timer import Timer
 import utils
 import override
 
+log = logging.getLogger(__name__)
+
 
 class PredictedElims(BaseCalculations):
     FIRST_ROUND_STRUCTURE = {
@@ -27,15 +34,32 @@ class PredictedElims(BaseCalculations):
         "15": (11, 13),
         "16": (11, 13),
     }
+    # Matches in each round of the bracket, in order
+    ROUNDS = {
+        "round_1": [1, 2, 3, 4],
+        "round_2": [5, 6, 7, 8],
+        "round_3": [9, 10],
+        "round_4": [11, 12],
+        "round_5": [13],
+        "finals": [14, 15, 16],
+    }
+    # Number of times the bracket is simulated to find each alliance's odds
+    NUM_SIMULATIONS = 10000
+    # Seeded so the odds only change when the data does
+    SIMULATION_SEED = 1678
 
     def __init__(self, server):
         super().__init__(server)
         self.watched_collections = ["obj_team"]
         self.predicted_aim_calc = PredictedAimCalc(self.server)
+        self.schema = utils.read_schema("schema/calc_predicted_elims_schema.yml")
+        self.load_data()
+
+    def load_data(self):
+        """Loads the playoff alliances and the team data used to predict them"""
         self.tba_data = self.predicted_aim_calc.get_playoffs_alliances()
         self.obj_team = self.server.local_db.find("obj_team")
         self.tba_team = self.server.local_db.find("tba_team")
-        self.schema = utils.read_schema("schema/calc_predicted_elims_schema.yml")
 
     def predict_first_round(self, tba_match_data):
         matches = {}
@@ -127,10 +151,120 @@ class PredictedElims(BaseCalculations):
             )
         return match_outcomes
 
+    @staticmethod
+    def get_actual_winners(tba_match_data) -> Dict[int, str]:
+        """Returns the winning alliance color ("R" or "B") of every played playoff match, by
+        bracket match number"""
+        actual_winners = {}
+        for match in tba_match_data or []:
+            if match["comp_level"] not in ["sf", "f"] or match["winning_alliance"] not in [
+                "red",
+                "blue",
+            ]:
+                continue
+            if match["comp_level"] == "sf":
+                match_number = int(match["key"].split("_")[1].split("m")[0][2:])
+            else:
+                # Finals are the 14th, 15th, and 16th matches of the bracket
+                match_number = int(match["key"].split("m")[-1]) + 13
+            actual_winners[match_number] = match["winning_alliance"][0].upper()
+        return actual_winners
+
+    def calc_pair_win_chances(self, alliances: List[dict]) -> np.ndarray:
+        """Returns the chance of each alliance (row) beating each other alliance (column) as the
+        red alliance, calculated once so simulations only need to look them up"""
+        feature_matrix = self.predicted_aim_calc.get_feature_matrix(self.obj_team, self.tba_team)
+        red_alliances = [red["picks"] for red in alliances for _ in alliances]
+        blue_alliances = [blue["picks"] for _ in alliances for blue in alliances]
+        return np.array(feature_matrix.calc_win_chances(red_alliances, blue_alliances)).reshape(
+            len(alliances), len(alliances)
+        )
+
+    def simulate_bracket(self, tba_match_data) -> List[dict]:
+        """Simulates the rest of the bracket `NUM_SIMULATIONS` times and returns each alliance's
+        chance of reaching each round without being eliminated, and of winning the event
+
+        Played matches keep their actual winner, unplayed matches are won with the win chance
+        between the two alliances. The finals are won by the first alliance to win 2 matches.
+        """
+        alliances = sorted(self.tba_data, key=lambda alliance: alliance["alliance_num"])
+        if [alliance["alliance_num"] for alliance in alliances] != list(range(1, 9)):
+            log.warning("Not simulating playoffs, playoff alliances 1-8 aren't all known yet")
+            return []
+        pair_win_chances = self.calc_pair_win_chances(alliances)
+        actual_winners = self.get_actual_winners(tba_match_data)
+        rng = np.random.default_rng(self.SIMULATION_SEED)
+        rounds = list(self.ROUNDS.values())
+        round_numbers = {
+            match: round_num for round_num, matches in enumerate(rounds) for match in matches
+        }
+        # Losers of these matches don't play again
+        eliminating_matches = {
+            int(match)
+            for match in self.PLAYOFF_STRUCTURE
+            if -int(match) not in {ref for refs in self.PLAYOFF_STRUCTURE.values() for ref in refs}
+        }
+
+        def play(match, red, blue):
+            """Returns whether red won `match` in each simulation"""
+            if match in actual_winners:
+                return np.full(self.NUM_SIMULATIONS, actual_winners[match] == "R")
+            return rng.random(self.NUM_SIMULATIONS) < pair_win_chances[red, blue]
+
+        # Alliance index (alliance number - 1) of the winner and loser of each match
+        winners, losers = {}, {}
+        # Round each alliance was eliminated in, alliances that are never eliminated won the event
+        eliminated_round = np.full((self.NUM_SIMULATIONS, len(alliances)), len(rounds))
+        simulations = np.arange(self.NUM_SIMULATIONS)
+        for match in range(1, min(self.ROUNDS["finals"])):
+            if str(match) in self.FIRST_ROUND_STRUCTURE:
+                red, blue = [
+                    np.full(self.NUM_SIMULATIONS, alliance_num - 1)
+                    for alliance_num in self.FIRST_ROUND_STRUCTURE[str(match)]
+                ]
+            else:
+                red, blue = [
+                    winners[ref] if ref > 0 else losers[-ref]
+                    for ref in self.PLAYOFF_STRUCTURE[str(match)]
+                ]
+            red_won = play(match, red, blue)
+            winners[match] = np.where(red_won, red, blue)
+            losers[match] = np.where(red_won, blue, red)
+            if match in eliminating_matches:
+                eliminated_round[simulations, losers[match]] = round_numbers[match]
+
+        red, blue = [winners[ref] for ref in self.PLAYOFF_STRUCTURE[str(self.ROUNDS["finals"][0])]]
+        red_finals_wins = sum(play(match, red, blue).astype(int) for match in self.ROUNDS["finals"])
+        champions = np.where(red_finals_wins >= 2, red, blue)
+        eliminated_round[simulations, np.where(red_finals_wins >= 2, blue, red)] = round_numbers[
+            self.ROUNDS["finals"][0]
+        ]
+
+        odds = []
+        for alliance_index, alliance in enumerate(alliances):
+            alliance_odds = {"alliance_num": alliance["alliance_num"], "picks": alliance["picks"]}
+            # Every alliance plays in the first round
+            for round_num, round_name in enumerate(list(self.ROUNDS)[1:], start=1):
+                alliance_odds[f"{round_name}_chance"] = round(
+                    float(np.mean(eliminated_round[:, alliance_index] >= round_num)), 3
+                )
+            alliance_odds["event_win_chance"] = round(
+                float(np.mean(champions == alliance_index)), 3
+            )
+            odds.append(alliance_odds)
+        return odds
+
     def run(self):
         timer = Timer()
+        self.load_data()
         tba_match_data = tba_communicator.tba_request(f"event/{self.server.TBA_EVENT_KEY}/matches")
 
+        elims_odds = self.simulate_bracket(tba_match_data)
+        self.server.local_db.replace_collection_contents("predicted_elims_odds", elims_odds)
+        if not elims_odds:
+            timer.end_timer(__file__)
+            return
+
         predicted_matches = self.predict_first_round(tba_match_data)
         predicted_matches.update(self.predict_future_rounds(predicted_matches, tba_match_data))
 
@@ -139,8 +273,7 @@ class PredictedElims(BaseCalculations):
             predictions["match_number"] = int(match)
             formatted.append(predictions)
 
-        self.server.local_db.delete_data("predicted_elims")
-        self.server.local_db.insert_documents(
+        self.server.local_db.replace_collection_contents(
             "predicted_elims",
             formatted,
         )
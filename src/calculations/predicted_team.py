@@ -1,6 +1,11 @@
 #!/usr/bin/env python3
 """Makes predictive calculations for teams in a competition."""
 
+import collections
+from typing import Dict, List
+
+import numpy as np
+
 import utils
 import tba_communicator
 from calculations.base_calculations import BaseCalculations
@@ -12,6 +17,17 @@ log = logging.getLogger(__name__)
 
 
 class PredictedTeamCalc(BaseCalculations):
+    # Number of times the rest of the qualification matches are simulated to find rank odds
+    NUM_SIMULATIONS = 10000
+    # Most simulations ran at once, limits memory use for large numbers of simulations
+    SIMULATION_BATCH_SIZE = 10000
+    # Seeded so rank odds only change when the data does
+    SIMULATION_SEED = 1678
+    # Teams ranked this high or better at the end of qualifications are alliance captains
+    NUM_CAPTAINS = 8
+    # Percentiles of each team's simulated ranks
+    RANK_PERCENTILES = [10, 50, 90]
+
     def __init__(self, server):
         super().__init__(server)
         self.watched_collections = ["predicted_aim", "obj_team"]
@@ -34,9 +50,10 @@ class PredictedTeamCalc(BaseCalculations):
 
     def calculate_predicted_alliance_rps(self, predicted_aims):
         predicted_alliance_rps = {}
-        match_list = set([aim["match_number"] for aim in predicted_aims])
-        for match in match_list:
-            aims_in_match = [aim for aim in predicted_aims if aim["match_number"] == match]
+        aims_by_match = {}
+        for aim in predicted_aims:
+            aims_by_match.setdefault(aim["match_number"], []).append(aim)
+        for match, aims_in_match in aims_by_match.items():
             # set match to empty dict to avoid key error
             predicted_alliance_rps[match] = {}
             if len(aims_in_match) < 2:
@@ -87,6 +104,115 @@ class PredictedTeamCalc(BaseCalculations):
 
         return predicted_alliance_rps
 
+    def calculate_unplayed_matches(self, predicted_aims: List[dict]) -> Dict[int, dict]:
+        """Returns the RPs each alliance is predicted to get without winning, and the red
+        alliance's win chance, for every match without TBA data
+
+        Matches are only included if both alliances have predicted_aim data. If a predicted_aim
+        has no win chance, the alliance with the higher predicted score is assumed to win.
+        """
+        aims_by_match = {}
+        for aim in predicted_aims:
+            aims_by_match.setdefault(aim["match_number"], {})[
+                "R" if aim["alliance_color_is_red"] else "B"
+            ] = aim
+        unplayed_matches = {}
+        for match, aims in aims_by_match.items():
+            if len(aims) < 2 or aims["R"]["has_tba_data"]:
+                continue
+            if "win_chance" in aims["R"]:
+                red_win_chance = aims["R"]["win_chance"]
+            elif aims["R"]["predicted_score"] == aims["B"]["predicted_score"]:
+                red_win_chance = 0.5
+            else:
+                red_win_chance = float(aims["R"]["predicted_score"] > aims["B"]["predicted_score"])
+            unplayed_matches[match] = {
+                color: aim["predicted_barge_rp"] + aim["predicted_coral_rp"]
+                for color, aim in aims.items()
+            }
+            unplayed_matches[match]["red_win_chance"] = red_win_chance
+        return unplayed_matches
+
+    def simulate_ranks(
+        self,
+        teams: List[str],
+        aim_list: List[dict],
+        predicted_aims: List[dict],
+        predicted_alliance_rps: Dict[int, dict],
+    ) -> Dict[str, dict]:
+        """Simulates the rest of the qualification matches `NUM_SIMULATIONS` times and returns
+        the odds of each team finishing at each rank
+
+        Played matches use their actual RPs. Every unplayed match is won by red with the red
+        alliance's win chance, and alliances get their predicted barge and coral RPs. Teams are
+        ranked by average RPs, with ties broken randomly.
+        """
+        num_teams = len(teams)
+        if num_teams == 0:
+            return {}
+        team_rows = {team: row for row, team in enumerate(teams)}
+        unplayed_matches = self.calculate_unplayed_matches(predicted_aims)
+        columns = {match: column for column, match in enumerate(sorted(unplayed_matches))}
+
+        # RPs each team gets no matter who wins, and the RPs for winning each unplayed match
+        fixed_rps = np.zeros(num_teams)
+        win_rps = {color: np.zeros((len(columns), num_teams)) for color in ["R", "B"]}
+        num_scheduled_matches = np.zeros(num_teams)
+        for aim in aim_list:
+            match, color = aim["match_number"], aim["alliance_color"]
+            for team in aim["team_list"]:
+                if team not in team_rows:
+                    continue
+                row = team_rows[team]
+                num_scheduled_matches[row] += 1
+                if match in columns:
+                    fixed_rps[row] += unplayed_matches[match][color]
+                    win_rps[color][columns[match], row] += 2
+                else:
+                    fixed_rps[row] += predicted_alliance_rps.get(match, {}).get(color, 0)
+        num_scheduled_matches[num_scheduled_matches == 0] = 1
+        red_win_chances = np.array(
+            [unplayed_matches[match]["red_win_chance"] for match in sorted(unplayed_matches)]
+        )
+
+        rng = np.random.default_rng(self.SIMULATION_SEED)
+        # Number of simulations each team (row) finished at each rank (column)
+        rank_counts = np.zeros((num_teams, num_teams), dtype=int)
+        for start in range(0, self.NUM_SIMULATIONS, self.SIMULATION_BATCH_SIZE):
+            num_simulations = min(self.SIMULATION_BATCH_SIZE, self.NUM_SIMULATIONS - start)
+            red_wins = (rng.random((num_simulations, len(columns))) < red_win_chances).astype(float)
+            avg_rps = (
+                fixed_rps + red_wins @ win_rps["R"] + (1 - red_wins) @ win_rps["B"]
+            ) / num_scheduled_matches
+            # Sorts by average RPs (highest first), then by a random tiebreaker
+            order = np.lexsort((rng.random(avg_rps.shape), -avg_rps), axis=1)
+            ranks = np.empty_like(order)
+            np.put_along_axis(ranks, order, np.arange(num_teams), axis=1)
+            rank_counts += np.bincount(
+                (np.arange(num_teams) * num_teams + ranks).ravel(), minlength=num_teams**2
+            ).reshape(num_teams, num_teams)
+
+        rank_odds = {}
+        cumulative_counts = np.cumsum(rank_counts, axis=1)
+        for team, row in team_rows.items():
+            probabilities = rank_counts[row] / self.NUM_SIMULATIONS
+            rank_odds[team] = {
+                "mean_simulated_rank": round(float(probabilities @ np.arange(1, num_teams + 1)), 3),
+                "first_seed_chance": round(float(probabilities[0]), 3),
+                "captain_chance": round(float(probabilities[: self.NUM_CAPTAINS].sum()), 3),
+            }
+            for percentile in self.RANK_PERCENTILES:
+                rank_odds[team][f"simulated_rank_p{percentile}"] = (
+                    int(
+                        np.searchsorted(
+                            cumulative_counts[row],
+                            np.ceil(percentile / 100 * self.NUM_SIMULATIONS),
+                        )
+                    )
+                    + 1
+                )
+        return rank_odds
+
     def calculate_predicted_team_rps(self, team_number, aim_list, predicted_alliance_rps):
         predicted_rps = 0
         for aim in aim_list:
@@ -108,12 +234,12 @@ class PredictedTeamCalc(BaseCalculations):
         # stores teams that have finished all their scheduled matches. stores the team and their finishing
         # rank. like {1678: 2}
         finished_teams = {}
+        num_scheduled_matches = collections.Counter(
+            team for aim in aim_list for team in aim["team_list"]
+        )
         for team in predicted_rps.keys():
             current_team_data = self.calculate_current_values(ranking_data, team)
-            scheduled_matches = 0
-            for aim in aim_list:
-                if team in aim["team_list"]:
-                    scheduled_matches += 1
+            scheduled_matches = num_scheduled_matches[team]
             if scheduled_matches > 0:
                 predicted_rps[team] = predicted_rps[team] / scheduled_matches
             else:
@@ -146,22 +272,31 @@ class PredictedTeamCalc(BaseCalculations):
         predicted_alliance_rps = self.calculate_predicted_alliance_rps(predicted_aim)
         teams = self.get_teams_list()
         aim_list = self.get_aim_list()
+        team_aims = collections.defaultdict(list)
+        for aim in aim_list:
+            for team in aim["team_list"]:
+                team_aims[team].append(aim)
+        grouped_obj_teams = self.server.local_db.group_by("obj_team", ("team_number",))
         for team in teams:
             update = {"team_number": team}
             current_values = self.calculate_current_values(ranking_data, team)
             if current_values:
                 update.update(current_values)
 
+            # Only the team's own aims can add to its RPs
             predicted_rps = self.calculate_predicted_team_rps(
-                team, aim_list, predicted_alliance_rps
+                team, team_aims[team], predicted_alliance_rps
             )
             update["predicted_rps"] = predicted_rps
-            team_obj_team = self.server.local_db.find("obj_team", {"team_number": team})
+            team_obj_team = grouped_obj_teams.get((team,), [])
             if len(team_obj_team) != 0:
                 update["predicted_score"] = team_obj_team[0]["avg_total_points"]
             else:
                 update["predicted_score"] = None
             updates.append(update)
+        rank_odds = self.simulate_ranks(teams, aim_list, predicted_aim, predicted_alliance_rps)
+        for update in updates:
+            update.update(rank_odds[update["team_number"]])
         final_updates = self.calculate_predicted_ranks(updates, aim_list, ranking_data)
 
         return final_updates
@@ -169,9 +304,8 @@ class PredictedTeamCalc(BaseCalculations):
     def run(self):
         timer = Timer()
 
-        self.server.local_db.delete_data("predicted_team")
         predicted_aim = self.server.local_db.find("predicted_aim")
-        self.server.local_db.insert_documents(
+        self.server.local_db.replace_collection_contents(
             "predicted_team", self.update_predicted_team(predicted_aim)
         )
 
@@ -2,6 +2,7 @@
 
 import adb_communicator
 import calculations.base_calculations
+import qr_ingest
 import utils
 from ulid import ULID
 import logging
@@ -18,39 +19,37 @@ class QRInput(calculations.base_calculations.BaseCalculations):
         self.schema = utils.read_schema("schema/match_collection_qr_schema.yml")
 
     def upload_qr_codes(self, qr_codes):
-        # Acquires current qr data
-        qr_data = [qr_code["data"] for qr_code in self.server.local_db.find("raw_qr")]
+        """Uploads the valid QR codes in 'qr_codes' that aren't already in raw_qr
+
+        Duplicates are skipped by the unique index on raw_qr data, so raw_qr isn't read.
+        """
         qr = set()
-        duplicate_count = 0
 
         for qr_code in qr_codes:
-            # Check for duplicate QR codes
-            if qr_code in qr_data:
-                duplicate_count += 1
-                continue
             # Checks to make sure the qr is valid by checking its starting character
-            elif qr_code.startswith(
+            if qr_code.startswith(
                 self.schema["subjective_aim"]["_start_character"]
             ) or qr_code.startswith(self.schema["objective_tim"]["_start_character"]):
                 qr.add(qr_code)
             else:
                 log.warning(f'Invalid QR code not uploaded: "{qr_code}"')
-        if duplicate_count > 0:
-            log.warning(f"{duplicate_count} duplicate QR codes not uploaded.")
 
-        if qr != set():
-            qr = [
-                {
-                    "data": qr_code,
-                    "blocklisted": False,
-                    "override": {},
-                    "ulid": str(ULID()),
-                    "readable_time": str(ULID().datetime),
-                }
-                for qr_code in qr
-            ]
-            self.server.local_db.insert_documents("raw_qr", qr)
-        return qr
+        if qr == set():
+            return []
+        qr = [
+            {
+                "data": qr_code,
+                "blocklisted": False,
+                "override": {},
+                "ulid": str(ULID()),
+                "readable_time": str(ULID().datetime),
+            }
+            for qr_code in qr
+        ]
+        uploaded = self.server.local_db.insert_unique_documents("raw_qr", qr)
+        if (duplicate_count := len(qr) - len(uploaded)) > 0:
+            log.warning(f"{duplicate_count} duplicate QR codes not uploaded.")
+        return uploaded
 
     def run(self, test_input=None):
         """Grabs QR codes from user using stdin.read(), each qr is separated by a newline"""
@@ -63,6 +62,9 @@ class QRInput(calculations.base_calculations.BaseCalculations):
         if test_input:
             qr_codes = test_input
             uploaded_qrs = self.upload_qr_codes(qr_codes)
+        # QRs are uploaded as they are scanned by qr_ingest.py, don't wait for them here
+        elif qr_ingest.is_running():
+            log.info("QR ingest is running, skipping QR input")
         else:
             cleaned_qr_codes = []
             utils.print("ENTER DATA: ")
@@ -72,10 +74,7 @@ class QRInput(calculations.base_calculations.BaseCalculations):
             for qr in qr_codes.strip().split("\n"):
                 if not qr:
                     continue
-                qr = qr.upper()
-                if qr[0] == "Q":
-                    qr = qr[1:]
-                cleaned_qr_codes.append(qr)
+                cleaned_qr_codes.append(qr_ingest.clean_qr_code(qr))
 
             # THIS CODE IS HERE IN CASE CTRL+D BREAKS
             # qr_codes = []
@@ -100,8 +100,7 @@ class ScoutPrecisionCalc(BaseCalculations):
 
         scouts = set(map(lambda doc: doc["scout_name"], self.server.local_db.find("sim_precision")))
 
-        self.server.local_db.delete_data("scout_precision")
-        self.server.local_db.insert_documents(
+        self.server.local_db.replace_collection_contents(
             "scout_precision", self.update_scout_precision_calcs(scouts)
         )
 
@@ -4,7 +4,7 @@ from calculations.base_calculations import BaseCalculations
 import tba_communicator
 import utils
 import logging
-from typing import List, Dict, Union
+from typing import List, Dict, Optional, Union
 import numpy as np
 from timer import Timer
 import override
@@ -18,8 +18,33 @@ class SimPrecisionCalc(BaseCalculations):
         self.watched_collections = ["unconsolidated_totals"]
         self.sim_schema = utils.read_schema("schema/calc_sim_precision_schema.yml")
 
+    def get_grouped_data(self) -> Dict[str, Dict[tuple, List[dict]]]:
+        """Loads the documents needed to score scouts, grouped the way they are looked up.
+
+        Returns a dictionary with `unconsolidated_totals` grouped by (match_number, scout_name),
+        `alliances` (unconsolidated_totals grouped by (match_number, alliance_color_is_red)), and
+        `auto_pim` grouped by (match_number, team_number)."""
+        unconsolidated_totals = self.server.local_db.group_by(
+            "unconsolidated_totals", ("match_number", "scout_name")
+        )
+        alliances = {}
+        for documents in unconsolidated_totals.values():
+            for document in documents:
+                alliances.setdefault(
+                    (document["match_number"], document["alliance_color_is_red"]), []
+                ).append(document)
+        return {
+            "unconsolidated_totals": unconsolidated_totals,
+            "alliances": alliances,
+            "auto_pim": self.server.local_db.group_by("auto_pim", ("match_number", "team_number")),
+        }
+
     def get_scout_tim_score(
-        self, scout: str, match_number: int, required: Dict[str, Dict[str, Union[int, List[str]]]]
+        self,
+        scout: str,
+        match_number: int,
+        required: Dict[str, Dict[str, Union[int, List[str]]]],
+        grouped_data: Optional[Dict[str, Dict[tuple, List[dict]]]] = None,
     ) -> Union[int, None]:
         """Gets the score for a team in a match reported by a scout.
 
@@ -29,20 +54,22 @@ class SimPrecisionCalc(BaseCalculations):
 
         `required`: dictionary of required datapoints `{weight: value, calculation: [calculations]}` from schema
 
+        `grouped_data`: output from `get_grouped_data()`, loaded from the database if not given
+
         Returns the sum of the scout's reported scoring actions in that match.
         """
+        if grouped_data is None:
+            grouped_data = self.get_grouped_data()
         scout_data = {"unconsolidated_totals": [], "auto_pim": []}
-        scout_data["unconsolidated_totals"] = self.server.local_db.find(
-            "unconsolidated_totals", {"match_number": match_number, "scout_name": scout}
+        scout_data["unconsolidated_totals"] = grouped_data["unconsolidated_totals"].get(
+            (match_number, scout), []
         )
         if not scout_data["unconsolidated_totals"]:
             log.warning(f"No data from Scout {scout} in Match {match_number}")
             return
         scout_data["unconsolidated_totals"] = scout_data["unconsolidated_totals"][0]
         team_num = scout_data["unconsolidated_totals"]["team_number"]
-        scout_data["auto_pim"] = self.server.local_db.find(
-            "auto_pim", {"match_number": match_number, "team_number": team_num}
-        )[0]
+        scout_data["auto_pim"] = grouped_data["auto_pim"].get((match_number, team_num), [])[0]
 
         total_score = 0
         for datapoint, weight in required.items():
@@ -56,6 +83,7 @@ class SimPrecisionCalc(BaseCalculations):
         match_number: int,
         alliance_color_is_red: bool,
         required: Dict[str, Dict[str, Union[int, List[str]]]],
+        grouped_data: Optional[Dict[str, Dict[tuple, List[dict]]]] = None,
     ) -> Dict[str, Dict[str, int]]:
         """Gets the individual TIM scores reported by each scout for an alliance in a match. Basically, combines the output from `get_scout_tim_score`, compiling all scouts in one alliance.
 
@@ -65,23 +93,21 @@ class SimPrecisionCalc(BaseCalculations):
 
         `required`: dictionary of required datapoints `{weight: value, calculation: [calculations]}` from schema.
 
+        `grouped_data`: output from `get_grouped_data()`, loaded from the database if not given
+
         Returns a dictionary where keys are team numbers and values are dictionaries of {<scout name>: <tim score>}.
         """
+        if grouped_data is None:
+            grouped_data = self.get_grouped_data()
         scores_per_team = {}
-        scout_data = self.server.local_db.find(
-            "unconsolidated_totals",
-            {
-                "match_number": match_number,
-                "alliance_color_is_red": alliance_color_is_red,
-            },
-        )
+        scout_data = grouped_data["alliances"].get((match_number, alliance_color_is_red), [])
         teams = set([document["team_number"] for document in scout_data])
         # Populate dictionary with teams in alliance
         for team in teams:
             scores_per_team[team] = {}
         for document in scout_data:
             scout_tim_score = self.get_scout_tim_score(
-                document["scout_name"], match_number, required
+                document["scout_name"], match_number, required, grouped_data
             )
             scores_per_team[document["team_number"]].update(
                 {document["scout_name"]: scout_tim_score}
@@ -197,6 +223,7 @@ class SimPrecisionCalc(BaseCalculations):
             + [0]
         )
         updates = []
+        grouped_data = self.get_grouped_data()
 
         # Create dicts for shared data between scouts
         aim_match_errors = {}
@@ -224,10 +251,10 @@ class SimPrecisionCalc(BaseCalculations):
 
                 # Get the scores of all scouts in a match
                 red_aim_scouts_reported_values = self.get_aim_scout_scores(
-                    match_number, True, required
+                    match_number, True, required, grouped_data
                 )
                 blue_aim_scouts_reported_values = self.get_aim_scout_scores(
-                    match_number, False, required
+                    match_number, False, required, grouped_data
                 )
 
                 # Get the average errors of all scouts in a match
@@ -252,7 +279,9 @@ class SimPrecisionCalc(BaseCalculations):
                 }
 
         for sim in unconsolidated_sims:
-            sim_data = self.server.local_db.find("unconsolidated_totals", sim)[0]
+            sim_data = grouped_data["unconsolidated_totals"][
+                (sim["match_number"], sim["scout_name"])
+            ][0]
             if sim_data["match_number"] > latest_tba_match:
                 continue
             update = {
@@ -315,8 +344,7 @@ class SimPrecisionCalc(BaseCalculations):
                 }
             )
 
-        self.server.local_db.delete_data("sim_precision")
-        self.server.local_db.insert_documents(
+        self.server.local_db.replace_collection_contents(
             "sim_precision", self.update_sim_precision_calcs(sims)
         )
 
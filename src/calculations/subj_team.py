@@ -4,7 +4,7 @@
 import utils
 import logging
 from calculations import base_calculations
-from typing import Dict, List
+from typing import Dict, List, Optional
 from timer import Timer
 import override
 
@@ -22,29 +22,46 @@ class SubjTeamCalcs(base_calculations.BaseCalculations):
         self.watched_collections = ["subj_tim"]
         self.teams_that_have_competed = set()
 
-    def teams_played_with(self, team: str) -> List[str]:
+    def teams_played_with(
+        self, team: str, grouped_subj_tims: Optional[Dict[tuple, List[dict]]] = None
+    ) -> List[str]:
         """Returns a list of teams that the given team has played with so far, including themselves
-        and including repeats"""
+        and including repeats
+
+        `grouped_subj_tims`: subj_tims grouped by (match_number, alliance_color_is_red), loaded
+        from the database if not given
+        """
+        if grouped_subj_tims is None:
+            grouped_subj_tims = self.server.local_db.group_by(
+                "subj_tim", ("match_number", "alliance_color_is_red")
+            )
         partners = []
         # matches_played is a dictionary where keys are match numbers and values represent alliance color
         matches_played = {}
-        for tim in self.server.local_db.find("subj_tim", {"team_number": team}):
-            matches_played.update({tim["match_number"]: tim["alliance_color_is_red"]})
+        for (match_num, alliance_color), tims in grouped_subj_tims.items():
+            if any(tim["team_number"] == team for tim in tims):
+                matches_played.update({match_num: alliance_color})
         for match_num, alliance_color in matches_played.items():
             # Find subj_tim data for robots in the same match and alliance as the team
-            alliance_data = self.server.local_db.find(
-                "subj_tim", {"match_number": match_num, "alliance_color_is_red": alliance_color}
-            )
+            alliance_data = grouped_subj_tims[(match_num, alliance_color)]
             partners.extend([tim["team_number"] for tim in alliance_data])
         return partners
 
-    def unadjusted_ability_calcs(self, team: str) -> Dict[str, float]:
+    def unadjusted_ability_calcs(
+        self, team: str, grouped_tims: Optional[Dict[str, Dict[tuple, List[dict]]]] = None
+    ) -> Dict[str, float]:
         """Retrieves subjective AIM info for the given team and returns a dictionary with
-        calculations for that team"""
+        calculations for that team
+
+        `grouped_tims`: TIM collections grouped by team number (see `get_grouped_tims`), loaded
+        from the database if not given
+        """
+        if grouped_tims is None:
+            grouped_tims = self.get_grouped_tims()
         calculations = {}
         # self.SCHEMA['data'] tells us which fields we need to put in the database that don't
         # require calculations
-        subj_tims = self.server.local_db.find("subj_tim", {"team_number": team})
+        subj_tims = grouped_tims["subj_tim"].get((team,), [])
 
         for data_field in self.SCHEMA["data"].keys():
             vals = []
@@ -75,7 +92,7 @@ class SubjTeamCalcs(base_calculations.BaseCalculations):
             team_rankings = []
             ignore_filter = lambda data: not ("ignore" in calc_info and data in calc_info["ignore"])
             is_list = calc_info["type"] == "List"
-            for tim in self.server.local_db.find(collection_name, {"team_number": team}):
+            for tim in grouped_tims[collection_name].get((team,), []):
                 # If robot died in match, excludes their field awareness and agility scores from that match
                 if tim["died"]:
                     continue
@@ -102,24 +119,52 @@ class SubjTeamCalcs(base_calculations.BaseCalculations):
 
         return calculations
 
-    def adjusted_ability_calcs(self) -> Dict[str, Dict[int, float]]:
+    def get_grouped_tims(self) -> Dict[str, Dict[tuple, List[dict]]]:
+        """Loads the collections used by `unadjusted_ability_calcs` in one query each, grouped by
+        team number"""
+        collection_names = {"subj_tim"}
+        for calc_info in self.SCHEMA["unadjusted_calculations"].values():
+            collection_names.add(calc_info["requires"][0].partition(".")[0])
+        return {
+            collection_name: self.server.local_db.group_by(collection_name, ("team_number",))
+            for collection_name in collection_names
+        }
+
+    def get_subj_teams(self) -> Dict[str, dict]:
+        """Returns the subj_team document of each team in the database, by team number"""
+        return {
+            team: documents[0]
+            for (team,), documents in self.server.local_db.group_by(
+                "subj_team", ("team_number",)
+            ).items()
+        }
+
+    def adjusted_ability_calcs(
+        self, subj_teams: Optional[Dict[str, dict]] = None
+    ) -> Dict[str, Dict[int, float]]:
         """Retrieves subjective AIM data for all teams and recalculates adjusted ability scores
         for each team. Recalculating all of them is necessary because ability scores compensate for
         luck of match schedule, so a team's ability score will depend on the unadjusted
-        scores for all of their alliance partners"""
+        scores for all of their alliance partners
+
+        `subj_teams`: subj_team documents with the unadjusted calculations by team number, loaded
+        from the database if not given
+        """
         # If no teams have competed yet, there is no point in running the calculation
         if len(self.teams_that_have_competed) == 0:
             return {}
+        if subj_teams is None:
+            subj_teams = self.get_subj_teams()
 
         calculations = {}
         for calc_name, calc_info in self.SCHEMA["component_calculations"].items():
-            collection_name, _, unadjusted_calc = calc_info["requires"][0].partition(".")
+            # Requirements are fields of subj_team
+            unadjusted_calc = calc_info["requires"][0].partition(".")[2]
             # scores is a dictionary of team numbers to rank score
             scores = {}
             for team in self.teams_that_have_competed:
-                tim = self.server.local_db.find(collection_name, {"team_number": team})
-                if tim:
-                    scores[team] = tim[0][unadjusted_calc]
+                if team in subj_teams:
+                    scores[team] = subj_teams[team][unadjusted_calc]
             # Now scale the scores so they range from 0 to 1, and use those scaled scores to
             # compensate for alliance partners
             # That way, teams that are always paired with good/bad teams won't have unfair rankings
@@ -162,9 +207,13 @@ class SubjTeamCalcs(base_calculations.BaseCalculations):
             team: (((score - worst) / (best - worst)) if best - worst != 0 else 0)
             for team, score in filtered_scores.items()
         }
+        grouped_subj_tims = self.server.local_db.group_by(
+            "subj_tim", ("match_number", "alliance_color_is_red")
+        )
         for team, score in filtered_scores.items():
             teammate_scaled_scores = [
-                scaled_scores[partner] for partner in self.teams_played_with(team)
+                scaled_scores[partner]
+                for partner in self.teams_played_with(team, grouped_subj_tims)
             ]
             calculations[team] = calculations.get(team, {})
             # If teammates tend to rank low, the team's score is lowered more than if teammates tend to rank high
@@ -175,8 +224,14 @@ class SubjTeamCalcs(base_calculations.BaseCalculations):
             else:
                 calculations[team][calc_name].append(score * self.avg(teammate_scaled_scores))
 
-    def calculate_driver_ability(self):
-        """Takes a weighted average of all the adjusted component scores to calculate overall driver ability."""
+    def calculate_driver_ability(self, subj_teams: Optional[Dict[str, dict]] = None):
+        """Takes a weighted average of all the adjusted component scores to calculate overall driver ability.
+
+        `subj_teams`: subj_team documents with the adjusted calculations by team number, loaded
+        from the database if not given
+        """
+        if subj_teams is None:
+            subj_teams = self.get_subj_teams()
         calculations = {}
         for calc_name, calc_info in self.SCHEMA["averaged_calculations"].items():
             # ability_dict is a dictionary where keys are team numbers
@@ -187,13 +242,10 @@ class SubjTeamCalcs(base_calculations.BaseCalculations):
                 # For example, if they have good agility and average
                 # field awareness, scores might look like [.8, -.3]
                 scores = []
+                # Requirements are fields of subj_team
                 for requirement in calc_info["requires"]:
-                    collection_name, _, score_name = requirement.partition(".")
-                    scores.append(
-                        self.server.local_db.find(collection_name, {"team_number": team})[0][
-                            score_name
-                        ]
-                    )
+                    score_name = requirement.partition(".")[2]
+                    scores.append(subj_teams[team][score_name])
                 # driver_ability is a weighted average of its component scores
                 ability_dict[team] = self.avg(scores, calc_info["weights"])
             # Put the driver abilities of all teams in a list
@@ -216,29 +268,28 @@ class SubjTeamCalcs(base_calculations.BaseCalculations):
 
         # Adjusted calcs have to be re-run on all teams that have competed
         # because team data changing for one team affects all teams that played with that team
-        self.teams_that_have_competed = set()
-        for tim in self.server.local_db.find("subj_tim"):
-            self.teams_that_have_competed.add(tim["team_number"])
-        self.server.local_db.delete_data("subj_team")
+        grouped_tims = self.get_grouped_tims()
+        self.teams_that_have_competed = {team for (team,) in grouped_tims["subj_tim"]}
 
         updated_teams = self.get_teams_list()
-        for team in updated_teams:
-            new_calc = self.unadjusted_ability_calcs(team)
-            self.server.local_db.insert_documents("subj_team", new_calc)
+        subj_teams = {
+            team: self.unadjusted_ability_calcs(team, grouped_tims) for team in updated_teams
+        }
         if len(self.teams_that_have_competed) != 0:
             # Now use the new info to recalculate adjusted ability scores
-            adjusted_calcs = self.adjusted_ability_calcs()
+            adjusted_calcs = self.adjusted_ability_calcs(subj_teams)
             for team in self.teams_that_have_competed:
-                self.server.local_db.update_document(
-                    "subj_team", adjusted_calcs[team], {"team_number": team}
-                )
+                if team in subj_teams:
+                    subj_teams[team].update(adjusted_calcs[team])
 
             # Use the adjusted ability scores to calculate driver ability
-            driver_ability_calcs = self.calculate_driver_ability()
+            driver_ability_calcs = self.calculate_driver_ability(subj_teams)
             for team in self.teams_that_have_competed:
-                self.server.local_db.update_document(
-                    "subj_team", driver_ability_calcs[team], {"team_number": team}
-                )
+                if team in subj_teams:
+                    subj_teams[team].update(driver_ability_calcs[team])
+
+        # Every field is calculated before writing, so each document is only written once
+        self.server.local_db.replace_collection_contents("subj_team", list(subj_teams.values()))
 
         override.apply_override("subj_team")
 
@@ -88,11 +88,15 @@ class TBATeamCalc(base_calculations.BaseCalculations):
         team_names = {str(team["team_number"]): team["nickname"] for team in team_request_output}
 
         tba_team_updates = {}
+        # Load every team's data at once instead of querying the database for each team
+        grouped_obj_tims = self.server.local_db.group_by("obj_tim", ("team_number",))
+        grouped_tba_tims = self.server.local_db.group_by("tba_tim", ("team_number",))
+        grouped_tba_teams = self.server.local_db.group_by("tba_team", ("team_number",))
 
         for team in teams:
             # Load team data from database
-            obj_tims = self.server.local_db.find("obj_tim", {"team_number": team})
-            tba_tims = self.server.local_db.find("tba_tim", {"team_number": team})
+            obj_tims = grouped_obj_tims.get((team,), [])
+            tba_tims = grouped_tba_tims.get((team,), [])
             # Because of database structure, returns as a list
             team_data = self.tim_counts(obj_tims, tba_tims)
             team_data["team_number"] = team
@@ -102,7 +106,9 @@ class TBATeamCalc(base_calculations.BaseCalculations):
             else:
                 # Set team name to "UNKNOWN NAME" if the team is not already in the database
                 # If the team is, it is assumed that the name in the database will be more accurate
-                if not self.server.local_db.find("tba_team", {"team_number": team}):
+                if existing_tba_team := grouped_tba_teams.get((team,)):
+                    team_data["team_name"] = existing_tba_team[0].get("team_name", "UNKNOWN NAME")
+                else:
                     team_data["team_name"] = "UNKNOWN NAME"
                 # Warn that the team is not in the team list for event if there is team data
                 if team_names:
@@ -117,9 +123,8 @@ class TBATeamCalc(base_calculations.BaseCalculations):
         """Executes the TBA Team calculations"""
         timer = Timer()
 
-        # Delete and re-insert
-        self.server.local_db.delete_data("tba_team")
-        self.server.local_db.insert_documents(
+        # Only write the teams that changed
+        self.server.local_db.replace_collection_contents(
             "tba_team", utils.unique_ld(self.update_team_calcs(self.get_teams_list()))
         )
 
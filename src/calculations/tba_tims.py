@@ -132,9 +132,6 @@ class TBATIMCalc(base_calculations.BaseCalculations):
         """Executes the TBA TIM calculations"""
         timer = Timer()
 
-        # Delete and re-insert if updating all data
-        self.server.local_db.delete_data("tba_tim")
-
         new_data = []
         for match in list(
             filter(
@@ -155,7 +152,8 @@ class TBATIMCalc(base_calculations.BaseCalculations):
                 # Add the tim ref to calculated, right after it gets calculated
                 self.calculated.add(match["match_number"])
 
-        self.server.local_db.insert_documents("tba_tim", utils.unique_ld(new_data))
+        # Only write the TIMs that changed
+        self.server.local_db.replace_collection_contents("tba_tim", utils.unique_ld(new_data))
 
         override.apply_override("tba_tims")
 
@@ -1,26 +1,162 @@
 # Copyright (c) 2024 FRC Team 1678: Citrus Circuits
 
 
-import copy
 import utils
 from calculations.base_calculations import BaseCalculations
-from typing import List, Union, Dict
+from typing import Any, Dict, List, Tuple, Union
 import logging
 import tba_communicator
 import json
 from timer import Timer
 import statistics
 import calculations.obj_tims as obj_tims
-import statistics
 import database
 import override
 
 log = logging.getLogger(__name__)
 
 
+class TimelineCounter:
+    """Calculates every `timeline_counts` and `timeline_cycle_time` datapoint in one pass over a
+    TIM timeline
+
+    The schema is compiled once into a table of the counts each action type can add to, so each
+    action is only checked against the counts that filter for its action type instead of every
+    count filtering the whole timeline.
+    """
+
+    def __init__(self, timeline_counts: Dict[str, dict], timeline_cycle_time: Dict[str, dict]):
+        # Expected type of each calculated datapoint
+        self.types = {}
+        # Action type to the counts (name, other filters, time range) that filter for it
+        self.counts_by_action_type: Dict[Any, List[Tuple[str, List[tuple], list]]] = {}
+        # Counts that don't filter by action type, checked against every action
+        self.other_counts: List[Tuple[str, List[tuple], list]] = []
+        for calculation, filters in timeline_counts.items():
+            self.types[calculation] = filters["type"]
+            equal_filters = [
+                (field, value)
+                for field, value in filters.items()
+                if field not in ["type", "action_type", "time"]
+            ]
+            count = (calculation, equal_filters, filters.get("time"))
+            if "action_type" in filters:
+                self.counts_by_action_type.setdefault(filters["action_type"], []).append(count)
+            else:
+                self.other_counts.append(count)
+        self.cycle_times = {}
+        for calculation, action_types in timeline_cycle_time.items():
+            self.types[calculation] = action_types["type"]
+            self.cycle_times[calculation] = action_types
+
+    @staticmethod
+    def matches(action: dict, equal_filters: List[tuple], time_range: list) -> bool:
+        """Returns whether an action meets a count's filters other than the action type"""
+        if time_range is not None and not time_range[0] <= action["time"] <= time_range[1]:
+            return False
+        return all(action[field] == value for field, value in equal_filters)
+
+    def calculate(self, timeline: List[dict]) -> Tuple[Dict[str, int], Dict[str, int]]:
+        """Returns the counts and the cycle times of a timeline"""
+        counts = {
+            calculation: 0 for calculation in self.types if calculation not in self.cycle_times
+        }
+        # Actions or pairs of actions each cycle time uses, collected during the same pass
+        cycle_actions = {calculation: {"start": [], "end": {}} for calculation in self.cycle_times}
+        for action in timeline:
+            for calculation, equal_filters, time_range in self.counts_by_action_type.get(
+                action["action_type"], []
+            ):
+                if self.matches(action, equal_filters, time_range):
+                    counts[calculation] += 1
+            for calculation, equal_filters, time_range in self.other_counts:
+                if self.matches(action, equal_filters, time_range):
+                    counts[calculation] += 1
+            for calculation, action_types in self.cycle_times.items():
+                self.add_cycle_action(action, action_types, cycle_actions[calculation])
+        times = {
+            calculation: self.calculate_cycle_time(action_types, cycle_actions[calculation])
+            for calculation, action_types in self.cycle_times.items()
+        }
+        return counts, times
+
+    @staticmethod
+    def add_cycle_action(action: dict, action_types: dict, cycle_actions: dict) -> None:
+        """Adds an action to the actions a cycle time uses, if it uses it"""
+        start_action = action_types["start_action"]
+        end_action = action_types["end_action"]
+        if "intake" in start_action and start_action != "score":
+            # Pairs of [<start action>, <end action>]
+            pairs = cycle_actions["start"]
+            # Adds each start action to a new pair
+            if action["action_type"] == start_action:
+                pairs.append([action])
+            # If there is an incomplete pair, adds the end action
+            elif pairs and action["action_type"] in end_action and len(pairs[-1]) == 1:
+                pairs[-1].append(action)
+            # If something happens inbetween the start action and the end action, removes the
+            # incomplete pair
+            elif (
+                pairs
+                and action["action_type"] not in ["start_incap", "end_incap", "fail"]
+                and len(pairs[-1]) == 1
+            ):
+                pairs.pop(-1)
+        else:
+            if action["action_type"] == start_action:
+                cycle_actions["start"].append(action)
+            # Takes multiple end actions
+            end_actions = end_action if isinstance(end_action, list) else [end_action]
+            if action["action_type"] in end_actions:
+                cycle_actions["end"].setdefault(action["action_type"], []).append(action)
+
+    @staticmethod
+    def calculate_cycle_time(action_types: dict, cycle_actions: dict) -> int:
+        """Returns a cycle time from the actions collected for it
+
+        Scoring cycle times are the median time between scores, intake cycle times are the median
+        time between an intake and the action ending it, and other times (such as incap) are the
+        total time between each start action and its end action.
+        """
+        start_action = action_types["start_action"]
+        end_action = action_types["end_action"]
+        min_time = action_types["minimum_time"]
+        if start_action == "score":
+            scoring_actions = cycle_actions["start"]
+            # Calculates time difference between every pair of scoring actions
+            cycle_times = [
+                scoring_actions[i - 1]["time"] - scoring_actions[i]["time"]
+                for i in range(1, len(scoring_actions))
+            ]
+        elif "intake" in start_action:
+            cycle_times = []
+            for pair in cycle_actions["start"]:
+                if len(pair) == 2 and pair[0]["time"] - pair[1]["time"] >= min_time:
+                    cycle_times.append(pair[0]["time"] - pair[1]["time"])
+        else:
+            start_actions = cycle_actions["start"]
+            # End actions are in the order of `end_action` if there are multiple
+            end_actions = []
+            for action_type in end_action if isinstance(end_action, list) else [end_action]:
+                end_actions.extend(cycle_actions["end"].get(action_type, []))
+            # Match scout app should automatically add an end action at the end of the match,
+            # if there isn't already an end action after the last start action. That way there
+            # are the same number of start actions and end actions.
+            total_time = 0
+            for start, end in zip(start_actions, end_actions):
+                if start["time"] - end["time"] >= min_time:
+                    total_time += start["time"] - end["time"]
+            return total_time
+        # Cycle time has to be an integer
+        return round(statistics.median(cycle_times)) if cycle_times else 0
+
+
 class UnconsolidatedTotals(BaseCalculations):
     schema = utils.read_schema("schema/calc_obj_tim_schema.yml")
     type_check_dict = {"float": float, "int": int, "str": str, "bool": bool}
+    INCREMENTAL = True
+    # Compiled once so each timeline is only traversed once
+    timeline_counter = TimelineCounter(schema["timeline_counts"], schema["timeline_cycle_time"])
 
     def __init__(self, server):
         super().__init__(server)
@@ -75,107 +211,35 @@ class UnconsolidatedTotals(BaseCalculations):
         such as start_incap and end_climb.
         min_time is the minimum number of seconds between the two types of actions that we want to count
         """
-        # Separate calculation for scoring cycle times
-        if start_action == "score":
-            scoring_actions = self.filter_timeline_actions(tim, action_type=start_action)
-            cycle_times = []
-
-            # Calculates time difference between every pair of scoring actions
-            for i in range(1, len(scoring_actions)):
-                cycle_times.append(scoring_actions[i - 1]["time"] - scoring_actions[i]["time"])
-
-            # Calculate median cycle time (if cycle times is not an empty list)
-            if cycle_times:
-                median_cycle_time = statistics.median(cycle_times)
-            else:
-                median_cycle_time = 0
-
-            # Cycle time has to be an integer
-            return round(median_cycle_time)
-
-        # Intake related cycle times
-        elif "intake" in start_action:
-            start_end_pairs = []
-            cycle_times = []
-
-            # Creates pairs of [<start action>, <end action>]
-            for action in tim["timeline"]:
-                # Adds each start action to a new pair
-                if action["action_type"] == start_action:
-                    start_end_pairs.append([action])
-                # If there is an incomplete pair, adds the end action
-                elif (
-                    len(start_end_pairs) >= 1
-                    and action["action_type"] in end_action
-                    and len(start_end_pairs[-1]) == 1
-                ):
-                    start_end_pairs[-1].append(action)
-                # If something happens inbetween the start action and the end action, removes the incomplete pair
-                elif (
-                    len(start_end_pairs) >= 1
-                    and action["action_type"] not in ["start_incap", "end_incap", "fail"]
-                    and len(start_end_pairs[-1]) == 1
-                ):
-                    start_end_pairs.pop(-1)
-
-            # Finds time between each pair of start action + end action
-            c_pairs = copy.deepcopy(start_end_pairs)
-            for index, pair in enumerate(start_end_pairs):
-                if len(pair) != 2:
-                    c_pairs.pop(index)
-                    continue
-
-                start = pair[0]
-                end = pair[1]
-                time_difference = start["time"] - end["time"]
-                if time_difference >= min_time:
-                    cycle_times.append(time_difference)
-
-            start_end_pairs = c_pairs
-            # Calculate median cycle time (if cycle times is not an empty list)
-            if cycle_times:
-                median_cycle_time = statistics.median(cycle_times)
-            else:
-                median_cycle_time = 0
-
-            # Cycle time has to be an integer
-            return round(median_cycle_time)
-
-        # Other time calculations (incap)
-        else:
-            start_actions = self.filter_timeline_actions(tim, action_type=start_action)
-            end_actions = []
-            # Takes multiple end actions
-            if isinstance(end_action, list):
-                for action in end_action:
-                    end_actions = end_actions + self.filter_timeline_actions(
-                        tim, action_type=action
-                    )
-            else:
-                end_actions = self.filter_timeline_actions(tim, action_type=end_action)
-            # Match scout app should automatically add an end action at the end of the match,
-            # if there isn't already an end action after the last start action. That way there are the
-            # same number of start actions and end actions.
-            total_time = 0
-            for start, end in zip(start_actions, end_actions):
-                if start["time"] - end["time"] >= min_time:
-                    total_time += start["time"] - end["time"]
-            return total_time
+        counter = TimelineCounter(
+            {},
+            {
+                "time": {
+                    "type": "int",
+                    "start_action": start_action,
+                    "end_action": end_action,
+                    "minimum_time": min_time,
+                }
+            },
+        )
+        return counter.calculate(tim["timeline"])[1]["time"]
 
     def calculate_tim_counts(self, unconsolidated_tims: dict) -> dict:
         """Given a list of unconsolidated TIMs, returns the calculated count based data fields"""
         calculated_tim = {}
         self.score_fail_type(unconsolidated_tims)
+        # Count everything in each timeline at once
+        tim_counts = [
+            self.timeline_counter.calculate(tim["timeline"])[0] for tim in unconsolidated_tims
+        ]
         for calculation, filters in self.schema["timeline_counts"].items():
             unconsolidated_counts = []
-            # Variable type of a calculation is in the schema, but it's not a filter
-            filters_ = copy.deepcopy(filters)
-            expected_type = filters_.pop("type")
-            for tim in unconsolidated_tims:
+            expected_type = filters["type"]
+            for tim, counts in zip(unconsolidated_tims, tim_counts):
                 # Override timeline counts at consolidation
                 new_count = 0
                 if calculation not in tim["override"]:  # If no overrides
-                    new_count = self.count_timeline_actions(tim, **filters_)
+                    new_count = counts[calculation]
                 else:
                     for key in list(tim["override"].keys()):
                         if (
@@ -200,9 +264,7 @@ class UnconsolidatedTotals(BaseCalculations):
                                             tim["override"][calculation]
                                         )
                                     # "adding" to the original value
-                                    tim["override"][calculation] += self.count_timeline_actions(
-                                        tim, **filters_
-                                    )
+                                    tim["override"][calculation] += counts[calculation]
                                 elif tim["override"][calculation][0:2] == "-=":
                                     # removing "-=" and setting override[edited_datapoint] to the right type
                                     tim["override"][calculation] = tim["override"][calculation][2:]
@@ -221,9 +283,7 @@ class UnconsolidatedTotals(BaseCalculations):
                                         )
                                     # "subtracting" to the original value
                                     tim["override"][calculation] *= -1
-                                    tim["override"][calculation] += self.count_timeline_actions(
-                                        tim, **filters_
-                                    )
+                                    tim["override"][calculation] += counts[calculation]
                             new_count = tim["override"][calculation]
                 if not isinstance(new_count, self.type_check_dict[expected_type]):
                     raise TypeError(f"Expected {new_count} calculation to be a {expected_type}")
@@ -233,24 +293,17 @@ class UnconsolidatedTotals(BaseCalculations):
             )
         return calculated_tim
 
+    def check_types(self, calculated: Dict[str, Any]) -> None:
+        """Raises a TypeError if a calculated timeline datapoint isn't the type in the schema"""
+        for calculation, value in calculated.items():
+            expected_type = self.timeline_counter.types[calculation]
+            if not isinstance(value, self.type_check_dict[expected_type]):
+                raise TypeError(f"Expected {value} calculation to be a {expected_type}")
+
     def calculate_tim_times(self, unconsolidated_tim: dict) -> dict:
         """Given a list of unconsolidated TIMs, returns the calculated time data fields"""
-        times = {}
-        for calculation, action_types in self.schema["timeline_cycle_time"].items():
-            # Variable type of a calculation is in the schema, but it's not a filter
-            filters_ = copy.deepcopy(action_types)
-            expected_type = filters_.pop("type")
-            # action_types is a list of dictionaries, where each dictionary is
-            # "action_type" to the name of either the start or end action
-            new_cycle_time = self.total_time_between_actions(
-                unconsolidated_tim,
-                action_types["start_action"],
-                action_types["end_action"],
-                action_types["minimum_time"],
-            )
-            if not isinstance(new_cycle_time, self.type_check_dict[expected_type]):
-                raise TypeError(f"Expected {new_cycle_time} calculation to be a {expected_type}")
-            times[calculation] = new_cycle_time
+        times = self.timeline_counter.calculate(unconsolidated_tim["timeline"])[1]
+        self.check_types(times)
         return times
 
     def calculate_expected_fields(self, tim, tim_totals):
@@ -402,43 +455,23 @@ class UnconsolidatedTotals(BaseCalculations):
             tim_totals["scored_preload"] = (
                 tim["has_preload"] and tim["timeline"][0]["action_type"][:10] == "auto_coral"
             )
-            # Calculate unconsolidated tim counts
-            for aggregate, filters in self.schema["aggregates"].items():
-                total_count = 0
-                aggregate_counts = filters["counts"]
-                for calculation, filters in self.schema["timeline_counts"].items():
-                    filters_ = copy.deepcopy(filters)
-                    expected_type = filters_.pop("type")
-                    new_count = self.count_timeline_actions(tim, **filters_)
-                    if not isinstance(new_count, self.type_check_dict[expected_type]):
-                        raise TypeError(f"Expected {new_count} calculation to be a {expected_type}")
-                    tim_totals[calculation] = new_count
-                    # Calculate unconsolidated aggregates
-                    for count in aggregate_counts:
-                        if calculation == count:
-                            total_count += new_count
-                    tim_totals[aggregate] = total_count
-            # New section for obj_tim, unconsolidated_totals needs to iterate through these datapoints as well
-            for aggregate, filters in self.schema["pre_consolidated_aggregates"].items():
-                total_count = 0
-                aggregate_counts = filters["counts"]
-                for calculation, filters in self.schema["timeline_counts"].items():
-                    filters_ = copy.deepcopy(filters)
-                    expected_type = filters_.pop("type")
-                    new_count = self.count_timeline_actions(tim, **filters_)
-                    if not isinstance(new_count, self.type_check_dict[expected_type]):
-                        raise TypeError(f"Expected {new_count} calculation to be a {expected_type}")
-                    tim_totals[calculation] = new_count
-                    # Calculate unconsolidated aggregates
-                    for count in aggregate_counts:
-                        if calculation == count:
-                            total_count += new_count
-                    tim_totals[aggregate] = total_count
+            # Calculate unconsolidated tim counts and times in one pass over the timeline
+            counts, times = self.timeline_counter.calculate(tim["timeline"])
+            self.check_types(counts)
+            self.check_types(times)
+            tim_totals.update(counts)
+            # Calculate unconsolidated aggregates, pre_consolidated_aggregates are also needed by
+            # obj_tim
+            for aggregates in ["aggregates", "pre_consolidated_aggregates"]:
+                for aggregate, filters in self.schema[aggregates].items():
+                    tim_totals[aggregate] = sum(
+                        counts[count] for count in filters["counts"] if count in counts
+                    )
             # Calculate unconsolidated categorical actions
             for category in self.schema["categorical_actions"]:
                 tim_totals[category] = tim[category]
 
-            tim_totals.update(self.calculate_tim_times(tim))
+            tim_totals.update(times)
             tim_totals.update(self.calculate_expected_fields(tim, tim_totals))
             unconsolidated_totals.append(tim_totals)
         return unconsolidated_totals
@@ -447,8 +480,13 @@ class UnconsolidatedTotals(BaseCalculations):
         """Calculate data for each of the given TIMs. Those TIMs are represented as dictionaries:
         {'team_number': '1678', 'match_number': 69}"""
         unconsolidated_totals = []
+        grouped_obj_tims = self.server.local_db.group_by(
+            "unconsolidated_obj_tim", ("team_number", "match_number")
+        )
         for tim in tims:
-            unconsolidated_obj_tims = self.server.local_db.find("unconsolidated_obj_tim", tim)
+            unconsolidated_obj_tims = grouped_obj_tims.get(
+                (tim["team_number"], tim["match_number"]), []
+            )
             # check for overrides
             override = {}
             for t in unconsolidated_obj_tims:
@@ -528,8 +566,12 @@ class UnconsolidatedTotals(BaseCalculations):
             if tim not in unique_tims:
                 unique_tims.append(tim)
 
-        # Delete and re-insert
-        self.server.local_db.delete_data("unconsolidated_totals")
+        # Replace the changed documents, only for TIMs with changed inputs when running incrementally
+        query = {}
+        if (dirty_tims := self.get_dirty_tims()) is not None:
+            unique_tims = [tim for tim in unique_tims if tim in dirty_tims]
+            # An empty dirty list leaves every existing document alone
+            query = {"$or": dirty_tims} if dirty_tims else {"team_number": {"$in": []}}
 
         updates = self.update_calcs(unique_tims)
         filtered = []
@@ -546,7 +588,9 @@ class UnconsolidatedTotals(BaseCalculations):
                     log.error(
                         f"{document['team_number']} not found in match {document['match_number']}"
                     )
-        self.server.local_db.insert_documents("unconsolidated_totals", filtered)
+        self.server.local_db.replace_collection_contents(
+            "unconsolidated_totals", filtered, query=query
+        )
 
         override.apply_override("unconsolidated_totals")
 
@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+
+"""Copies changes made to the local database to the cloud database.
+
+Instead of re-uploading every collection after every server cycle, a change stream on the local
+database is used to only send the documents that were inserted, changed, or deleted. The change
+stream's resume token is saved to `data/<server key>_cloud_sync_token.json` after every successful
+upload, so a restarted server continues where it left off. Documents keep their local `_id` in the
+cloud database so changes can be matched to the cloud copy of a document.
+
+If the changes can't be replayed (e.g. the resume token is too old, or a bulk write is rejected),
+the affected collections are fully re-uploaded.
+
+`CloudSyncWorker` runs the sync in a background thread so calculations never wait on the cloud
+database, backing off when it can't be reached.
+"""
+
+import json
+import logging
+import threading
+import time
+from typing import Any, Dict, List, Optional, Union
+
+import pymongo
+import pymongo.errors
+
+import utils
+
+log = logging.getLogger(__name__)
+
+
+class CloudSync:
+    """Sends changes made to the local database to the cloud database"""
+
+    # Most operations sent to the cloud database in one bulk write
+    BATCH_SIZE = 1000
+    # Most changed documents held in memory, the rest stay in the change stream until these are sent
+    MAX_PENDING = 10000
+    # Operations that change the contents of a collection
+    CHANGE_OPERATIONS = ["insert", "update", "replace", "delete"]
+    # Errors caused by the cloud database being unreachable, the next sync retries the same changes
+    CONNECTION_ERRORS = (pymongo.errors.ConnectionFailure, pymongo.errors.ConfigurationError)
+
+    def __init__(self, local_db, cloud_db, collections: List[str], token_file: str = None):
+        self.local_db = local_db
+        self.cloud_db = cloud_db
+        self.collections = collections
+        if token_file is None:
+            token_file = utils.create_file_path(f"data/{utils.server_key()}_cloud_sync_token.json")
+        self.token_file = token_file
+        self.resume_token = self.load_resume_token()
+        # Without a resume token there is no way to know what the cloud database is missing
+        self.needs_full_sync = set() if self.resume_token is not None else set(collections)
+        self.stream = None
+        # Writes that haven't been sent yet, by collection and then by document `_id`. Only the
+        # latest change to a document is kept
+        self.pending: Dict[str, Dict[Any, Union[pymongo.ReplaceOne, pymongo.DeleteOne]]] = {}
+        # When the oldest change that hasn't been sent was read
+        self.pending_since: Optional[float] = None
+        self.last_success: Optional[float] = None
+        # Held while changing `pending` so the status can be read from other threads
+        self.lock = threading.Lock()
+
+    def load_resume_token(self) -> Optional[dict]:
+        """Returns the resume token saved by the last successful sync, or None"""
+        try:
+            with open(self.token_file) as f:
+                return json.load(f).get("resume_token")
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def save_resume_token(self, resume_token: Optional[dict]) -> None:
+        """Saves the resume token of the last change sent to the cloud database"""
+        self.resume_token = resume_token
+        with open(self.token_file, "w") as f:
+            json.dump({"resume_token": resume_token}, f)
+
+    def open_stream(self):
+        """Opens a change stream on the synced collections, resuming after the saved token
+
+        If the saved token can no longer be resumed from, every collection is fully re-uploaded.
+        """
+        pipeline = [
+            {
+                "$match": {
+                    "ns.coll": {"$in": self.collections},
+                    "operationType": {"$in": self.CHANGE_OPERATIONS},
+                }
+            }
+        ]
+        try:
+            return self.local_db.db.watch(
+                pipeline, full_document="updateLookup", resume_after=self.resume_token
+            )
+        except pymongo.errors.OperationFailure as err:
+            if self.resume_token is None:
+                raise
+            log.error(f"Unable to resume cloud sync, re-uploading every collection: {err}")
+            self.resume_token = None
+            self.needs_full_sync = set(self.collections)
+            return self.local_db.db.watch(pipeline, full_document="updateLookup")
+
+    @staticmethod
+    def create_operation(
+        change: dict,
+    ) -> Union[pymongo.ReplaceOne, pymongo.DeleteOne]:
+        """Creates the cloud database write for a change stream event
+
+        Updates are sent as whole documents since the local version of the document is already
+        known, which also makes replaying a change more than once harmless.
+        """
+        document_filter = {"_id": change["documentKey"]["_id"]}
+        # The document can be deleted before an update to it is looked up
+        if change["operationType"] == "delete" or change.get("fullDocument") is None:
+            return pymongo.DeleteOne(document_filter)
+        return pymongo.ReplaceOne(document_filter, change["fullDocument"], upsert=True)
+
+    def read_changes(self) -> None:
+        """Adds the changes made since the last read to `pending`
+
+        Stops reading once `MAX_PENDING` documents are waiting to be sent.
+        """
+        if self.stream is None:
+            if self.resume_token is None:
+                # Nothing to resume from, so changes made while the stream was closed are lost
+                self.needs_full_sync = set(self.collections)
+            self.stream = self.open_stream()
+        while self.get_queue_depth() < self.MAX_PENDING:
+            if (change := self.stream.try_next()) is None:
+                break
+            with self.lock:
+                operations = self.pending.setdefault(change["ns"]["coll"], {})
+                # Move the document to the end so writes stay in the order of their last change
+                operations.pop(change["documentKey"]["_id"], None)
+                operations[change["documentKey"]["_id"]] = self.create_operation(change)
+                if self.pending_since is None:
+                    self.pending_since = time.time()
+
+    def get_queue_depth(self) -> int:
+        """Returns the number of documents waiting to be sent to the cloud database"""
+        with self.lock:
+            return sum(len(operations) for operations in self.pending.values())
+
+    def get_status(self) -> Dict[str, Any]:
+        """Returns the number of documents waiting to be sent, how long the oldest one has been
+        waiting in seconds, and the time of the last successful sync"""
+        with self.lock:
+            pending_since = self.pending_since
+        return {
+            "queue_depth": self.get_queue_depth(),
+            "lag_seconds": 0 if pending_since is None else round(time.time() - pending_since, 1),
+            "last_success": self.last_success,
+            "needs_full_sync": sorted(self.needs_full_sync),
+        }
+
+    def full_sync(self, collection: str) -> None:
+        """Replaces the contents of `collection` in the cloud database with the local contents"""
+        data = self.local_db.find(collection)
+        self.cloud_db.db[collection].delete_many({})
+        if data:
+            self.cloud_db.db[collection].insert_many(data)
+        log.info(f"Re-uploaded {len(data)} documents in {collection} to the cloud DB")
+
+    def write_changes(self, collection: str, operations: list) -> None:
+        """Sends `operations` to `collection` in the cloud database in batches"""
+        for start in range(0, len(operations), self.BATCH_SIZE):
+            self.cloud_db.db[collection].bulk_write(
+                operations[start : start + self.BATCH_SIZE], ordered=True
+            )
+
+    def flush(self) -> int:
+        """Sends the pending writes and full syncs to the cloud database
+
+        Collections are removed from `pending` as they are sent, so a failed flush only resends
+        what's left. Returns the number of documents sent.
+        """
+        num_changes = 0
+        for collection in sorted(self.needs_full_sync):
+            self.full_sync(collection)
+            self.needs_full_sync.discard(collection)
+            with self.lock:
+                self.pending.pop(collection, None)
+        for collection in sorted(self.pending):
+            operations = list(self.pending[collection].values())
+            try:
+                self.write_changes(collection, operations)
+            except pymongo.errors.BulkWriteError as err:
+                log.error(f"Unable to update {collection} in the cloud DB, re-uploading: {err}")
+                self.full_sync(collection)
+            num_changes += len(operations)
+            with self.lock:
+                self.pending.pop(collection)
+        with self.lock:
+            self.pending_since = None
+        return num_changes
+
+    def sync(self) -> bool:
+        """Sends every change made to the local database since the last sync to the cloud database
+
+        Returns whether every change was sent.
+        """
+        start_time = time.time()
+        try:
+            # Read the changes first so full syncs include anything that happened before them
+            self.read_changes()
+        except pymongo.errors.PyMongoError as err:
+            log.error(f"Unable to read local DB changes, reopening the change stream: {err}")
+            self.close()
+            return False
+        try:
+            num_changes = self.flush()
+        except self.CONNECTION_ERRORS as err:
+            log.critical(
+                f"Unable to write to the cloud DB, retrying later. Make sure you're not connected to DJUSD Wi-Fi (use a hotspot or different Wi-Fi): {err}"
+            )
+            return False
+        except pymongo.errors.PyMongoError as err:
+            log.error(f"Cloud sync failed, re-uploading every collection: {err}")
+            self.needs_full_sync = set(self.collections)
+            return False
+        self.save_resume_token(self.stream.resume_token)
+        self.last_success = time.time()
+        if num_changes:
+            log.info(
+                f"Sent {num_changes} changes to the cloud DB. ({round(time.time() - start_time, 1)} sec)"
+            )
+        return True
+
+    def close(self) -> None:
+        """Closes the change stream, the next sync resumes from the saved resume token"""
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+
+
+class CloudSyncWorker(threading.Thread):
+    """Runs `CloudSync.sync` in the background until stopped"""
+
+    # Seconds between syncs when the cloud database is reachable
+    POLL_SECONDS = 2
+    # Seconds to wait after the first failed sync, doubled after every failure in a row
+    MIN_BACKOFF_SECONDS = 2
+    MAX_BACKOFF_SECONDS = 300
+
+    def __init__(self, cloud_sync: CloudSync):
+        super().__init__(name="cloud_sync", daemon=True)
+        self.cloud_sync = cloud_sync
+        self.failures = 0
+        self.stop_event = threading.Event()
+
+    def get_wait_time(self) -> float:
+        """Returns the seconds to wait before the next sync"""
+        if self.failures == 0:
+            return self.POLL_SECONDS
+        return min(self.MIN_BACKOFF_SECONDS * 2 ** (self.failures - 1), self.MAX_BACKOFF_SECONDS)
+
+    def get_status(self) -> Dict[str, Any]:
+        """Returns the status of the cloud sync along with the number of failed syncs in a row"""
+        return {**self.cloud_sync.get_status(), "failures": self.failures}
+
+    def run(self) -> None:
+        while not self.stop_event.is_set():
+            try:
+                succeeded = self.cloud_sync.sync()
+            except Exception as err:
+                # Keep the thread alive, the server would otherwise silently stop syncing
+                log.exception(f"Unexpected error syncing to the cloud DB: {err}")
+                succeeded = False
+            self.failures = 0 if succeeded else self.failures + 1
+            self.stop_event.wait(self.get_wait_time())
+        self.cloud_sync.close()
+
+    def stop(self) -> None:
+        """Stops syncing after the current sync finishes"""
+        self.stop_event.set()
+        self.join()
@@ -1,5 +1,6 @@
 #!/usr/bin/env python3
 
+import argparse
 import database
 import server
 import logging
@@ -8,6 +9,8 @@ import time
 import json
 from unittest.mock import patch
 import tba_communicator
+import profiler
+import query_stats
 
 """Uses the raw QRs in the cloud db to simulate a competition"""
 
@@ -17,6 +20,10 @@ log = logging.getLogger("comp_simulator")
 tba_request_wrapper = tba_communicator.tba_request
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulates a competition with real raw QRs")
+    profiler.add_arguments(parser)
+    args = parser.parse_args()
+
     utils.confirm_comp()
 
     # set up stuff
@@ -33,7 +40,7 @@ if __name__ == "__main__":
     else:
         real_raw_qrs = json.load(open(f"data/{utils.server_key()}_raw_qr.json"))
     current_match_number = 1
-    s = server.Server(write_cloud)
+    s = server.Server(write_cloud, calc_profiler=profiler.from_args(args))
     s.local_db.delete_data("raw_qr", bypass=True)
     s.calculations.pop(0)  # remove qr input :)
     while True:
@@ -71,7 +78,12 @@ if __name__ == "__main__":
             # add the raw qrs to the local db
             s.local_db.insert_documents("raw_qr", raw_qrs_to_upload)
 
+            s.metrics_collector.start_cycle()
             s.run_calculations()
+            s.metrics_collector.end_cycle()
+            query_stats.end_cycle()
+            if s.calc_profiler is not None:
+                s.calc_profiler.write()
             if s.write_cloud:
                 for collection in s.VALID_COLLECTIONS:
                     curr_time = time.time()
@@ -6,15 +6,21 @@ All communication with the MongoDB local database go through this file.
 """
 import os
 import collections as collections_module
+import hashlib
 from typing import Any, Optional, Union, List, Dict
 import pymongo
+from bson.codec_options import CodecOptions
+from bson.raw_bson import RawBSONDocument
+import metrics
+import query_stats
 import start_mongod
 import utils
 import logging
 import re
 import json
-import pandas as pd
 import shutil
+import socket
+import threading
 
 log = logging.getLogger("database")
 
@@ -38,6 +44,7 @@ VALID_COLLECTIONS = [
     "predicted_team",
     "predicted_dbl_elim",
     "predicted_elims",
+    "predicted_elims_odds",
     "pickability",
     "raw_obj_pit",
     "ss_tim",
@@ -50,8 +57,52 @@ VALID_COLLECTIONS = [
     "unconsolidated_ss_team",
 ]
 
-# Start mongod and initialize replica set
-start_mongod.start_mongod()
+# MongoClients shared by every database in this process by (connection, port), see `get_client`
+_clients: Dict[tuple, pymongo.MongoClient] = {}
+_clients_lock = threading.Lock()
+# Whether the local mongod was found or started by this process, see `ensure_mongod`
+_mongod_ready = False
+_mongod_lock = threading.Lock()
+
+
+def is_port_open(host: str, port: int, timeout: float = 0.5) -> bool:
+    """Returns whether something is accepting TCP connections on host:port"""
+    try:
+        with socket.create_connection((host, port), timeout=timeout):
+            return True
+    except OSError:
+        return False
+
+
+def ensure_mongod() -> None:
+    """Starts mongod and initializes the replica set the first time the local database is used
+
+    Connecting to the port is much faster than `start_mongod.start_mongod`, which runs mongod and
+    mongosh in subprocesses, so that is only done if mongod isn't already running.
+    """
+    global _mongod_ready
+    with _mongod_lock:
+        if _mongod_ready:
+            return
+        if not is_port_open("localhost", start_mongod.PORT):
+            start_mongod.start_mongod()
+        _mongod_ready = True
+
+
+def get_client(connection: str = "localhost", port: int = start_mongod.PORT) -> pymongo.MongoClient:
+    """Returns the MongoClient this process uses for 'connection' and 'port'
+
+    MongoClients are thread safe and pool their connections, so every database with the same
+    connection shares one instead of opening its own sockets.
+    """
+    if connection == "localhost" and port == start_mongod.PORT:
+        ensure_mongod()
+    with _clients_lock:
+        if (connection, port) not in _clients:
+            _clients[(connection, port)] = pymongo.MongoClient(
+                connection, port, event_listeners=[metrics.COMMAND_LISTENER]
+            )
+        return _clients[(connection, port)]
 
 
 def check_collection_name(collection_name: str) -> None:
@@ -63,6 +114,10 @@ def check_collection_name(collection_name: str) -> None:
 class Database:
     """Utility class for the database, performs CRUD functions on local and cloud databases"""
 
+    # Largest size in bytes and number of documents of the capped server_metrics collection
+    SERVER_METRICS_SIZE = 64 * 1024 * 1024
+    SERVER_METRICS_MAX_DOCUMENTS = 100_000
+
     def __init__(
         self,
         tba_event_key: str = utils.load_tba_event_key_file(utils._TBA_EVENT_KEY_FILE),
@@ -71,10 +126,16 @@ class Database:
     ) -> None:
         self.connection = connection
         self.port = port
-        self.client = pymongo.MongoClient(connection, port)
+        self.client = get_client(connection, port)
         production_mode: bool = os.environ.get("SCOUTING_SERVER_ENV") == "production"
         self.name = tba_event_key if production_mode else f"test{tba_event_key}"
         self.db = self.client[self.name]
+        # Collections whose indexes were created by `insert_unique_documents`
+        self.indexed_collections = set()
+        # Collections whose unique indexes couldn't be created because of existing duplicates
+        self.unindexed_collections = set()
+        # Whether the capped server_metrics collection exists, see `insert_server_metrics`
+        self.server_metrics_created = False
 
     def setup_db(self):
         self.set_indexes()
@@ -86,30 +147,130 @@ class Database:
     def set_indexes(self) -> None:
         """Adds indexes into competition collections"""
         for collection in COLLECTION_SCHEMA["collections"]:
-            collection_dict = COLLECTION_SCHEMA["collections"][collection]
-            if collection_dict["indexes"] is not None:
-                for index in collection_dict["indexes"]:
-                    self.db[collection].create_index(
-                        [(field, pymongo.ASCENDING) for field in index["fields"]],
-                        unique=index["unique"],
-                    )
+            self.set_collection_indexes(collection)
+
+    def set_collection_indexes(self, collection: str) -> None:
+        """Adds the indexes of 'collection' from `collection_schema.yml`, if it has any"""
+        collection_dict = COLLECTION_SCHEMA["collections"].get(collection, {})
+        if collection_dict.get("indexes") is not None:
+            for index in collection_dict["indexes"]:
+                self.db[collection].create_index(
+                    [(field, pymongo.ASCENDING) for field in index["fields"]],
+                    unique=index["unique"],
+                )
 
+    @query_stats.track()
     def find(self, collection: str, query: dict = {}) -> list:
         """Finds documents in 'collection', filtering by 'filters'"""
         check_collection_name(collection)
         return list(self.db[collection].find(query))
 
+    @query_stats.track()
+    def group_by(self, collection: str, key_fields: tuple, query: dict = {}) -> Dict[tuple, list]:
+        """Loads documents in 'collection' matching 'query' in one round trip and groups them by the
+        values of 'key_fields'
+
+        Use this instead of calling `find` in a loop, for example:
+        group_by("unconsolidated_totals", ("team_number", "match_number"))[("1678", 42)]
+        """
+        check_collection_name(collection)
+        grouped = collections_module.defaultdict(list)
+        for document in self.find(collection, query):
+            grouped[tuple(document.get(field) for field in key_fields)].append(document)
+        return dict(grouped)
+
+    @query_stats.track()
+    def get_document_hashes(
+        self, collection: str, key_fields: tuple = ("team_number", "match_number")
+    ) -> Dict[tuple, str]:
+        """Returns a hash of the contents of the documents in 'collection', grouped by 'key_fields'
+
+        Several documents can share the same key (e.g. one unconsolidated_obj_tim per scout), so
+        the hash of a key covers every document with that key. Used to find which keys changed
+        between two server cycles.
+
+        The raw BSON of each document is hashed, which is about 3 times faster than decoding and
+        serializing it. Rewriting a document with its fields in a different order changes its
+        hash, which only causes an unneeded recalculation.
+        """
+        check_collection_name(collection)
+        digests = collections_module.defaultdict(list)
+        raw_collection = self.db.get_collection(
+            collection, codec_options=CodecOptions(document_class=RawBSONDocument)
+        )
+        for raw_document in raw_collection.find({}, {"_id": 0}):
+            key = tuple(raw_document.get(field) for field in key_fields)
+            digests[key].append(hashlib.sha1(raw_document.raw).hexdigest())
+        return {key: "".join(sorted(values)) for key, values in digests.items()}
+
+    @query_stats.track("tba_cache")
     def get_tba_cache(self, api_url: str) -> Optional[dict]:
         """Gets the TBA Cache of 'api_url'"""
         return self.db.tba_cache.find_one({"api_url": api_url})
 
-    def update_tba_cache(self, data: Any, api_url: str, etag: Optional[str] = None) -> None:
-        """Updates one TBA Cache at 'api_url'"""
+    @query_stats.track("tba_cache")
+    def update_tba_cache(
+        self,
+        data: Any,
+        api_url: str,
+        etag: Optional[str] = None,
+        expires: Optional[float] = None,
+    ) -> None:
+        """Updates one TBA Cache at 'api_url'
+
+        'expires' is the epoch time until which the cache can be used without asking TBA
+        """
         write_object = {"data": data}
         if etag is not None:
             write_object["etag"] = etag
+        if expires is not None:
+            write_object["expires"] = expires
         self.db.tba_cache.update_one({"api_url": api_url}, {"$set": write_object}, upsert=True)
 
+    @query_stats.track("decompression_cache")
+    def get_decompression_cache(self) -> Dict[str, Optional[List[dict]]]:
+        """Gets the decompressed documents of every cached raw QR, keyed by their cache key"""
+        return {
+            entry["key"]: entry["decompressed"]
+            for entry in self.db.decompression_cache.find({}, {"_id": 0})
+        }
+
+    @query_stats.track("decompression_cache")
+    def update_decompression_cache(
+        self, entries: Dict[str, Optional[List[dict]]], stale_keys: Optional[set] = None
+    ) -> None:
+        """Adds 'entries' to the decompression cache and removes the entries of 'stale_keys'"""
+        actions = [
+            pymongo.UpdateOne({"key": key}, {"$set": {"decompressed": decompressed}}, upsert=True)
+            for key, decompressed in entries.items()
+        ]
+        if stale_keys:
+            actions.append(pymongo.DeleteMany({"key": {"$in": list(stale_keys)}}))
+        if actions:
+            self.db.decompression_cache.bulk_write(actions, ordered=False)
+
+    def insert_server_metrics(self, documents: List[dict]) -> None:
+        """Inserts calculation and cycle metrics into `server_metrics`, see `metrics.py`
+
+        `server_metrics` is capped, so the oldest metrics are removed instead of the collection
+        growing for the whole competition.
+        """
+        if not self.server_metrics_created:
+            try:
+                self.db.create_collection(
+                    "server_metrics",
+                    capped=True,
+                    size=self.SERVER_METRICS_SIZE,
+                    max=self.SERVER_METRICS_MAX_DOCUMENTS,
+                )
+            except pymongo.errors.CollectionInvalid:
+                # Already created by a previous run
+                pass
+            self.server_metrics_created = True
+        if documents:
+            self.db.server_metrics.insert_many(documents)
+
+    @query_stats.track()
     def delete_data(self, collection: str, query: dict = None, bypass: bool = False) -> None:
         """Deletes data in 'collection' according to 'filters'"""
         check_collection_name(collection)
@@ -126,6 +287,7 @@ class Database:
         else:
             self.db[collection].delete_many(query)
 
+    @query_stats.track()
     def insert_documents(self, collection: str, data: Union[list, dict]) -> None:
         """Inserts documents from 'data' list in 'collection'"""
         check_collection_name(collection)
@@ -142,6 +304,138 @@ class Database:
         except Exception as err:
             log.critical(f"Unable to insert some documents into collection {collection}: {err}")
 
+    @query_stats.track()
+    def insert_unique_documents(self, collection: str, data: List[dict]) -> List[dict]:
+        """Inserts the documents in 'data' that don't break a unique index of 'collection'
+
+        Documents are inserted in one unordered round trip, so duplicates (E11000 errors) are
+        skipped instead of stopping the insert. Returns the documents that were inserted.
+        """
+        check_collection_name(collection)
+        if not data:
+            return []
+        # Duplicates are only rejected if the unique indexes exist
+        if collection not in self.indexed_collections:
+            try:
+                self.set_collection_indexes(collection)
+            except pymongo.errors.OperationFailure as err:
+                # Databases from before the indexes were created here can already hold duplicates
+                log.error(
+                    f"Unable to create the indexes of {collection}, checking for duplicates by "
+                    f"reading {collection} instead: {err}"
+                )
+                self.unindexed_collections.add(collection)
+            self.indexed_collections.add(collection)
+        if collection in self.unindexed_collections:
+            if not (data := self.remove_existing_documents(collection, data)):
+                return []
+        try:
+            self.db[collection].insert_many(data, ordered=False)
+        except pymongo.errors.BulkWriteError as err:
+            failed = set()
+            for error in err.details["writeErrors"]:
+                failed.add(error["index"])
+                if error["code"] != 11000:
+                    log.critical(
+                        f"Unable to insert a document into collection {collection}: {error['errmsg']}"
+                    )
+            return [document for index, document in enumerate(data) if index not in failed]
+        return data
+
+    def remove_existing_documents(self, collection: str, data: List[dict]) -> List[dict]:
+        """Returns the documents in 'data' that wouldn't break a unique index of 'collection' from
+        `collection_schema.yml`, by reading the indexed fields of every document in 'collection'"""
+        indexes = COLLECTION_SCHEMA["collections"].get(collection, {}).get("indexes") or []
+        unique_fields = [tuple(index["fields"]) for index in indexes if index["unique"]]
+        existing = {
+            fields: {
+                tuple(document.get(field) for field in fields)
+                for document in self.db[collection].find({}, {field: 1 for field in fields})
+            }
+            for fields in unique_fields
+        }
+        new_documents = []
+        for document in data:
+            keys = {
+                fields: tuple(document.get(field) for field in fields) for fields in unique_fields
+            }
+            if any(key in existing[fields] for fields, key in keys.items()):
+                continue
+            for fields, key in keys.items():
+                existing[fields].add(key)
+            new_documents.append(document)
+        return new_documents
+
+    @query_stats.track()
+    def replace_collection_contents(
+        self,
+        collection: str,
+        data: List[dict],
+        key_fields: Optional[tuple] = None,
+        query: Optional[dict] = None,
+    ) -> Optional[pymongo.results.BulkWriteResult]:
+        """Makes the documents in 'collection' matching 'query' equal to 'data'
+
+        Equivalent to `delete_data(collection, query)` followed by `insert_documents(collection,
+        data)`, but only writes the documents that changed, so readers never see an empty
+        collection and unchanged documents don't show up in the oplog. Documents are matched by
+        'key_fields', which defaults to the first index of the collection in
+        `collection_schema.yml`.
+        """
+        check_collection_name(collection)
+        if "raw" in collection:
+            log.warning(f"A file attempted to replace raw data in {collection=}, was blocked.")
+            return None
+        if not data:
+            # Warn like `insert_documents`, the documents matching 'query' are still deleted
+            log.warning(f'No documents to replace the contents of "{collection}" with')
+        if key_fields is None:
+            indexes = COLLECTION_SCHEMA["collections"].get(collection, {}).get("indexes")
+            key_fields = tuple(indexes[0]["fields"]) if indexes else ()
+
+        def get_key(document: dict) -> tuple:
+            return tuple(document.get(field) for field in key_fields)
+
+        def get_contents(document: dict) -> str:
+            document = {field: value for field, value in document.items() if field != "_id"}
+            return json.dumps(document, sort_keys=True, default=str)
+
+        old_documents = collections_module.defaultdict(list)
+        for document in self.find(collection, query or {}):
+            old_documents[get_key(document)].append(document)
+        new_documents = collections_module.defaultdict(list)
+        for document in data:
+            new_documents[get_key(document)].append(
+                {field: value for field, value in document.items() if field != "_id"}
+            )
+
+        actions = []
+        for key in list(old_documents.keys()) + [
+            key for key in new_documents.keys() if key not in old_documents
+        ]:
+            old, new = old_documents.get(key, []), new_documents.get(key, [])
+            if sorted(map(get_contents, old)) == sorted(map(get_contents, new)):
+                continue
+            # Keys can be shared by several documents (e.g. unconsolidated_obj_tim), so pair up
+            # the old and new documents with the same key
+            for index in range(max(len(old), len(new))):
+                if index >= len(new):
+                    actions.append(pymongo.DeleteOne({"_id": old[index]["_id"]}))
+                elif index >= len(old):
+                    actions.append(pymongo.InsertOne(new[index]))
+                elif get_contents(old[index]) != get_contents(new[index]):
+                    actions.append(
+                        pymongo.ReplaceOne({"_id": old[index]["_id"]}, new[index], upsert=True)
+                    )
+        if not actions:
+            return None
+        try:
+            return self.db[collection].bulk_write(actions, ordered=True)
+        except pymongo.errors.BulkWriteError as err:
+            log.critical(f"Unable to write some documents into collection {collection}: {err}")
+            return None
+
+    @query_stats.track()
     def update_document(
         self, collection: str, new_data: dict, query: dict, many: bool = False, upsert: bool = False
     ) -> None:
@@ -155,6 +449,7 @@ class Database:
         else:
             return self.db[collection].update_many(query, {"$set": new_data}, upsert)
 
+    @query_stats.track()
     def update_many(
         self,
         collection: str,
@@ -168,11 +463,13 @@ class Database:
             return
         self.db[collection].update_many(query, {"$set": new_data}, upsert=True)
 
+    @query_stats.track("raw_qr")
     def update_qr_blocklist_status(self, query, blocklist=True) -> None:
         """Changes the status of a raw qr matching 'query' from blocklisted: true to blocklisted: false
         Lowers risk of data loss from using normal update."""
         self.db["raw_qr"].update_one(query, {"$set": {"blocklisted": blocklist}})
 
+    @query_stats.track("raw_qr")
     def update_qr_data_override(self, query, datapoint, new_value, clear=False) -> None:
         """Changes the override of a datapoint of a raw qr matching 'query' to new_value
         Lowers risk of data loss from using normal update."""
@@ -203,6 +500,7 @@ class Database:
                 out.pop(entry)
         return out
 
+    @query_stats.track()
     def bulk_write(self, collection: str, actions: list) -> pymongo.results.BulkWriteResult:
         """Bulk write `actions` into `collection` in order of `actions`"""
         check_collection_name(collection)
@@ -366,7 +664,7 @@ class BetterDatabase:
         else:
             self.connection = "localhost"
 
-        self.client = pymongo.MongoClient(self.connection, port)
+        self.client = get_client(self.connection, port)
         self.db = self.client[self.db_name]
 
     def check_collection(self, collection: str) -> bool:
@@ -380,6 +678,7 @@ class BetterDatabase:
         "Returns a list of all existing collections within the"
         return list(map(lambda col: col["name"], self.db.list_collections()))
 
+    @query_stats.track()
     def get_documents(
         self, collection: str, query: dict = dict(), include_obj_id: bool = False
     ) -> List[dict]:
@@ -398,6 +697,7 @@ class BetterDatabase:
                 filtered.append(document)
             return filtered
 
+    @query_stats.track()
     def update_document(
         self,
         collection: str,
@@ -425,6 +725,7 @@ class BetterDatabase:
         else:
             return self.db[collection].update_many(query, {"$set": updates})
 
+    @query_stats.track()
     def insert_documents(
         self, collection: str, data: Union[List[dict], dict]
     ) -> pymongo.results.InsertManyResult:
@@ -439,6 +740,7 @@ class BetterDatabase:
         else:
             log.warning(f"Attempted to insert invalid data type ({type(data)}) into {collection=}")
 
+    @query_stats.track()
     def delete_documents(
         self, collection: str, query: dict, bypass_raw: bool = False
     ) -> pymongo.results.DeleteResult:
@@ -481,6 +783,9 @@ class BetterDatabase:
             with open(out_file, "w") as f:
                 f.write(json.dumps(filtered_documents, indent=4))
         elif file_type == "csv":
+            # pandas is slow to import and only needed for exports
+            import pandas as pd
+
             pd.DataFrame(filtered_documents).to_csv(out_file, index=False)
         else:
             log.error("Invalid out file type")
@@ -520,6 +825,8 @@ class BetterDatabase:
                 with open(f"data/{out_folder}/{collection}.json", "w") as f:
                     f.write(json.dumps(filtered_documents, indent=4))
             elif file_type == "csv":
+                import pandas as pd
+
                 pd.DataFrame(filtered_documents).to_csv(
                     f"data/{out_folder}/{collection}.csv", index=False
                 )
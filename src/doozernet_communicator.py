@@ -1,5 +1,7 @@
 import requests
 import logging
+import time
+import metrics
 import utils
 
 log = logging.getLogger(__name__)
@@ -14,6 +16,7 @@ DOOZER_SIGIL = open("data/api_keys/doozernet_key.txt").read().strip()
 def dn_request(api_url: str, params=None, json=None, type="GET"):
     """Makes a request to the DoozerNet API"""
     base_url = "https://api.1678doozer.net/"
+    request_start = time.perf_counter()
     if type == "GET":
         response = requests.get(
             f"{base_url}{api_url}", params=params, headers={"DoozerSigil": DOOZER_SIGIL}
@@ -22,6 +25,7 @@ def dn_request(api_url: str, params=None, json=None, type="GET"):
         response = requests.post(
             f"{base_url}{api_url}", params=params, json=json, headers={"DoozerSigil": DOOZER_SIGIL}
         )
+    metrics.record_request("doozernet", time.perf_counter() - request_start)
     response_json = response.json()
     return response_json
 
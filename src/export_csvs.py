@@ -12,7 +12,6 @@ from datetime import datetime
 import database
 import tba_communicator
 import database
-import pymongo
 import os
 import re
 from typing import List, Dict, Tuple, Optional, Any
@@ -27,13 +26,18 @@ log = logging.getLogger(__name__)
 
 DATABASE = database.Database()
 
-try:
-    CLOUD_CLIENT = pymongo.MongoClient(database.CloudDBUpdater.get_connection_string())
-    """Make sure production is on or cloud database won't return anything"""
-    CLOUD_DATABASE = database.Database(connection=database.CloudDBUpdater.get_connection_string())
-    CLOUD_CLIENT.close()
-except FileNotFoundError:
-    log.error("Cloud database password not found")
+
+def get_cloud_database() -> Optional[database.Database]:
+    """Connects to the cloud database, returns None if the cloud password is missing
+
+    Make sure production is on or cloud database won't return anything
+    """
+    try:
+        return database.Database(connection=database.CloudDBUpdater.get_connection_string())
+    except FileNotFoundError:
+        log.error("Cloud database password not found")
+        return None
+
 
 SCHEMA = utils.read_schema("schema/collection_schema.yml")
 
@@ -53,8 +57,8 @@ class BaseExport:
     def load_single_collection(collection_name: str, export_cloud=False) -> List[Dict]:
         """Return a list of all the documents in a given collection"""
         """Will return from cloud database instead of local if export_cloud is true"""
-        if export_cloud == True and CLOUD_DATABASE != None:
-            return CLOUD_DATABASE.find(collection_name)
+        if export_cloud == True and (cloud_database := get_cloud_database()) != None:
+            return cloud_database.find(collection_name)
         else:
             return DATABASE.find(collection_name)
 
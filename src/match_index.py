@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+
+"""Holds the match index, which lets calculations look up data for a match without scanning.
+
+Several calculations (OBJ team, predicted AIM, predicted team, and data validation) need the
+obj_tims and TBA data of each match or team. Instead of each of them scanning the obj_tim collection
+and the TBA match list once per match or team, the server builds one index per cycle that they
+share (see `Server.get_match_index`). The index is rebuilt after a calculation writes to a collection it
+indexes.
+"""
+
+import collections
+from typing import Dict, Iterable, List, Optional
+
+
+class MatchIndex:
+    """Lookups of obj_tims, TBA matches, played matches, and scheduled AIMs by match number or
+    team number"""
+
+    # Collections the index is built from, writes to these make the index outdated
+    COLLECTIONS = ["obj_tim"]
+
+    def __init__(self, obj_tims: List[dict], tba_matches: List[dict], aim_list: List[dict]):
+        """`aim_list` is the match schedule, from `BaseCalculations.get_aim_list()`"""
+        self.obj_tims: Dict[int, List[dict]] = collections.defaultdict(list)
+        for tim in obj_tims:
+            self.obj_tims[tim["match_number"]].append(tim)
+        # Only qualification matches, since elimination match numbers restart at 1
+        self.tba_matches: Dict[int, dict] = {
+            match["match_number"]: match for match in tba_matches if match["comp_level"] == "qm"
+        }
+        # Built on first use, see `get_played_matches_by_team`
+        self.played_matches: Optional[Dict[str, List[dict]]] = None
+        self.team_aims: Dict[str, List[dict]] = collections.defaultdict(list)
+        for aim in aim_list:
+            for team in aim["team_list"]:
+                self.team_aims[team].append(aim)
+
+    def get_obj_tims(self, match_number: int, teams: Optional[Iterable[str]] = None) -> List[dict]:
+        """Returns the obj_tims in a match, only for `teams` if given"""
+        tims = self.obj_tims.get(match_number, [])
+        if teams is None:
+            return tims
+        teams = set(teams)
+        return [tim for tim in tims if tim["team_number"] in teams]
+
+    def get_tba_match(self, match_number: int) -> Optional[dict]:
+        """Returns the TBA data for a qualification match, or None if TBA doesn't have the match"""
+        return self.tba_matches.get(match_number)
+
+    def get_tba_matches(self) -> List[dict]:
+        """Returns the TBA data for every qualification match, sorted by match number"""
+        return [self.tba_matches[match_number] for match_number in sorted(self.tba_matches)]
+
+    def get_played_matches_by_team(self) -> Dict[str, List[dict]]:
+        """Returns the TBA data for the qualification matches each team played, by match number
+
+        Matches played as a surrogate are included. Matches without a score breakdown haven't been
+        played yet, so they are left out.
+        """
+        if self.played_matches is None:
+            played_matches = collections.defaultdict(list)
+            for match in self.get_tba_matches():
+                if not match.get("score_breakdown"):
+                    continue
+                for alliance in match["alliances"].values():
+                    for team_key in alliance["team_keys"]:
+                        played_matches[team_key[3:]].append(match)
+            self.played_matches = dict(played_matches)
+        return self.played_matches
+
+    def get_played_matches(self, team: str) -> List[dict]:
+        """Returns the TBA data for the qualification matches a team played, by match number"""
+        return self.get_played_matches_by_team().get(team, [])
+
+    def get_team_aims(self, team: str) -> List[dict]:
+        """Returns the scheduled AIMs a team is in"""
+        return self.team_aims.get(team, [])
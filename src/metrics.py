@@ -0,0 +1,297 @@
+"""Records what each calculation does while it runs, and how long it takes.
+
+For each calculation run and each server cycle, this records:
+- wall time and CPU time
+- documents read and written per collection, and the number of MongoDB round trips
+- the number and latency of requests to TBA, DoozerNet and Statbotics
+- peak RSS (memory) of the server process
+
+MongoDB commands are counted by `COMMAND_LISTENER`, which every MongoClient is created with (see
+`database.get_client`), and web requests are counted by the communicators with `record_request`.
+Both are attributed to the calculation running in the current thread, so work done in other threads
+started by a calculation isn't counted.
+
+Metrics are stored in the capped `server_metrics` collection and summarized in a table at the end
+of each cycle, see `MetricsCollector`.
+"""
+
+import contextlib
+import logging
+import sys
+import threading
+import time
+from typing import Dict, List, Optional
+
+import pymongo.errors
+import pymongo.monitoring
+from rich.table import Table
+
+from console import console
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows
+    resource = None
+
+log = logging.getLogger(__name__)
+
+# Services that `record_request` is called with
+SERVICES = ["tba", "doozernet", "statbotics"]
+
+# MongoDB commands that read documents, with the key of the collection name in the command
+READ_COMMANDS = {"find": "find", "aggregate": "aggregate", "getMore": "collection"}
+# MongoDB commands that write documents, the collection name is the value of the command name
+WRITE_COMMANDS = ["insert", "update", "delete", "findAndModify"]
+
+# Metrics of the calculation running in each thread, see `record`
+_current = threading.local()
+
+
+def get_peak_rss_mb() -> Optional[float]:
+    """Returns the peak resident set size of this process in MB, or None if it's unavailable"""
+    if resource is None:
+        return None
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak_rss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+class CalcMetrics:
+    """Metrics of a single calculation run"""
+
+    def __init__(self, calc_name: str):
+        self.calc_name = calc_name
+        # Whether the calculation was skipped because its watched collections didn't change
+        self.skipped = False
+        self.wall_seconds = 0.0
+        self.cpu_seconds = 0.0
+        self.round_trips = 0
+        self.documents_read: Dict[str, int] = {}
+        self.documents_written: Dict[str, int] = {}
+        self.requests = {service: {"count": 0, "seconds": 0.0} for service in SERVICES}
+        self.peak_rss_mb = None
+        # Collections and names of the MongoDB commands waiting for a reply, by request ID
+        self.pending_commands: Dict[int, tuple] = {}
+
+    def add_documents(self, counts: Dict[str, int], collection: str, num_documents: int) -> None:
+        """Adds 'num_documents' to the count of 'collection' in 'counts'"""
+        if num_documents:
+            counts[collection] = counts.get(collection, 0) + num_documents
+
+    def to_dict(self) -> dict:
+        """Returns these metrics as a document for the `server_metrics` collection"""
+        return {
+            "calculation": self.calc_name,
+            "skipped": self.skipped,
+            "wall_seconds": self.wall_seconds,
+            "cpu_seconds": self.cpu_seconds,
+            "round_trips": self.round_trips,
+            "documents_read": self.documents_read,
+            "documents_written": self.documents_written,
+            "requests": self.requests,
+            "peak_rss_mb": self.peak_rss_mb,
+        }
+
+
+@contextlib.contextmanager
+def record(calc_name: str):
+    """Records the metrics of the code ran in this block as the calculation 'calc_name'
+
+    Yields the `CalcMetrics`, which are complete once the block exits (even if it raises).
+    """
+    calc_metrics = CalcMetrics(calc_name)
+    previous = getattr(_current, "metrics", None)
+    _current.metrics = calc_metrics
+    start_wall = time.perf_counter()
+    # CPU time of this thread only, other calculations may be running at the same time
+    start_cpu = time.thread_time()
+    try:
+        yield calc_metrics
+    finally:
+        calc_metrics.wall_seconds = time.perf_counter() - start_wall
+        calc_metrics.cpu_seconds = time.thread_time() - start_cpu
+        calc_metrics.peak_rss_mb = get_peak_rss_mb()
+        _current.metrics = previous
+
+
+def get_current() -> Optional[CalcMetrics]:
+    """Returns the metrics of the calculation running in this thread, if there is one"""
+    return getattr(_current, "metrics", None)
+
+
+def record_request(service: str, seconds: float) -> None:
+    """Counts a request to 'service' that took 'seconds' for the running calculation"""
+    if (calc_metrics := get_current()) is not None:
+        calc_metrics.requests[service]["count"] += 1
+        calc_metrics.requests[service]["seconds"] += seconds
+
+
+class CommandListener(pymongo.monitoring.CommandListener):
+    """Counts MongoDB round trips and the documents they read or write
+
+    PyMongo calls these methods from the thread that ran the command, so they are counted for the
+    calculation running in that thread.
+    """
+
+    def started(self, event: pymongo.monitoring.CommandStartedEvent) -> None:
+        if (calc_metrics := get_current()) is None:
+            return
+        calc_metrics.round_trips += 1
+        if event.command_name in READ_COMMANDS:
+            collection = event.command.get(READ_COMMANDS[event.command_name])
+        elif event.command_name in WRITE_COMMANDS:
+            collection = event.command.get(event.command_name)
+        else:
+            return
+        if isinstance(collection, str):
+            calc_metrics.pending_commands[event.request_id] = (event.command_name, collection)
+
+    def succeeded(self, event: pymongo.monitoring.CommandSucceededEvent) -> None:
+        if (calc_metrics := get_current()) is None:
+            return
+        if (pending := calc_metrics.pending_commands.pop(event.request_id, None)) is None:
+            return
+        command_name, collection = pending
+        reply = event.reply
+        if command_name in READ_COMMANDS:
+            cursor = reply.get("cursor", {})
+            num_documents = len(cursor.get("firstBatch", cursor.get("nextBatch", [])))
+            calc_metrics.add_documents(calc_metrics.documents_read, collection, num_documents)
+        elif command_name == "findAndModify":
+            num_documents = reply.get("lastErrorObject", {}).get("n", 0)
+            calc_metrics.add_documents(calc_metrics.documents_written, collection, num_documents)
+        else:
+            # Documents inserted, matched by an update (including upserts), or deleted
+            calc_metrics.add_documents(
+                calc_metrics.documents_written, collection, reply.get("n", 0)
+            )
+
+    def failed(self, event: pymongo.monitoring.CommandFailedEvent) -> None:
+        if (calc_metrics := get_current()) is not None:
+            calc_metrics.pending_commands.pop(event.request_id, None)
+
+
+COMMAND_LISTENER = CommandListener()
+
+
+class MetricsCollector:
+    """Collects the metrics of every calculation ran in a cycle, then stores and summarizes them
+
+    Call `start_cycle` before a cycle, `add` with the metrics of each calculation run, and
+    `end_cycle` after the cycle.
+    """
+
+    def __init__(self, db):
+        # Database that metrics are stored in, see `database.Database.insert_server_metrics`
+        self.db = db
+        self.calc_metrics: List[CalcMetrics] = []
+        self.lock = threading.Lock()
+        self.start_cycle()
+
+    def start_cycle(self) -> None:
+        """Starts recording a new cycle"""
+        with self.lock:
+            self.calc_metrics = []
+        self.cycle_start = time.time()
+        self.start_wall = time.perf_counter()
+        self.start_cpu = time.process_time()
+
+    def add(self, calc_metrics: CalcMetrics) -> None:
+        """Adds the metrics of a calculation run to this cycle, safe to call from any thread"""
+        with self.lock:
+            self.calc_metrics.append(calc_metrics)
+
+    def get_cycle_summary(self) -> dict:
+        """Returns the totals of this cycle as a document for the `server_metrics` collection"""
+        documents_read = {}
+        documents_written = {}
+        requests = {service: {"count": 0, "seconds": 0.0} for service in SERVICES}
+        for calc_metrics in self.calc_metrics:
+            for collection, count in calc_metrics.documents_read.items():
+                documents_read[collection] = documents_read.get(collection, 0) + count
+            for collection, count in calc_metrics.documents_written.items():
+                documents_written[collection] = documents_written.get(collection, 0) + count
+            for service, service_requests in calc_metrics.requests.items():
+                requests[service]["count"] += service_requests["count"]
+                requests[service]["seconds"] += service_requests["seconds"]
+        return {
+            # Wall time of the whole cycle, calculations can run at the same time
+            "wall_seconds": time.perf_counter() - self.start_wall,
+            # CPU time of every thread in the server process
+            "cpu_seconds": time.process_time() - self.start_cpu,
+            "round_trips": sum(calc_metrics.round_trips for calc_metrics in self.calc_metrics),
+            "documents_read": documents_read,
+            "documents_written": documents_written,
+            "requests": requests,
+            "peak_rss_mb": get_peak_rss_mb(),
+            "calculations_ran": sum(not calc_metrics.skipped for calc_metrics in self.calc_metrics),
+        }
+
+    def create_table(self, summary: dict) -> Table:
+        """Returns a table of each calculation's metrics, slowest first, and the cycle's totals"""
+        table = Table(
+            title=f"Cycle metrics ({summary['wall_seconds']:.1f} sec)",
+            caption="Requests are shown as service count/seconds",
+        )
+        table.add_column("Calculation", no_wrap=True)
+        for column in ["Wall s", "CPU s", "Read", "Written", "Trips"]:
+            table.add_column(column, justify="right")
+        table.add_column("Requests")
+        table.add_column("RSS MB", justify="right")
+
+        def format_requests(requests: dict) -> str:
+            return ", ".join(
+                f"{service} {service_requests['count']}/{service_requests['seconds']:.1f}"
+                for service, service_requests in requests.items()
+                if service_requests["count"]
+            )
+
+        def format_rss(peak_rss_mb: Optional[float]) -> str:
+            return "" if peak_rss_mb is None else f"{peak_rss_mb:.0f}"
+
+        rows = [calc_metrics for calc_metrics in self.calc_metrics if not calc_metrics.skipped]
+        for calc_metrics in sorted(rows, key=lambda row: row.wall_seconds, reverse=True):
+            table.add_row(
+                calc_metrics.calc_name,
+                f"{calc_metrics.wall_seconds:.2f}",
+                f"{calc_metrics.cpu_seconds:.2f}",
+                str(sum(calc_metrics.documents_read.values())),
+                str(sum(calc_metrics.documents_written.values())),
+                str(calc_metrics.round_trips),
+                format_requests(calc_metrics.requests),
+                format_rss(calc_metrics.peak_rss_mb),
+            )
+        table.add_section()
+        table.add_row(
+            f"Total ({summary['calculations_ran']} ran)",
+            f"{summary['wall_seconds']:.2f}",
+            f"{summary['cpu_seconds']:.2f}",
+            str(sum(summary["documents_read"].values())),
+            str(sum(summary["documents_written"].values())),
+            str(summary["round_trips"]),
+            format_requests(summary["requests"]),
+            format_rss(summary["peak_rss_mb"]),
+        )
+        return table
+
+    def end_cycle(self) -> dict:
+        """Stores the metrics of this cycle in `server_metrics`, prints a summary table, and starts
+        a new cycle
+
+        Returns the cycle's totals.
+        """
+        summary = self.get_cycle_summary()
+        documents = [{"type": "cycle", "cycle_start": self.cycle_start, **summary}]
+        documents.extend(
+            {"type": "calculation", "cycle_start": self.cycle_start, **calc_metrics.to_dict()}
+            for calc_metrics in self.calc_metrics
+        )
+        try:
+            self.db.insert_server_metrics(documents)
+        except pymongo.errors.PyMongoError as err:
+            # Metrics are only informational, so they shouldn't stop the server
+            log.error(f"Unable to store server metrics: {err}")
+        console.print(self.create_table(summary))
+        self.start_cycle()
+        return summary
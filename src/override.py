@@ -9,8 +9,17 @@ from utils import get_qr_identifiers
 log = logging.getLogger(__name__)
 
 SCHEMA = utils.read_schema("schema/collection_schema.yml")
-db = database.BetterDatabase(utils.server_key(), False)
 file_name = f"data/{utils.server_key()}_overrides.json"
+# Connected to on first use, see `get_db`
+_db = None
+
+
+def get_db() -> database.BetterDatabase:
+    """Returns the local database, connecting on first use"""
+    global _db
+    if _db is None:
+        _db = database.BetterDatabase(utils.server_key(), False)
+    return _db
 
 
 def apply_override(collection):
@@ -28,7 +37,9 @@ def apply_override(collection):
         new_value = query.pop("new_value")
         datapoint = query.pop("datapoint")
 
-        result = db.update_document(collection, {datapoint: new_value}, query, update_many=True)
+        result = get_db().update_document(
+            collection, {datapoint: new_value}, query, update_many=True
+        )
 
         count += result.modified_count
 
@@ -62,7 +73,7 @@ if __name__ == "__main__":
                 a := utils.input(f"{field}: "), collection_schema["types"][field]
             )
 
-        result = db.get_documents(collection_name, new_entry)
+        result = get_db().get_documents(collection_name, new_entry)
 
         datapoint = utils.input("Datapoint: ")
         print(f"Current value for {datapoint}: {result[0][datapoint]}")
@@ -90,14 +101,14 @@ if __name__ == "__main__":
             key["scout_id"] = name_or_id
         else:
             key["scout_name"] = name_or_id.upper()
-        for qr in db.get_documents("raw_qr", include_obj_id=True):
+        for qr in get_db().get_documents("raw_qr", include_obj_id=True):
             identifiers = get_qr_identifiers(qr["data"])
             if key["match_number"] == identifiers["match_number"] and (
                 (key["scout_name"] == identifiers["scout_name"] and key["scout_name"])
                 or (key["scout_id"] == identifiers["scout_id"] and key["scout_id"])
             ):
                 utils.confirm_comp(f"Found a matching QR with identifiers {identifiers}")
-                db.update_document("raw_qr", {"blocklisted": True}, {"_id": qr["_id"]}, True)
+                get_db().update_document("raw_qr", {"blocklisted": True}, {"_id": qr["_id"]}, True)
                 break
         else:
             log.error("No matching QRs found.")
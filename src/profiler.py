@@ -0,0 +1,169 @@
+"""Profiles calculations while the server runs, see `--profile` in `server.py` and
+`comp_simulator.py`.
+
+Each calculation's `run` is profiled with cProfile. After every cycle, the profiles of each
+calculation (added up over every cycle so far) are written to `<directory>/<calculation>.pstats`,
+and all of them are written to `<directory>/profile.collapsed` as collapsed stacks, which flame
+graph tools (e.g. flamegraph.pl, speedscope) can read. Profiles can be viewed with
+`python3 -m pstats <file>` or snakeviz.
+
+With `--profile-memory`, tracemalloc snapshots are taken before and after each calculation, and the
+lines that allocated the most memory are logged and appended to `<directory>/allocations.txt`.
+
+cProfile and tracemalloc can't tell calculations running at the same time apart, so calculations
+are ran one at a time while profiling. Threads started by calculations aren't profiled.
+"""
+
+import argparse
+import collections
+import contextlib
+import cProfile
+import logging
+import os
+import pstats
+import time
+import tracemalloc
+from typing import Dict, Optional
+
+import utils
+
+log = logging.getLogger(__name__)
+
+
+def get_frame_name(func: tuple) -> str:
+    """Returns the name of a pstats function key in a collapsed stack"""
+    file_name, line_number, function_name = func
+    if file_name == "~":
+        # Built-in functions
+        return function_name.replace(";", ",")
+    return f"{os.path.basename(file_name)}:{line_number}({function_name})".replace(";", ",")
+
+
+def get_collapsed_stacks(stats: pstats.Stats, root: str, max_depth: int = 64) -> Dict[str, int]:
+    """Returns the self time in microseconds of each stack of functions in 'stats'
+
+    cProfile only records which functions called each other, not full stacks, so the time of a
+    function is split between the stacks it was called from in proportion to the time spent in each
+    of its callers, like flameprof. Stacks are prefixed with 'root'.
+    """
+    # (calls, primitive calls, self time, cumulative time) of each callee, by caller
+    callees = collections.defaultdict(dict)
+    for func, (_, _, _, _, callers) in stats.stats.items():
+        for caller, edge in callers.items():
+            callees[caller][func] = edge
+    stacks = collections.Counter()
+
+    def visit(func: tuple, stack: list, funcs_in_stack: set, self_time: float, total_time: float):
+        stack = stack + [get_frame_name(func)]
+        stacks[";".join(stack)] += self_time
+        func_total_time = stats.stats[func][3]
+        if not func_total_time or len(stack) > max_depth:
+            return
+        # Share of the function's callees' time that was spent in this stack
+        share = total_time / func_total_time
+        for callee, (_, _, callee_self_time, callee_total_time) in callees[func].items():
+            # Recursive calls are already counted in the time of the first call
+            if callee not in funcs_in_stack:
+                visit(
+                    callee,
+                    stack,
+                    funcs_in_stack | {callee},
+                    callee_self_time * share,
+                    callee_total_time * share,
+                )
+
+    for func, (_, _, self_time, total_time, callers) in stats.stats.items():
+        if not callers:
+            visit(func, [root], {func}, self_time, total_time)
+    return {
+        stack: round(seconds * 1_000_000)
+        for stack, seconds in stacks.items()
+        if round(seconds * 1_000_000) > 0
+    }
+
+
+class CalculationProfiler:
+    """Profiles calculation runs and writes the results to 'directory'"""
+
+    # Number of allocation sites reported for each calculation run
+    TOP_ALLOCATIONS = 10
+
+    def __init__(self, directory: str, trace_memory: bool = False):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.trace_memory = trace_memory
+        # Profiles of every run of each calculation, by calculation name
+        self.stats: Dict[str, pstats.Stats] = {}
+        self.run_counts = collections.Counter()
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @contextlib.contextmanager
+    def profile(self, calc_name: str):
+        """Profiles the code ran in this block as a run of the calculation 'calc_name'"""
+        self.run_counts[calc_name] += 1
+        before = tracemalloc.take_snapshot() if self.trace_memory else None
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            if calc_name in self.stats:
+                self.stats[calc_name].add(profile)
+            else:
+                self.stats[calc_name] = pstats.Stats(profile)
+            if before is not None:
+                self.report_allocations(calc_name, before, tracemalloc.take_snapshot())
+
+    def report_allocations(
+        self, calc_name: str, before: tracemalloc.Snapshot, after: tracemalloc.Snapshot
+    ) -> None:
+        """Logs the lines that allocated the most memory between two snapshots, and appends them
+        to allocations.txt"""
+        # Ignore the memory used by tracemalloc itself
+        snapshot_filter = tracemalloc.Filter(False, tracemalloc.__file__)
+        differences = after.filter_traces([snapshot_filter]).compare_to(
+            before.filter_traces([snapshot_filter]), "lineno"
+        )[: self.TOP_ALLOCATIONS]
+        title = f"{calc_name} (run {self.run_counts[calc_name]}) top allocations:"
+        lines = [f"  {difference}" for difference in differences]
+        log.info("\n".join([title] + lines))
+        with open(os.path.join(self.directory, "allocations.txt"), "a") as allocations_file:
+            allocations_file.write("\n".join([title] + lines) + "\n\n")
+
+    def write(self) -> None:
+        """Writes the profiles of every calculation so far"""
+        collapsed_stacks = {}
+        for calc_name, stats in self.stats.items():
+            stats.dump_stats(os.path.join(self.directory, f"{calc_name}.pstats"))
+            collapsed_stacks.update(get_collapsed_stacks(stats, calc_name))
+        with open(os.path.join(self.directory, "profile.collapsed"), "w") as collapsed_file:
+            for stack, microseconds in sorted(collapsed_stacks.items()):
+                collapsed_file.write(f"{stack} {microseconds}\n")
+        log.info(f"Wrote profiles of {len(self.stats)} calculations to {self.directory}")
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    """Adds the profiling options to a script's arguments"""
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const=utils.create_file_path(f"data/profiles/{time.strftime('%Y%m%d_%H%M%S')}", False),
+        help="Profile each calculation and write the results to PROFILE (data/profiles/<time> by "
+        "default). Calculations are ran one at a time while profiling",
+    )
+    parser.add_argument(
+        "--profile-memory",
+        action="store_true",
+        help="Also report the lines that allocated the most memory in each calculation (slow)",
+    )
+
+
+def from_args(args: argparse.Namespace) -> Optional[CalculationProfiler]:
+    """Returns a profiler for the options added by `add_arguments`, or None if profiling is off"""
+    if args.profile is None:
+        if args.profile_memory:
+            log.warning("--profile-memory does nothing without --profile")
+        return None
+    return CalculationProfiler(args.profile, args.profile_memory)
@@ -3,7 +3,7 @@
 """Houses upload_qr_codes which appends unique QR codes to local competition document.
 
 Checks for duplicates within set of QR codes to add, and the database.
-Appends new QR codes to raw.qr.
+Appends new QR codes to raw.qr, duplicates are skipped by the unique index on raw_qr data.
 """
 
 import database
@@ -12,11 +12,25 @@ import utils
 import datetime
 from ulid import ULID
 import logging
+import re
 
 log = logging.getLogger(__name__)
 
+# Matches either objective or subjective QR filenames
+# Format of objective QR file pattern: <qual_num>_<team_num>_<timestamp>.txt
+# Format of subjective QR file pattern: <qual_num>_<timestamp>.txt
+QR_FILENAME_REGEX = re.compile(r"([0-9]{1,3}_[0-9]{1,5}_[0-9]+\.txt)|([0-9]{1,3}_[0-9]+\.txt)")
 
-local_database = database.Database(port=1678)
+# Connected to on first use, see `get_db`
+_db = None
+
+
+def get_db() -> database.Database:
+    """Returns the local database, connecting on first use"""
+    global _db
+    if _db is None:
+        _db = database.Database(port=1678)
+    return _db
 
 
 def upload_qr_codes(qr_codes):
@@ -28,19 +42,14 @@ def upload_qr_codes(qr_codes):
     # Gets the starting character for each QR code type, used to identify QR code type
     schema = utils.read_schema("schema/match_collection_qr_schema.yml")
 
-    # Acquires current qr data using database.py
-    qr_data = [qr_code["data"] for qr_code in database.Database(port=1678).find("raw_qr")]
-
     # Creates a set to store QR codes
     # This is a set in order to prevent addition of duplicate qr codes
     qr = set()
 
     for qr_code in qr_codes:
-        if qr_code in qr_data:
-            pass
         # Checks to make sure the qr is valid by checking its starting character. If the starting
         # character doesn't match either of the options, the QR is printed out.
-        elif not (
+        if not (
             qr_code.startswith(schema["subjective_aim"]["_start_character"])
             or qr_code.startswith(schema["objective_tim"]["_start_character"])
         ):
@@ -61,7 +70,8 @@ def upload_qr_codes(qr_codes):
             }
             for qr_code in qr
         ]
-        local_database.insert_documents("raw_qr", qr)
+        # Only the QR codes that weren't already in the database are returned
+        qr = get_db().insert_unique_documents("raw_qr", qr)
 
     return qr
 
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+
+"""Continuously ingests QR codes into raw_qr, separately from the server's calculation cycles.
+
+QR codes are read from these sources at the same time:
+- stdin, one QR per line (QR scanners type each QR followed by enter)
+- a TCP socket on localhost, one QR per line
+- a directory that QR files are pulled to by adb (`data/devices` by default)
+
+QRs are cleaned, deduplicated, and inserted into raw_qr in small batches. Inserting into raw_qr
+triggers the decompressor through the server's change stream (see `scheduler.py`), so scanning
+never waits on calculations and calculations never wait on scanning. While this is running,
+QRInput doesn't wait for QRs on stdin.
+
+Usage:
+python3 src/qr_ingest.py [--no-stdin] [--port PORT] [--directory DIRECTORY]
+"""
+
+import argparse
+import logging
+import os
+import queue
+import re
+import socketserver
+import sys
+import threading
+import time
+
+import qr_code_uploader
+import utils
+
+log = logging.getLogger("qr_ingest")
+
+# Holds the process ID of the running ingest process, see `is_running`
+PID_FILE = utils.create_file_path("data/qr_ingest.pid")
+
+
+def is_running() -> bool:
+    """Returns whether an ingest process is running"""
+    if not os.path.exists(PID_FILE):
+        return False
+    try:
+        with open(PID_FILE) as pid_file:
+            # Signal 0 only checks that the process exists
+            os.kill(int(pid_file.read()), 0)
+    except (ValueError, OSError):
+        return False
+    return True
+
+
+def clean_qr_code(qr_code: str) -> str:
+    """Removes whitespace and the 'Q' some scanners add to the start of QR codes"""
+    qr_code = qr_code.strip().upper()
+    if qr_code.startswith("Q"):
+        qr_code = qr_code[1:]
+    return qr_code
+
+
+class QRIngest:
+    """Collects QR codes from several sources and uploads them to raw_qr in batches"""
+
+    # Most QRs to upload at once
+    BATCH_SIZE = 100
+    # Longest time to wait for more QRs before uploading a batch
+    BATCH_SECONDS = 0.5
+    # Time between checks of the watched directory for new QR files
+    DIRECTORY_POLL_SECONDS = 1
+    # Time to wait after a batch fails to upload before trying again
+    RETRY_SECONDS = 5
+    DEFAULT_PORT = 1679
+
+    def __init__(self, upload=qr_code_uploader.upload_qr_codes):
+        # Uploads a list of QR codes, returning the QRs that were new
+        self.upload = upload
+        self.queue = queue.Queue()
+        # QR codes already queued by this process
+        self.seen = set()
+        self.seen_lock = threading.Lock()
+        # Modification times of the QR files read from the watched directory
+        self.file_mtimes = {}
+
+    def add(self, qr_code: str) -> bool:
+        """Queues `qr_code` for upload, returns False if it is empty or was already queued"""
+        qr_code = clean_qr_code(qr_code)
+        with self.seen_lock:
+            if not qr_code or qr_code in self.seen:
+                return False
+            self.seen.add(qr_code)
+        self.queue.put(qr_code)
+        return True
+
+    def get_batch(self, timeout=None) -> list:
+        """Waits up to `timeout` seconds for a QR, then collects the QRs queued within
+        `BATCH_SECONDS` of it, up to `BATCH_SIZE`"""
+        try:
+            batch = [self.queue.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+        deadline = time.time() + self.BATCH_SECONDS
+        while len(batch) < self.BATCH_SIZE and (remaining := deadline - time.time()) > 0:
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def upload_batch(self, batch: list, retry: bool = True) -> list:
+        """Uploads `batch` to raw_qr, returns the QRs that were new
+
+        If the upload fails, the QRs are queued again and uploading waits for `RETRY_SECONDS`. If
+        `retry` is False, the QRs are logged instead so they aren't lost.
+        """
+        if not batch:
+            return []
+        try:
+            uploaded = self.upload(batch)
+        except Exception as err:
+            if not retry:
+                log.error(f"Unable to upload {len(batch)} QRs: {err}\n" + "\n".join(batch))
+                return []
+            log.error(
+                f"Unable to upload {len(batch)} QRs, retrying in {self.RETRY_SECONDS}s: {err}"
+            )
+            for qr_code in batch:
+                self.queue.put(qr_code)
+            time.sleep(self.RETRY_SECONDS)
+            return []
+        log.info(f"Uploaded {len(uploaded)} new QRs ({len(batch) - len(uploaded)} not uploaded)")
+        return uploaded
+
+    def read_lines(self, stream) -> None:
+        """Queues each line of `stream` as a QR code until it closes"""
+        for line in stream:
+            self.add(line)
+
+    def serve(self, port: int) -> socketserver.ThreadingTCPServer:
+        """Returns a server on localhost:`port` that queues each line it receives as a QR code"""
+        ingest = self
+
+        class QRHandler(socketserver.StreamRequestHandler):
+            def handle(self):
+                for line in self.rfile:
+                    ingest.add(line.decode("utf-8"))
+
+        socketserver.ThreadingTCPServer.allow_reuse_address = True
+        return socketserver.ThreadingTCPServer(("localhost", port), QRHandler)
+
+    def scan_directory(self, directory: str) -> int:
+        """Queues the QR files in `directory` that are new or changed since the last scan
+
+        Returns the number of files read.
+        """
+        num_read = 0
+        for root, _, files in os.walk(directory):
+            for file in files:
+                # QR files are named <match>_<team>_<timestamp>.txt or <match>_<timestamp>.txt
+                if not re.fullmatch(qr_code_uploader.QR_FILENAME_REGEX, file):
+                    continue
+                path = os.path.join(root, file)
+                try:
+                    mtime = os.path.getmtime(path)
+                    if self.file_mtimes.get(path) == mtime:
+                        continue
+                    with open(path) as qr_file:
+                        self.add(qr_file.read())
+                except OSError as err:
+                    # Files can be replaced while adb is pulling them
+                    log.warning(f"Unable to read {path}: {err}")
+                    continue
+                self.file_mtimes[path] = mtime
+                num_read += 1
+        return num_read
+
+    def watch_directory(self, directory: str) -> None:
+        """Scans `directory` for new QR files forever"""
+        while True:
+            self.scan_directory(directory)
+            time.sleep(self.DIRECTORY_POLL_SECONDS)
+
+    def run(self, read_stdin=True, port=None, directory=None) -> None:
+        """Starts every source in a thread and uploads the QRs they queue until interrupted"""
+        threads = []
+        if read_stdin:
+            threads.append(threading.Thread(target=self.read_lines, args=(sys.stdin,)))
+        if port is not None:
+            tcp_server = self.serve(port)
+            threads.append(threading.Thread(target=tcp_server.serve_forever))
+            log.info(f"Accepting QRs on localhost:{port}")
+        if directory is not None:
+            threads.append(threading.Thread(target=self.watch_directory, args=(directory,)))
+            log.info(f"Watching {directory} for QR files")
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+
+        with open(PID_FILE, "w") as pid_file:
+            pid_file.write(str(os.getpid()))
+        try:
+            while True:
+                self.upload_batch(self.get_batch(timeout=1))
+        except KeyboardInterrupt:
+            # Upload whatever is left before stopping, without waiting to retry
+            while batch := self.get_batch(timeout=0):
+                self.upload_batch(batch, retry=False)
+        finally:
+            os.remove(PID_FILE)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Continuously uploads QR codes to raw_qr")
+    parser.add_argument(
+        "--no-stdin", action="store_true", help="Don't read QRs from stdin (e.g. a QR scanner)"
+    )
+    parser.add_argument(
+        "--port",
+        type=int,
+        default=QRIngest.DEFAULT_PORT,
+        help="Port on localhost to accept QRs on, one QR per line",
+    )
+    parser.add_argument(
+        "--directory",
+        default=utils.create_file_path("data/devices"),
+        help="Directory to watch for QR files pulled from tablets",
+    )
+    args = parser.parse_args()
+
+    utils.confirm_comp()
+    QRIngest().run(not args.no_stdin, args.port, args.directory)
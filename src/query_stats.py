@@ -0,0 +1,185 @@
+"""Finds calculations that query the database in loops (N+1 queries).
+
+When the SCOUTING_SERVER_QUERY_STATS environment variable is set, every `Database` and
+`BetterDatabase` method decorated with `track` counts its calls and wall time by (caller,
+collection, method, query shape). The query shape is the query with every value replaced by its
+type, so `find("obj_tim", {"team_number": "1678"})` and `find("obj_tim", {"team_number": "254"})`
+have the same shape. At the end of each cycle, `end_cycle` warns about every shape ran more than
+SCOUTING_SERVER_QUERY_STATS_THRESHOLD times (20 by default) by the same caller, prints the slowest
+shapes, and writes the full report to `data/logs/query_stats.json`.
+
+When the environment variable isn't set, `track` returns methods unchanged, so there is no cost.
+
+Usage:
+SCOUTING_SERVER_QUERY_STATS=1 python3 src/server.py
+"""
+
+import functools
+import inspect
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from typing import Dict, List, Optional
+
+from rich.table import Table
+
+from console import console
+import metrics
+import utils
+
+log = logging.getLogger(__name__)
+
+ENABLED = os.environ.get("SCOUTING_SERVER_QUERY_STATS", "") not in ["", "0", "false"]
+# Calls of the same query shape by the same caller in one cycle before it is flagged
+REPEAT_THRESHOLD = int(os.environ.get("SCOUTING_SERVER_QUERY_STATS_THRESHOLD", 20))
+# Number of query shapes printed at the end of each cycle
+REPORT_ROWS = 15
+REPORT_FILE = "data/logs/query_stats.json"
+
+# Calls and seconds by (caller, collection, method, query shape) since the start of the cycle
+_stats: Dict[tuple, List] = {}
+_stats_lock = threading.Lock()
+# Whether each thread is inside a tracked method, so methods calling each other are counted once
+_tracking = threading.local()
+
+
+def get_query_shape(query) -> str:
+    """Returns 'query' with its values replaced by their types, keeping keys and operators"""
+
+    def get_shape(value):
+        if isinstance(value, dict):
+            return {key: get_shape(item) for key, item in value.items()}
+        if isinstance(value, (list, tuple)):
+            # Lists are usually values of operators like $in, so their length doesn't matter
+            return [get_shape(value[0])] if value else []
+        return type(value).__name__
+
+    if query is None:
+        return "{}"
+    return json.dumps(get_shape(query), sort_keys=True)
+
+
+def get_caller() -> str:
+    """Returns the calculation running in this thread, or the function calling the database"""
+    if (calc_metrics := metrics.get_current()) is not None:
+        return calc_metrics.calc_name
+    # Skip this function and the `track` wrapper
+    frame = sys._getframe(2)
+    return f"{frame.f_globals.get('__name__')}.{frame.f_code.co_name}"
+
+
+def record(key: tuple, seconds: float) -> None:
+    """Counts a call of 'key' that took 'seconds'"""
+    with _stats_lock:
+        if key not in _stats:
+            _stats[key] = [0, 0.0]
+        _stats[key][0] += 1
+        _stats[key][1] += seconds
+
+
+def track(collection: Optional[str] = None):
+    """Decorates a database method to count its calls when query stats are enabled
+
+    The collection and query are read from the method's 'collection' and 'query' arguments.
+    'collection' is used for methods that always use the same collection (e.g. `get_tba_cache`).
+    """
+
+    def decorator(method):
+        if not ENABLED:
+            return method
+        parameters = list(inspect.signature(method).parameters)
+
+        def get_argument(name, args, kwargs, default=None):
+            if name in kwargs:
+                return kwargs[name]
+            if name in parameters and parameters.index(name) < len(args):
+                return args[parameters.index(name)]
+            return default
+
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            if getattr(_tracking, "active", False):
+                return method(*args, **kwargs)
+            key = (
+                get_caller(),
+                collection or get_argument("collection", args, kwargs),
+                method.__name__,
+                get_query_shape(get_argument("query", args, kwargs)),
+            )
+            _tracking.active = True
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                _tracking.active = False
+                record(key, time.perf_counter() - start)
+
+        return wrapper
+
+    return decorator
+
+
+def get_report() -> List[dict]:
+    """Returns the stats of each query shape since the start of the cycle, slowest first"""
+    with _stats_lock:
+        stats = dict(_stats)
+    report = [
+        {
+            "caller": caller,
+            "collection": collection,
+            "method": method,
+            "query_shape": query_shape,
+            "calls": calls,
+            "seconds": seconds,
+            "repeated": calls > REPEAT_THRESHOLD,
+        }
+        for (caller, collection, method, query_shape), (calls, seconds) in stats.items()
+    ]
+    return sorted(report, key=lambda row: row["seconds"], reverse=True)
+
+
+def create_table(report: List[dict]) -> Table:
+    """Returns a table of the slowest query shapes in 'report'"""
+    table = Table(title=f"Slowest queries (flagged over {REPEAT_THRESHOLD} calls)")
+    table.add_column("Caller", no_wrap=True)
+    table.add_column("Query")
+    table.add_column("Calls", justify="right")
+    table.add_column("Total s", justify="right")
+    for row in report[:REPORT_ROWS]:
+        table.add_row(
+            row["caller"],
+            f"{row['method']}({row['collection']}, {row['query_shape']})",
+            f"[bold red]{row['calls']}[/]" if row["repeated"] else str(row["calls"]),
+            f"{row['seconds']:.3f}",
+        )
+    return table
+
+
+def end_cycle() -> Optional[List[dict]]:
+    """Reports the query stats of this cycle and starts counting a new cycle
+
+    Returns the report, or None if query stats are disabled.
+    """
+    if not ENABLED:
+        return None
+    report = get_report()
+    with _stats_lock:
+        _stats.clear()
+    for row in report:
+        if row["repeated"]:
+            log.warning(
+                f"Possible N+1 query: {row['caller']} ran {row['method']} on {row['collection']} "
+                f"{row['calls']} times with the query {row['query_shape']}, consider loading the "
+                "documents once with `Database.group_by`"
+            )
+    if report:
+        console.print(create_table(report))
+    try:
+        with open(utils.create_file_path(REPORT_FILE), "w") as report_file:
+            json.dump(report, report_file, indent=2)
+    except OSError as err:
+        log.error(f"Unable to write query stats to {REPORT_FILE}: {err}")
+    return report
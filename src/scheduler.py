@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+
+"""Schedules calculations based on MongoDB change streams instead of running every calculation
+every cycle.
+
+A calculation is triggered by changes to the collections it reads, its `inputs` from
+`calculations.yml` (or its `watched_collections` if it has no `inputs`). Calculations that only pull
+data from outside the database (those without any, such as QRInput and TBATIMCalc) run once per
+cycle. Calculations write to collections read by other calculations, so their dependents are
+triggered by the changes they make.
+"""
+
+import logging
+import time
+from typing import Iterable, List, Set
+
+import pymongo.errors
+
+log = logging.getLogger(__name__)
+
+
+class CalculationScheduler:
+    """Runs calculations when the collections they watch change"""
+
+    # Seconds without any changes before triggered calculations are run
+    DEBOUNCE_SECONDS = 2
+    # Longest time to keep collecting changes before running calculations anyway
+    MAX_DEBOUNCE_SECONDS = 15
+    # Longest time to wait for a change before going back to the calculations without watched
+    # collections (e.g. to pull new TBA data)
+    POLL_SECONDS = 60
+    # Operations that change the contents of a collection
+    CHANGE_OPERATIONS = ["insert", "update", "replace", "delete"]
+
+    def __init__(self, server):
+        self.server = server
+        # Collections that trigger each calculation, in the order from `calculations.yml`
+        self.triggers = [(calc, self.get_trigger_collections(calc)) for calc in server.calculations]
+        self.sources = [calc for calc, triggers in self.triggers if not triggers]
+        self.watched = set()
+        for _, triggers in self.triggers:
+            self.watched.update(triggers)
+        self.stream = self.open_stream()
+        # Run every calculation on the first cycle since there is no previous state to compare to
+        self.first_cycle = True
+
+    @staticmethod
+    def get_trigger_collections(calc) -> Set[str]:
+        """Returns the collections whose changes trigger 'calc'"""
+        if calc.inputs is not None:
+            return set(calc.inputs)
+        if isinstance(calc.watched_collections, list):
+            return set(calc.watched_collections)
+        return set()
+
+    def open_stream(self):
+        """Opens a change stream on the watched collections of the local database
+
+        Returns None if change streams are unavailable (e.g. mongod is not a replica set)
+        """
+        pipeline = [
+            {
+                "$match": {
+                    "ns.coll": {"$in": sorted(self.watched)},
+                    "operationType": {"$in": self.CHANGE_OPERATIONS},
+                }
+            }
+        ]
+        try:
+            return self.server.local_db.db.watch(
+                pipeline, max_await_time_ms=self.DEBOUNCE_SECONDS * 1000
+            )
+        except pymongo.errors.PyMongoError as err:
+            log.warning(
+                f"Unable to open change stream, running every calculation each cycle: {err}"
+            )
+            return None
+
+    def wait_for_changes(self, timeout: float) -> Set[str]:
+        """Returns the names of the watched collections that changed
+
+        Waits up to `timeout` seconds for the first change, then keeps collecting changes until
+        none happen for `DEBOUNCE_SECONDS` so a burst of writes only triggers calculations once.
+        """
+        changed = set()
+        deadline = time.time() + timeout
+        debounce_deadline = None
+        while True:
+            try:
+                change = self.stream.try_next()
+            except pymongo.errors.PyMongoError as err:
+                log.error(f"Change stream failed, reopening: {err}")
+                self.stream = self.open_stream()
+                # Changes may have been missed, so treat every watched collection as changed
+                return set(self.watched)
+            if change is not None:
+                changed.add(change["ns"]["coll"])
+                if debounce_deadline is None:
+                    debounce_deadline = time.time() + self.MAX_DEBOUNCE_SECONDS
+                if time.time() < debounce_deadline:
+                    continue
+            # No changes for the last DEBOUNCE_SECONDS or debounced for too long
+            if changed or time.time() >= deadline:
+                return changed
+
+    def get_triggered_calculations(self, changed: Set[str], ran: Iterable = ()) -> List:
+        """Returns the calculations reading any of the `changed` collections, in the order from
+        `calculations.yml`
+
+        `ran` are the calculations that ran since the changes started being collected, in order.
+        Each of them already read what it and the calculations before it wrote, so those changes
+        don't trigger it again. Collections also written by later calculations (e.g. DataFlagging
+        writing obj_tim) still trigger earlier calculations that read them.
+        """
+        ran = list(ran)
+        seen_by_calc = {}
+        written_later = set()
+        for index in reversed(range(len(ran))):
+            seen_outputs = set()
+            for calc in ran[: index + 1]:
+                seen_outputs.update(calc.outputs or [])
+            seen_by_calc[id(ran[index])] = seen_outputs - written_later
+            written_later.update(ran[index].outputs or [])
+        return [
+            calc
+            for calc, triggers in self.triggers
+            if (changed - seen_by_calc.get(id(calc), set())) & triggers
+        ]
+
+    def run_cycle(self) -> None:
+        """Runs the calculations without inputs, then the calculations triggered by changes until
+        the database stops changing
+
+        The change stream stays open while calculations run, so changes written during a run
+        (including by other processes) trigger the calculations that read them afterwards.
+        """
+        if self.stream is None:
+            self.server.run_calculations()
+            return
+        if self.first_cycle:
+            self.first_cycle = False
+            ran = self.server.calculations
+            self.server.run_calculations()
+            # Only drain the changes made by the calculations that just ran
+            timeout = self.DEBOUNCE_SECONDS
+        else:
+            ran = self.sources
+            self.server.run_calculations(self.sources)
+            timeout = self.POLL_SECONDS
+        while self.stream is not None and (changed := self.wait_for_changes(timeout)):
+            triggered = self.get_triggered_calculations(changed, ran)
+            log.info(
+                f"Changes to {sorted(changed)} triggered {[type(calc).__name__ for calc in triggered]}"
+            )
+            if triggered:
+                self.server.run_calculations(triggered)
+            ran = triggered
+            # Pick up the changes made by the triggered calculations without waiting for a poll
+            timeout = self.DEBOUNCE_SECONDS
@@ -2,20 +2,30 @@
 
 """Contains the server class."""
 import console  # DON'T DELETE THIS LINE. This initializes the logging system
+import argparse
+import concurrent.futures
 import importlib
-from typing import List, Type
+import threading
+import time
+from typing import Dict, List, Optional, Set, Type
 
 import yaml
 import json
 
 from calculations import base_calculations
+import cloud_sync
 import database
 import utils
 import console
 import logging
 import os
-import time
 import doozernet_communicator
+import match_index
+import metrics
+import profiler
+import query_stats
+import scheduler
+import tba_communicator
 
 log = logging.getLogger("server")
 
@@ -42,7 +52,8 @@ class Server:
         "predicted_aim",
         "predicted_alliances",
         "predicted_team",
-        # "predicted_elims",
+        "predicted_elims",
+        "predicted_elims_odds",
         "pickability",
         # "raw_obj_pit",
         "raw_qr",
@@ -58,36 +69,71 @@ class Server:
         "flagged_data",
     ]
 
-    def __init__(self, write_cloud=False, has_internet=True):
+    # Most calculations are waiting on MongoDB or TBA, so threads are enough to run them in parallel
+    MAX_WORKERS = 8
+
+    def __init__(
+        self,
+        write_cloud=False,
+        has_internet=True,
+        incremental=True,
+        serial=False,
+        calc_profiler: Optional[profiler.CalculationProfiler] = None,
+    ):
         self.has_internet = has_internet
+        self.incremental = incremental
+        # Profiles each calculation run, see `profiler.py`
+        self.calc_profiler = calc_profiler
+        # Run calculations one at a time in the order of `calculations.yml`, used for debugging.
+        # Profiles can't tell calculations running at the same time apart
+        self.serial = serial or calc_profiler is not None
+        # Document hashes of each calculation's watched collections as of its last run
+        self.seen_hashes: Dict[str, Dict[str, Dict[tuple, str]]] = {}
+        # Shared by calculations during a cycle, see `get_match_index`
+        self.match_index = None
+        self.match_index_lock = threading.Lock()
         if has_internet:
             self.dn_model = doozernet_communicator.check_model_availability()
         else:
             self.dn_model = None
 
         self.local_db = database.Database()
+        # Per calculation and per cycle metrics, see `metrics.py`
+        self.metrics_collector = metrics.MetricsCollector(self.local_db)
         if write_cloud:
             self.cloud_db = database.BetterDatabase(utils.server_key(), True)
+            self.cloud_sync_worker = cloud_sync.CloudSyncWorker(
+                cloud_sync.CloudSync(self.local_db, self.cloud_db, self.VALID_COLLECTIONS)
+            )
         else:
             self.cloud_db = None
+            self.cloud_sync_worker = None
         self.write_cloud = write_cloud
         self.MATCH_SCHEDULE = utils.get_match_schedule()
         self.TEAM_LIST = utils.get_team_list()
 
         self.calculations = self.load_calculations()
 
-    # TODO: optimize this function, this takes a really long time (especially on the old server computer)
+    # Number of the slowest calculations to list in the startup time breakdown
+    SLOWEST_CALCULATIONS_SHOWN = 5
+
     def load_calculations(self) -> List["base_calculations.BaseCalculations"]:
-        """Imports calculation modules and creates instances of calculation classes."""
+        """Imports calculation modules and creates instances of calculation classes.
+
+        Logs how long importing and instantiating each calculation took, see `log_startup_times`.
+        """
+        start_time = time.perf_counter()
 
         # Prepare terminal
         print()
 
         with open(self.CALCULATIONS_FILE) as f:
-            calculation_load_list = yaml.load(f, Loader=yaml.Loader)
+            calculation_load_list = yaml.load(f, Loader=utils.YAML_LOADER)
 
         num_calcs = len(calculation_load_list)
         loaded_calcs = []
+        # Seconds spent importing and instantiating each calculation, keyed by calculation name
+        startup_times: Dict[str, Dict[str, float]] = {}
 
         count = 1
         # `calculations.yml` is a list of dictionaries, each with an "import_path" and "class_name"
@@ -98,13 +144,20 @@ class Server:
                 utils.progress_bar(count, num_calcs)
                 count += 1
                 continue
+            calc_times = startup_times.setdefault(
+                f'{calc["import_path"]}.{calc["class_name"]}', {"import": 0.0, "init": 0.0}
+            )
             # Import the module
+            import_start = time.perf_counter()
             try:
                 module = importlib.import_module(calc["import_path"])
             except Exception as e:
                 log.error(f'{e.__class__.__name__} importing {calc["import_path"]}: {e}')
                 continue
+            finally:
+                calc_times["import"] += time.perf_counter() - import_start
             # Get calculation class from module
+            init_start = time.perf_counter()
             try:
                 cls: Type["base_calculations.BaseCalculations"] = getattr(
                     module, calc["class_name"]
@@ -113,7 +166,11 @@ class Server:
                 # We pass `self` as the only argument to the `__init__` method of the calculation
                 # class so the calculations can get access to server instance variables such as the
                 # oplog or the database
-                loaded_calcs.append(cls(self))
+                calc_instance = cls(self)
+                calc_instance.inputs = calc.get("inputs")
+                calc_instance.outputs = calc.get("outputs")
+                loaded_calcs.append(calc_instance)
+                calc_times["init"] += time.perf_counter() - init_start
 
                 # Display progress bar
                 utils.progress_bar(count, num_calcs)
@@ -124,43 +181,206 @@ class Server:
                 )
 
         utils.print()
+        self.log_startup_times(startup_times, time.perf_counter() - start_time)
         return loaded_calcs
 
-    def run_calculations(self):
-        """Run each calculation in `self.calculations` in order"""
-        for calc in self.calculations:
+    def log_startup_times(self, startup_times: Dict[str, Dict[str, float]], total: float) -> None:
+        """Logs the total time spent loading calculations and the slowest calculations to load
+
+        Imports of modules shared between calculations are only counted for the first calculation
+        that imports them.
+        """
+        import_time = sum(times["import"] for times in startup_times.values())
+        init_time = sum(times["init"] for times in startup_times.values())
+        log.info(
+            f"Loaded calculations in {total:.2f} sec ({import_time:.2f} sec importing, "
+            f"{init_time:.2f} sec instantiating)"
+        )
+        slowest = sorted(
+            startup_times.items(), key=lambda item: sum(item[1].values()), reverse=True
+        )[: self.SLOWEST_CALCULATIONS_SHOWN]
+        for name, times in slowest:
+            log.info(
+                f"  {name}: {times['import']:.2f} sec importing, {times['init']:.2f} sec instantiating"
+            )
+
+    @staticmethod
+    def get_changed_keys(old_hashes: Dict[tuple, str], new_hashes: Dict[tuple, str]) -> Set[tuple]:
+        """Returns the keys that were added, removed, or modified between two sets of hashes"""
+        return {
+            key
+            for key in old_hashes.keys() | new_hashes.keys()
+            if old_hashes.get(key) != new_hashes.get(key)
+        }
+
+    @staticmethod
+    def get_dependencies(calculations: list) -> Dict[int, Set[int]]:
+        """Returns the indexes of the calculations each calculation has to wait for
+
+        A calculation depends on an earlier calculation if one writes to a collection the other
+        reads from or writes to. Calculations with unknown outputs depend on every earlier
+        calculation, and every later calculation depends on them.
+        """
+        dependencies = {index: set() for index in range(len(calculations))}
+        for later_index, later in enumerate(calculations):
+            for earlier_index, earlier in enumerate(calculations[:later_index]):
+                if earlier.outputs is None or later.outputs is None:
+                    dependencies[later_index].add(earlier_index)
+                    continue
+                earlier_inputs = set(earlier.inputs or [])
+                later_inputs = set(later.inputs or [])
+                earlier_outputs = set(earlier.outputs)
+                later_outputs = set(later.outputs)
+                if (
+                    earlier_outputs & later_inputs
+                    or earlier_inputs & later_outputs
+                    or earlier_outputs & later_outputs
+                ):
+                    dependencies[later_index].add(earlier_index)
+        return dependencies
+
+    def get_match_index(self) -> match_index.MatchIndex:
+        """Returns the match index of the current cycle, building it if it's outdated"""
+        with self.match_index_lock:
+            if self.match_index is None:
+                # Falls back to cached TBA data without internet
+                tba_matches = tba_communicator.tba_request(f"event/{self.TBA_EVENT_KEY}/matches")
+                self.match_index = match_index.MatchIndex(
+                    self.local_db.find("obj_tim"),
+                    tba_matches or [],
+                    base_calculations.BaseCalculations.get_aim_list(),
+                )
+            return self.match_index
+
+    def update_match_index(self, calc: "base_calculations.BaseCalculations") -> None:
+        """Marks the match index as outdated if `calc` wrote to a collection it indexes"""
+        if calc.outputs is None or set(calc.outputs) & set(match_index.MatchIndex.COLLECTIONS):
+            with self.match_index_lock:
+                self.match_index = None
+
+    def run_calculation(self, calc: "base_calculations.BaseCalculations") -> None:
+        """Runs a single calculation and records its metrics, see `metrics.py`
+
+        In incremental mode, calculations that support it are only given the keys that changed in
+        their watched collections since their last run, and are skipped if nothing changed.
+        """
+        with metrics.record(type(calc).__name__) as calc_metrics:
+            try:
+                calc_metrics.skipped = not self._run_calculation(calc)
+            finally:
+                self.metrics_collector.add(calc_metrics)
+
+    def run_calculation_method(self, calc: "base_calculations.BaseCalculations") -> None:
+        """Calls the `run` method of 'calc', under the profiler if profiling is on"""
+        if self.calc_profiler is None:
+            calc.run()
+            return
+        with self.calc_profiler.profile(type(calc).__name__):
             calc.run()
 
-    def run(self):
-        """Starts server cycles, runs in infinite loop"""
-        while True:
-            self.run_calculations()
-            if self.write_cloud:
-                for collection in self.VALID_COLLECTIONS:
-                    curr_time = time.time()
+    def _run_calculation(self, calc: "base_calculations.BaseCalculations") -> bool:
+        """Runs a single calculation, see `run_calculation`
 
-                    data = self.local_db.find(collection)
+        Returns False if the calculation was skipped because nothing changed.
+        """
+        if not self.incremental or not calc.INCREMENTAL:
+            self.run_calculation_method(calc)
+            return True
+        calc_name = type(calc).__name__
+        # Hash the inputs before running so changes made during the run are seen next cycle
+        current_hashes = {
+            collection: self.local_db.get_document_hashes(collection)
+            for collection in calc.watched_collections
+        }
+        current_hashes.update(calc.get_external_hashes())
+        if (previous_hashes := self.seen_hashes.get(calc_name)) is None:
+            calc.dirty_keys = None
+        else:
+            calc.dirty_keys = {
+                name: self.get_changed_keys(previous_hashes.get(name, {}), hashes)
+                for name, hashes in current_hashes.items()
+            }
+            if not any(calc.dirty_keys.values()):
+                log.info(f"{calc_name}: no changes to {list(current_hashes)}, skipping")
+                return False
+        self.run_calculation_method(calc)
+        self.seen_hashes[calc_name] = current_hashes
+        return True
+
+    def run_calculations(self, calculations=None):
+        """Run each calculation in `calculations` (defaults to `self.calculations`)
 
-                    if data:
-                        self.cloud_db.delete_documents(collection, dict(), bypass_raw=True)
+        Calculations that don't depend on each other (see `get_dependencies`) are ran at the same
+        time unless `self.serial` is set, in which case they are ran in order.
+        """
+        if calculations is None:
+            calculations = self.calculations
+        # Only request each TBA endpoint once while these calculations run
+        tba_communicator.start_cycle()
+        self.match_index = None
+        if self.serial:
+            for calc in calculations:
+                self.run_calculation(calc)
+                self.update_match_index(calc)
+            return
 
-                        cleaned_data = []
-                        for item in data:
-                            item.pop("_id")
-                            cleaned_data.append(item)
+        dependencies = self.get_dependencies(calculations)
+        pending = set(range(len(calculations)))
+        finished = set()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.MAX_WORKERS) as executor:
+            running = {}
+            while pending or running:
+                # Start every calculation whose dependencies have all finished
+                for index in sorted(pending):
+                    if dependencies[index] <= finished:
+                        pending.remove(index)
+                        future = executor.submit(self.run_calculation, calculations[index])
+                        running[future] = index
+                done, _ = concurrent.futures.wait(
+                    running, return_when=concurrent.futures.FIRST_COMPLETED
+                )
+                for future in done:
+                    index = running.pop(future)
+                    finished.add(index)
+                    # Raise errors from calculations the same way running them in order would
+                    future.result()
+                    self.update_match_index(calculations[index])
 
-                        self.cloud_db.insert_documents(collection, cleaned_data)
+    def run(self):
+        """Starts server cycles, runs in infinite loop
 
-                        log.info(
-                            f"Inserted collection {collection} into the cloud DB. ({round(time.time() - curr_time, 1)} sec)"
-                        )
-                    else:
-                        log.error(
-                            f"No data found in collection {collection} in local DB, cannot update to the cloud DB."
-                        )
+        Calculations are only ran when the collections they watch change, see `scheduler.py`.
+        Changes to the local database are sent to the cloud in a background thread, see
+        `cloud_sync.py`. The metrics of each cycle are stored and summarized after it, see
+        `metrics.py` and `query_stats.py`
+        """
+        calculation_scheduler = scheduler.CalculationScheduler(self)
+        if self.write_cloud:
+            self.cloud_sync_worker.start()
+        while True:
+            self.metrics_collector.start_cycle()
+            calculation_scheduler.run_cycle()
+            self.metrics_collector.end_cycle()
+            query_stats.end_cycle()
+            if self.calc_profiler is not None:
+                self.calc_profiler.write()
+            if self.write_cloud:
+                status = self.cloud_sync_worker.get_status()
+                log.info(
+                    f"Cloud sync: {status['queue_depth']} documents waiting, {status['lag_seconds']} sec behind"
+                )
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Runs the server calculations")
+    parser.add_argument(
+        "--serial",
+        action="store_true",
+        help="Run calculations one at a time in the order of calculations.yml",
+    )
+    profiler.add_arguments(parser)
+    args = parser.parse_args()
+
     utils.confirm_comp()
 
     has_internet = utils.has_internet()
@@ -184,5 +404,7 @@ if __name__ == "__main__":
             utils.confirm_comp(
                 "You're writing to the cloud DB, but you're NOT in production mode. Is this right?"
             )
-    server = Server(write_cloud, has_internet)
+    server = Server(
+        write_cloud, has_internet, serial=args.serial, calc_profiler=profiler.from_args(args)
+    )
     server.run()
@@ -3,7 +3,6 @@
 """Sets up the MongoDB database for a competition, should be run before every competition."""
 
 import re
-from pymongo import MongoClient
 import utils
 import logging
 import tba_communicator
@@ -15,7 +14,7 @@ log = logging.getLogger("setup_competition")
 
 
 def setup_connection(specifier, COMPETITION_KEY):
-    CLIENT = MongoClient(specifier)
+    CLIENT = database.get_client(specifier)
     # Checks that the competition inputted by the user is not already in the database
     if COMPETITION_KEY in CLIENT.list_database_names():
         log.info(f"WARNING: The competition {COMPETITION_KEY} already exists.")
@@ -44,7 +43,8 @@ if __name__ == "__main__":
     if CODE_MATCH is None:
         raise ValueError("Competition code is not in the correct format")
 
-    setup_connection("mongodb://localhost:1678", COMPETITION_KEY)
+    # Starts mongod if it isn't running
+    setup_connection("localhost", COMPETITION_KEY)
 
     # Create match schedule and team list
     tba_communicator.create_match_schedule(COMPETITION_KEY)
@@ -1,7 +1,9 @@
 import statbotics
 import requests
 import logging
+import time
 from typing import Union
+import metrics
 import utils
 
 log = logging.getLogger("statbotics_communicator")
@@ -23,11 +25,14 @@ def statbotics_request(api_url: str, params: dict[str, str] = dict()) -> Union[d
         else f"https://api.statbotics.io/v3/{api_url}"
     )
 
+    request_start = time.perf_counter()
     try:
         request = requests.get(full_url)
     except requests.exceptions.ConnectionError:
         log.error("Error: No internet connection.")
         return None
+    finally:
+        metrics.record_request("statbotics", time.perf_counter() - request_start)
 
     return request.json()
 
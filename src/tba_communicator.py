@@ -5,18 +5,32 @@
 API documentation: https://www.thebluealliance.com/apidocs/v3.
 """
 
+import pymongo.errors
 import requests
+import metrics
 import utils
 import logging
 import json
-from typing import Dict
+from typing import Any, Dict, Optional
 import copy
 import datetime
-import httpx
+import re
+import threading
+import time
 import asyncio
 
 log = logging.getLogger(__name__)
 
+# Responses cached for the current server cycle, keyed by (api_url, modify). Caching is off until
+# `start_cycle` is called so scripts outside of the server always get fresh data
+_cycle_cache: Dict[tuple, Any] = {}
+_cycle_cache_enabled = False
+# One lock per request so calculations running at the same time wait for a single fetch
+_cycle_cache_locks: Dict[tuple, threading.Lock] = {}
+_cycle_cache_locks_lock = threading.Lock()
+# Database used for the persistent `tba_cache` collection, see `_get_cache_db`
+_cache_db = None
+
 ALL_EVENT_TYPES = [
     "Preseason",
     "District",
@@ -54,6 +68,16 @@ def get_reef_score(reef: dict, mode: str, row: int = 0) -> int:
     )
 
 
+def start_cycle() -> None:
+    """Clears responses cached during the last server cycle and caches responses until the next
+    call, so each endpoint is only requested once per cycle"""
+    global _cycle_cache_enabled
+    with _cycle_cache_locks_lock:
+        _cycle_cache.clear()
+        _cycle_cache_locks.clear()
+        _cycle_cache_enabled = True
+
+
 def tba_request(api_url, modify=True):
     """Sends a single web request to the TBA API v3.
 
@@ -61,17 +85,104 @@ def tba_request(api_url, modify=True):
 
     `modify`: if True, we calculate certain more useful datapoints before returning it
 
-    Returns the data received by the TBA API.
+    Returns the data received by the TBA API. During a server cycle (see `start_cycle`), each
+    request is only sent once and later calls get a copy of the first response.
+    """
+    if not _cycle_cache_enabled:
+        return _send_tba_request(api_url, modify)
+
+    key = (api_url, modify)
+    with _cycle_cache_locks_lock:
+        lock = _cycle_cache_locks.setdefault(key, threading.Lock())
+    with lock:
+        if key not in _cycle_cache:
+            response = _send_tba_request(api_url, modify)
+            # Don't cache failed requests so they are retried
+            if response is None:
+                return None
+            _cycle_cache[key] = response
+        # Copy so calculations can't modify each other's data
+        return copy.deepcopy(_cycle_cache[key])
+
+
+def _get_cache_db():
+    """Returns the database holding the `tba_cache` collection, connecting on first use"""
+    global _cache_db
+    if _cache_db is None:
+        # Imported here so scripts that only talk to TBA don't start mongod
+        import database
+
+        _cache_db = database.Database()
+    return _cache_db
+
+
+def _get_max_age(cache_control: str) -> int:
+    """Returns the max-age in seconds from a Cache-Control header, or 0 if there isn't one"""
+    if match := re.search(r"max-age=(\d+)", cache_control or ""):
+        return int(match.group(1))
+    return 0
+
+
+def _get_cached_response(api_url: str) -> Optional[dict]:
+    """Returns the `tba_cache` document for `api_url`, or None if it can't be read"""
+    try:
+        return _get_cache_db().get_tba_cache(api_url)
+    except pymongo.errors.PyMongoError as err:
+        log.warning(f"Unable to read TBA cache for {api_url}: {err}")
+        return None
+
+
+def _send_tba_request(api_url, modify=True):
+    """Sends a web request to the TBA API v3, see `tba_request`
+
+    Responses are stored in the `tba_cache` collection with their ETag and expiration time. Cached
+    responses are used without a request until they expire, then TBA is asked if they changed
+    using If-None-Match. When TBA can't be reached, the cached response is used.
     """
     full_url = f"https://www.thebluealliance.com/api/v3/{api_url}"
     request_headers = {"X-TBA-Auth-Key": get_api_key()}
+    cached = _get_cached_response(api_url)
 
-    try:
-        request = requests.get(full_url, headers=request_headers)
-    except requests.exceptions.ConnectionError:
-        log.error("No internet connection.")
-        return None
-    response = request.json()
+    if cached is not None and cached.get("expires", 0) > time.time():
+        response = cached["data"]
+    else:
+        if cached is not None and cached.get("etag"):
+            request_headers["If-None-Match"] = cached["etag"]
+        request_start = time.perf_counter()
+        try:
+            request = requests.get(full_url, headers=request_headers)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+            if cached is None:
+                log.error("No internet connection.")
+                return None
+            log.warning(f"No internet connection, using cached TBA data for {api_url}")
+            request = None
+        finally:
+            metrics.record_request("tba", time.perf_counter() - request_start)
+
+        if request is None:
+            response = cached["data"]
+        elif request.status_code == 304:
+            # Data hasn't changed since it was cached
+            response = cached["data"]
+            _get_cache_db().update_tba_cache(
+                response,
+                api_url,
+                cached.get("etag"),
+                time.time() + _get_max_age(request.headers.get("Cache-Control")),
+            )
+        elif request.status_code != 200 and cached is not None:
+            log.warning(f"TBA returned {request.status_code} for {api_url}, using cached data")
+            response = cached["data"]
+        else:
+            response = request.json()
+            if request.status_code == 200:
+                _get_cache_db().update_tba_cache(
+                    response,
+                    api_url,
+                    request.headers.get("ETag"),
+                    time.time() + _get_max_age(request.headers.get("Cache-Control")),
+                )
 
     modified_response = []
     if "matches" in api_url and modify:
@@ -243,6 +354,9 @@ def get_teams_in_event(event_key: str) -> list[str]:
 
 
 async def get_team_events(team, year):
+    # httpx is slow to import and only needed for these requests
+    import httpx
+
     async with httpx.AsyncClient(headers={"X-TBA-Auth-Key": get_api_key()}, timeout=20) as client:
         resp = await client.get(
             f"https://www.thebluealliance.com/api/v3/team/frc{team}/events/{year}/simple"
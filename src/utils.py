@@ -17,7 +17,7 @@ from typing import Union
 from console import console
 import builtins
 import json
-import pandas as pd
+import pickle
 import pprint
 
 MAIN_DIRECTORY = Path(os.path.abspath(__file__)).parents[1]
@@ -25,6 +25,9 @@ log = logging.getLogger(__name__)
 
 try:
     import yaml
+
+    # The C loader (libyaml) is much faster than the pure Python loader, but isn't always installed
+    YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
 except ImportError:
     log.error("PyYaml not found, load schema is unavailable", file=sys.stderr)
 
@@ -109,6 +112,39 @@ def run_command(command, return_output=False):
         raise Exception(f"utils.run_command: unknown command {command[0]}")
 
 
+# Parsed schemas are pickled here so they don't have to be parsed again on every startup
+SCHEMA_CACHE_DIRECTORY = os.path.join(MAIN_DIRECTORY, "data", "schema_cache")
+
+
+def _get_schema_cache_path(schema_file_path: str) -> str:
+    """Returns the path of the cached copy of a schema file"""
+    return os.path.join(SCHEMA_CACHE_DIRECTORY, schema_file_path.replace("/", "_") + ".pickle")
+
+
+def _read_cached_schema(schema_file_path: str, mtime: int) -> Union[dict, None]:
+    """Returns the cached schema if it was parsed from a schema file modified at `mtime`"""
+    try:
+        with open(_get_schema_cache_path(schema_file_path), "rb") as cache_file:
+            cached_mtime, schema = pickle.load(cache_file)
+    except (OSError, pickle.UnpicklingError, EOFError, ValueError, TypeError):
+        return None
+    return schema if cached_mtime == mtime else None
+
+
+def _write_cached_schema(schema_file_path: str, mtime: int, schema: dict) -> None:
+    """Caches a parsed schema, failing to cache only makes the next startup slower"""
+    cache_path = _get_schema_cache_path(schema_file_path)
+    try:
+        os.makedirs(SCHEMA_CACHE_DIRECTORY, exist_ok=True)
+        # Write to a temporary file first so other processes never read a partial cache
+        temp_path = f"{cache_path}.{os.getpid()}.tmp"
+        with open(temp_path, "wb") as cache_file:
+            pickle.dump((mtime, schema), cache_file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, cache_path)
+    except OSError as err:
+        log.debug(f"Unable to cache {schema_file_path}: {err}")
+
+
 def _inner_read_schema(schema_file_path: str) -> dict:
     """Reads schema files and returns them as a dictionary.
 
@@ -118,9 +154,14 @@ def _inner_read_schema(schema_file_path: str) -> dict:
 
     # Opens the schema file and returns it as a dictionary
     try:
-        with open(create_file_path(schema_file_path, False), "r") as schema_file:
-            # Specify loader to avoid warnings about default loader
-            return yaml.load(schema_file, yaml.Loader)
+        full_path = create_file_path(schema_file_path, False)
+        mtime = os.stat(full_path).st_mtime_ns
+        if (schema := _read_cached_schema(schema_file_path, mtime)) is not None:
+            return schema
+        with open(full_path, "r") as schema_file:
+            schema = yaml.load(schema_file, YAML_LOADER)
+        _write_cached_schema(schema_file_path, mtime, schema)
+        return schema
     except FileNotFoundError as e:
         # TODO - use logging (waiting on #544 for better logging)
         log.error(f'file "{schema_file_path}" not found.')
@@ -410,6 +451,9 @@ def write_ld_to_file(data: list[dict], file_path: str):
         with open(file_path, "w") as f:
             f.write(json.dumps(data, indent=4))
     elif file_type == "csv":
+        # pandas is slow to import and only needed here
+        import pandas as pd
+
         pd.DataFrame(data).to_csv(file_path, index=False)
 
 
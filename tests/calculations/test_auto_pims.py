@@ -354,6 +354,8 @@ class TestAutoPIMCalc:
         assert self.test_calculator.watched_collections == [
             "unconsolidated_obj_tim",
             "sim_precision",
+            "obj_tim",
+            "tba_tim",
         ]
 
     def test_get_unconsolidated_auto_timelines(self):
@@ -20,6 +20,7 @@ class TestBaseCalculations:
     def test__init__(self):
         assert self.base_calc.server == self.test_server
         assert self.base_calc.watched_collections == NotImplemented
+        assert self.base_calc.dirty_keys is None
 
     def test_avg(self):
         # Test if there is no input
@@ -64,6 +65,25 @@ class TestBaseCalculations:
         with patch("calculations.base_calculations.open", mock_open(read_data=test_json)):
             assert BaseCalculations.get_aim_list() == expected_aim_list
 
+    def test_get_dirty_tims(self):
+        assert self.base_calc.get_dirty_tims() is None
+        self.base_calc.dirty_keys = {
+            "obj_tim": {("1678", 1), ("254", 2)},
+            "ss_tim": {("1678", 1), ("254", None)},
+        }
+        assert self.base_calc.get_dirty_tims() == [
+            {"team_number": "1678", "match_number": 1},
+            {"team_number": "254", "match_number": 2},
+        ]
+
+    def test_get_dirty_teams(self):
+        assert self.base_calc.get_dirty_teams() is None
+        self.base_calc.dirty_keys = {
+            "obj_tim": {("1678", 1), ("254", 2)},
+            "ss_team": {("1678", None), (None, None)},
+        }
+        assert self.base_calc.get_dirty_teams() == ["1678", "254"]
+
     @patch("logging.Logger.error", logging.getLogger(__name__).error)
     def test_get_teams_list(self, caplog):
         with patch("calculations.base_calculations.open", mock_open(read_data="[1,2,3]")) as _:
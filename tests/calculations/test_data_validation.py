@@ -0,0 +1,58 @@
+from unittest.mock import patch
+
+import pytest
+
+from calculations import data_validation
+from server import Server
+
+
+@pytest.mark.clouddb
+class TestDataFlagging:
+    def setup_method(self, method):
+        with patch("doozernet_communicator.check_model_availability", return_value=None), patch(
+            "utils.get_match_schedule", return_value={}
+        ):
+            self.test_server = Server()
+            self.test_calc = data_validation.DataFlagging(self.test_server)
+        self.test_server.local_db.delete_data("obj_tim")
+        self.test_server.local_db.insert_documents(
+            "obj_tim",
+            [
+                {"team_number": "1678", "match_number": 1, "alliance_color_is_red": True},
+                {"team_number": "254", "match_number": 1, "alliance_color_is_red": True},
+                {"team_number": "971", "match_number": 1, "alliance_color_is_red": False},
+                {"team_number": "1678", "match_number": 2, "alliance_color_is_red": False},
+            ],
+        )
+        for document in self.test_server.local_db.find("obj_tim"):
+            assert "flagged" not in document
+
+    def get_flagged(self):
+        return sorted(
+            (document["match_number"], document["team_number"])
+            for document in self.test_server.local_db.find("obj_tim")
+            if document.get("flagged")
+        )
+
+    def test_flag_in_obj_tims(self):
+        flags = [
+            {
+                "match_number": 1,
+                "flagged": True,
+                "flags": [{"datapoint": "total_points_diff", "alliance_color": "red"}],
+            },
+            {
+                "match_number": 2,
+                "flagged": True,
+                "flags": [{"datapoint": "auto_net_range", "team_number": "1678"}],
+            },
+            {"match_number": 3, "flagged": False, "flags": []},
+        ]
+        self.test_calc.flag_in_obj_tims(flags)
+        assert self.get_flagged() == [(1, "1678"), (1, "254"), (2, "1678")]
+        # The data of match 1 was fixed
+        self.test_calc.flag_in_obj_tims(flags[1:])
+        assert self.get_flagged() == [(2, "1678")]
+        assert self.test_server.local_db.find("obj_tim", {"match_number": 1})[0]["flagged"] is False
+        self.test_calc.flag_in_obj_tims([])
+        assert self.get_flagged() == []
@@ -131,6 +131,32 @@ class TestDecompressor:
             "timeline", "objective_tim"
         )
 
+    def test_compile_decompressed_names(self):
+        schema = {
+            "_list_data_separator": "&",
+            "section": {"_separator": "$", "first": ["A", "int"], "second": ["A", "str"]},
+            "super_compressed": {"action": {"template": "", "compressed": {}}},
+        }
+        assert {
+            "section": {"$": "_separator", "A": "first"},
+            "super_compressed": {},
+        } == decompressor.compile_decompressed_names(schema)
+
+    def test_compile_field_decoders(self):
+        decoders = decompressor.Decompressor.FIELD_DECODERS
+        # Fields without a type aren't decoded
+        assert "$" not in decoders["generic_data"]
+        assert ("schema_version", "int", None) == decoders["generic_data"]["A"]
+        assert ("timeline", ["list", "dict"], None) == decoders["objective_tim"]["W"]
+        schema = {
+            "_list_data_separator": "&",
+            "section": {"separated": ["A", "list", "int"], "sliced": ["B", "list", "str", 2]},
+        }
+        assert {
+            "A": ("separated", ["list", "int"], "&"),
+            "B": ("sliced", ["list", "str", 2], 2),
+        } == decompressor.compile_field_decoders(schema)["section"]
+
     def test_decompress_data(self):
         # Test generic data
         assert {
@@ -533,6 +559,36 @@ class TestDecompressor:
             ]
         )
 
+    def test_get_cache_key(self):
+        qr = {"data": "+A1$B34", "override": {}}
+        key = self.test_decompressor.get_cache_key(qr)
+        assert key == self.test_decompressor.get_cache_key({"data": "+A1$B34", "override": {}})
+        assert key != self.test_decompressor.get_cache_key({"data": "+A1$B35", "override": {}})
+        assert key != self.test_decompressor.get_cache_key(
+            {"data": "+A1$B34", "override": {"start_position": "1"}}
+        )
+
+    def test_decompress_qrs_cache(self):
+        qr = {
+            "data": f"+A{decompressor.Decompressor.SCHEMA['schema_file']['version']}$B34$C1230$Dv1.3$EDoozer$FFALSE%Z1678$Y14$X3$W061AB060AH$SFalse$U2$TFalse$VTRUE",
+            "ulid": "01GWSXQYKYQQ963QMT77A3NPBZ",
+            "override": {},
+        }
+        bad_qr = {"data": "+A1$B34", "ulid": "01GWSXSNSF93BQZ2GRG0C4E7AC", "override": {}}
+        cache = {}
+        output = self.test_decompressor.decompress_qrs([qr, bad_qr], cache)
+        assert len(output["unconsolidated_obj_tim"]) == 1
+        # Cached documents aren't modified by decompress_qrs
+        assert "ulid" not in cache[self.test_decompressor.get_cache_key(qr)][0]
+        assert cache[self.test_decompressor.get_cache_key(bad_qr)] is None
+        # Cached QRs aren't decompressed again
+        cache[self.test_decompressor.get_cache_key(qr)][0]["team_number"] = "254"
+        with patch.object(self.test_decompressor, "decompress_single_qr") as decompress_single_qr:
+            output = self.test_decompressor.decompress_qrs([qr, bad_qr], cache)
+        decompress_single_qr.assert_not_called()
+        assert output["unconsolidated_obj_tim"][0]["team_number"] == "254"
+        assert output["unconsolidated_obj_tim"][0]["ulid"] == qr["ulid"]
+
     def test_decompress_pit_data(self):
         raw_obj_pit = {
             "team_number": "9998",
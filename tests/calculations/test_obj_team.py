@@ -17,7 +17,7 @@ class TestOBJTeamCalc:
 
     def test___init__(self):
         """Test if attributes are set correctly"""
-        assert self.test_calc.watched_collections == ["obj_tim", "subj_tim"]
+        assert self.test_calc.watched_collections == ["obj_tim", "ss_tim", "auto_pim"]
         assert self.test_calc.server == self.test_server
 
     def test_averages(self):
@@ -2238,6 +2238,36 @@ class TestOBJTeamCalc:
     #         == 140.0
     #     )
 
+    def test_get_external_hashes(self):
+        """Tests that teams are marked dirty when their played matches or ratings change"""
+        ratings = [
+            {"team_number": "254", "matt_notes": None},
+            {"team_number": "1678", "matt_notes": None},
+        ]
+        with patch(
+            "calculations.obj_team.OBJTeamCalc.get_played_matches",
+            return_value={"254": [{}], "1678": [{}, {}]},
+        ), patch("calculations.obj_team.OBJTeamCalc.pull_robustness_ratings", return_value=ratings):
+            hashes = self.test_calc.get_external_hashes()
+        assert hashes["tba_played_matches"] == {("254", None): "1", ("1678", None): "2"}
+        assert set(hashes["robustness_ratings"]) == {("254", None), ("1678", None)}
+        new_ratings = [
+            {"team_number": "254", "matt_notes": None},
+            {"team_number": "1678", "matt_notes": "fast"},
+        ]
+        with patch(
+            "calculations.obj_team.OBJTeamCalc.get_played_matches",
+            return_value={"254": [{}, {}], "1678": [{}, {}]},
+        ), patch(
+            "calculations.obj_team.OBJTeamCalc.pull_robustness_ratings", return_value=new_ratings
+        ):
+            new_hashes = self.test_calc.get_external_hashes()
+        assert {
+            name: Server.get_changed_keys(hashes[name], new_hashes[name]) for name in hashes
+        } == {"tba_played_matches": {("254", None)}, "robustness_ratings": {("1678", None)}}
+        self.test_calc.dirty_keys = {"obj_tim": set(), "tba_played_matches": {("254", None)}}
+        assert self.test_calc.get_dirty_teams() == ["254"]
+
     def test_run(self):
         """Tests run function from src/calculations/obj_team.py"""
         obj_tims = [
@@ -679,6 +679,8 @@ class TestObjTIMCalcs:
 
     @mock.patch("logging.Logger.warning", logging.getLogger(__name__).warning)
     def test_in_list_check1(self, caplog):
+        # Without inputs there are no documents to write, which is warned about
+        self.test_server.local_db.delete_data("unconsolidated_totals")
         with patch("tba_communicator.tba_request", return_value=self.tba_test_data):
             self.test_calculator.run()
         assert len([rec.message for rec in caplog.records if rec.levelname == "WARNING"]) > 0
@@ -1,5 +1,6 @@
 from calculations import predicted_aim
 from unittest.mock import patch
+import copy
 import server
 import pytest
 import pandas as pd
@@ -122,8 +123,8 @@ class TestPredictedAimCalc:
             {
                 "match_number": 1,
                 "alliance_color_is_red": False,
-                "has_tim_data": True,
-                "full_tim_data": True,
+                "has_tim_data": False,
+                "full_tim_data": False,
                 "has_tba_data": True,
                 "_auto_net": 9,
                 "_auto_processor": 12,
@@ -201,8 +202,8 @@ class TestPredictedAimCalc:
             {
                 "match_number": 2,
                 "alliance_color_is_red": False,
-                "has_tim_data": True,
-                "full_tim_data": True,
+                "has_tim_data": False,
+                "full_tim_data": False,
                 "has_tba_data": False,
                 "_auto_net": 9,
                 "_auto_processor": 12,
@@ -275,8 +276,8 @@ class TestPredictedAimCalc:
             {
                 "match_number": 3,
                 "alliance_color_is_red": False,
-                "has_tim_data": True,
-                "full_tim_data": True,
+                "has_tim_data": False,
+                "full_tim_data": False,
                 "has_tba_data": True,
                 "_auto_net": 9,
                 "_auto_processor": 12,
@@ -364,8 +365,8 @@ class TestPredictedAimCalc:
             {
                 "match_number": 1,
                 "alliance_color_is_red": False,
-                "has_tim_data": True,
-                "full_tim_data": True,
+                "has_tim_data": False,
+                "full_tim_data": False,
                 "has_tba_data": True,
                 "_auto_net": 9,
                 "_auto_processor": 12,
@@ -443,8 +444,8 @@ class TestPredictedAimCalc:
             {
                 "match_number": 2,
                 "alliance_color_is_red": False,
-                "has_tim_data": True,
-                "full_tim_data": True,
+                "has_tim_data": False,
+                "full_tim_data": False,
                 "has_tba_data": False,
                 "_auto_net": 9,
                 "_auto_processor": 12,
@@ -517,8 +518,8 @@ class TestPredictedAimCalc:
             {
                 "match_number": 3,
                 "alliance_color_is_red": False,
-                "has_tim_data": True,
-                "full_tim_data": True,
+                "has_tim_data": False,
+                "full_tim_data": False,
                 "has_tba_data": True,
                 "_auto_net": 9,
                 "_auto_processor": 12,
@@ -997,6 +998,79 @@ class TestPredictedAimCalc:
             "won_match": False,
         }
 
+    def test_feature_matrix(self):
+        """Test that the feature matrix predicts the same values as predicting one alliance"""
+        matrix = self.test_calc.get_feature_matrix(self.obj_team, self.tba_team)
+        alliances = [aim["team_list"] for aim in self.aims_list]
+        predicted_values = matrix.calc_predicted_values(alliances)
+        scores = matrix.predict_values(predicted_values)
+        auto_scores = matrix.predict_values(predicted_values, ["auto_net", "auto_leave"])
+        barge_rps = matrix.calc_barge_rps(predicted_values)
+        coral_rps = matrix.calc_coral_rps(predicted_values)
+        auto_rps = matrix.calc_auto_rps(predicted_values)
+        for row, alliance in enumerate(alliances):
+            expected = self.test_calc.calc_predicted_values(self.obj_team, self.tba_team, alliance)
+            assert dict(zip(matrix.features, predicted_values[row].tolist())) == expected
+            assert scores[row] == self.test_calc.predict_value(expected)
+            assert auto_scores[row] == self.test_calc.predict_value(
+                expected, ["auto_net", "auto_leave"]
+            )
+            assert barge_rps[row] == self.test_calc.calc_barge_rp(expected)
+            assert coral_rps[row] == self.test_calc.calc_coral_rp(expected)
+            assert auto_rps[row] == self.test_calc.calc_auto_rp(expected)
+
+        # Teams without data add nothing
+        assert matrix.calc_predicted_values([["1678", "9999"]]).tolist() == [
+            list(
+                self.test_calc.calc_predicted_values(
+                    self.obj_team, self.tba_team, ["1678"]
+                ).values()
+            )
+        ]
+        assert matrix.calc_win_chances(
+            [alliances[0], alliances[3]], [alliances[1], alliances[2]]
+        ) == [
+            self.test_calc.calc_win_chance(self.obj_team, {"R": alliances[0], "B": alliances[1]}),
+            self.test_calc.calc_win_chance(self.obj_team, {"R": alliances[3], "B": alliances[2]}),
+        ]
+
+    def test_feature_matrix_missing_data(self):
+        """Tests that a team with None or missing fields doesn't stop other alliances from being
+        predicted"""
+        obj_team = copy.deepcopy(self.obj_team)
+        broken_team = obj_team[0]
+        broken_team["auto_avg_net"] = None
+        win_chance_field = next(iter(self.test_calc.schema["--win_chance"].values()))
+        del broken_team[win_chance_field["sd"]]
+        matrix = self.test_calc.get_feature_matrix(obj_team, self.tba_team)
+        expected_matrix = self.test_calc.get_feature_matrix(self.obj_team, self.tba_team)
+        row = matrix.rows[broken_team["team_number"]]
+        assert not matrix.value_mask[row, matrix.features.index("auto_net")]
+        assert matrix.value_mask[row].sum() == len(matrix.features) - 1
+        assert matrix.values[row, matrix.features.index("auto_net")] == 0
+        assert not matrix.win_chance_mask[row]
+        assert matrix.means[row] == matrix.variances[row] == 0
+        # Alliances without the team are predicted the same as with complete data
+        alliances = [
+            aim["team_list"]
+            for aim in self.aims_list
+            if broken_team["team_number"] not in aim["team_list"]
+        ]
+        assert alliances
+        assert (
+            matrix.calc_predicted_values(alliances).tolist()
+            == expected_matrix.calc_predicted_values(alliances).tolist()
+        )
+
+    def test_feature_matrix_played_team_without_data(self):
+        self.test_calc.played_teams = ["9999"]
+        matrix = self.test_calc.get_feature_matrix(self.obj_team, self.tba_team)
+        with patch.object(predicted_aim.log, "critical") as mock_critical:
+            matrix.calc_win_chances([["1678", "9999"]], [["254", "8888"]])
+        mock_critical.assert_called_once_with(
+            "no obj_team data for team 9999, cannot calculate win chance"
+        )
+
     def test_filter_aims_list(self):
         assert (
             self.test_calc.filter_aims_list(self.obj_team, self.tba_team, self.aims_list)
@@ -1011,6 +1085,42 @@ class TestPredictedAimCalc:
         ):
             assert self.test_calc.update_predicted_aim(self.aims_list) == self.expected_updates
 
+    def test_update_predicted_aim_tim_data(self):
+        """Tests that both alliances in a match only count obj_tims from that match"""
+        self.test_server.local_db.delete_data("predicted_aim")
+        self.test_server.local_db.delete_data("obj_tim")
+        self.test_server.local_db.insert_documents(
+            "obj_tim",
+            [
+                # Blue alliance of match 1
+                {"team_number": "125", "match_number": 1},
+                {"team_number": "1323", "match_number": 1},
+                {"team_number": "5940", "match_number": 1},
+                # Red alliance of match 2
+                {"team_number": "1678", "match_number": 2},
+            ],
+        )
+        self.test_server.match_index = None
+        with patch("tba_communicator.tba_request", return_value=self.tba_match_data):
+            updates = self.test_calc.update_predicted_aim(self.aims_list)
+        self.test_server.local_db.delete_data("obj_tim")
+        assert [
+            (
+                update["match_number"],
+                update["alliance_color_is_red"],
+                update["has_tim_data"],
+                update["full_tim_data"],
+            )
+            for update in updates
+        ] == [
+            (1, True, False, False),
+            (1, False, True, True),
+            (2, True, True, False),
+            (2, False, False, False),
+            (3, True, False, False),
+            (3, False, False, False),
+        ]
+
     def test_update_playoffs_alliances(self):
         """Test that we correctly calculate data for each of the playoff alliances"""
         self.test_server.local_db.delete_data("predicted_aim")
@@ -1,5 +1,6 @@
 from calculations import predicted_elims
 from unittest.mock import patch
+import pytest
 from calculations import predicted_aim
 import server
 
@@ -1495,9 +1496,42 @@ class TestPredictedElimsCalc:
             == self.expected_predicted_elims
         )
 
+    def test_get_actual_winners(self):
+        assert self.test_calc.get_actual_winners(self.tba_match_data) == {1: "R"}
+        assert self.test_calc.get_actual_winners(
+            [
+                {"comp_level": "qm", "key": "2024arc_qm3", "winning_alliance": "red"},
+                {"comp_level": "sf", "key": "2024arc_sf12m1", "winning_alliance": "blue"},
+                {"comp_level": "sf", "key": "2024arc_sf13m1", "winning_alliance": ""},
+                {"comp_level": "f", "key": "2024arc_f1m2", "winning_alliance": "red"},
+            ]
+        ) == {12: "B", 15: "R"}
+
+    def test_simulate_bracket(self):
+        odds = self.test_calc.simulate_bracket(self.tba_match_data)
+        assert [alliance["alliance_num"] for alliance in odds] == list(range(1, 9))
+        assert sum(alliance["event_win_chance"] for alliance in odds) == pytest.approx(1, abs=0.01)
+        assert sum(alliance["finals_chance"] for alliance in odds) == pytest.approx(2, abs=0.01)
+        # Alliance 1 won match 1, so it can't be eliminated before round 3
+        assert odds[0]["round_3_chance"] == 1.0
+        # Alliance 8 lost match 1, so it has to win match 5 to keep playing
+        assert odds[7]["round_3_chance"] < 1.0
+        for alliance in odds:
+            assert alliance["round_2_chance"] == 1.0
+            assert alliance["round_3_chance"] >= alliance["round_4_chance"]
+            assert alliance["finals_chance"] >= alliance["event_win_chance"]
+
+        # Not enough alliances to simulate
+        self.test_calc.tba_data = self.test_calc.tba_data[:4]
+        assert self.test_calc.simulate_bracket(self.tba_match_data) == []
+
     def test_run(self):
-        with patch("tba_communicator.tba_request", return_value=self.tba_match_data):
+        with patch(
+            "tba_communicator.tba_request",
+            side_effect=[self.tba_playoffs_data, self.tba_match_data],
+        ):
             self.test_calc.run()
+        assert len(self.test_server.local_db.find("predicted_elims_odds")) == 8
         result = self.test_server.local_db.find("predicted_elims")
         for doc in result:
             match_num = doc["match_number"]
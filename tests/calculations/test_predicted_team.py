@@ -1,5 +1,7 @@
 import logging
 
+import pytest
+
 from unittest import mock
 
 from calculations import predicted_team
@@ -232,6 +234,18 @@ class TestPredictedTeamCalc:
                 "current_rps": 26,
                 "current_avg_rps": 26 / 11,
                 "predicted_score": 100.0,
+                "mean_simulated_rank": 8.499,
+                "first_seed_chance": 0.0,
+                "captain_chance": 0.501,
+                "simulated_rank_p10": 8,
+                "simulated_rank_p50": 8,
+                "simulated_rank_p90": 9,
+                "mean_simulated_rank": 8.499,
+                "first_seed_chance": 0.0,
+                "captain_chance": 0.501,
+                "simulated_rank_p10": 8,
+                "simulated_rank_p50": 8,
+                "simulated_rank_p90": 9,
             },
             {
                 "team_number": "1533",
@@ -242,6 +256,18 @@ class TestPredictedTeamCalc:
                 "current_rps": 25,
                 "current_avg_rps": 25 / 11,
                 "predicted_score": 110.0,
+                "mean_simulated_rank": 7.0,
+                "first_seed_chance": 0.0,
+                "captain_chance": 1.0,
+                "simulated_rank_p10": 7,
+                "simulated_rank_p50": 7,
+                "simulated_rank_p90": 7,
+                "mean_simulated_rank": 7.0,
+                "first_seed_chance": 0.0,
+                "captain_chance": 1.0,
+                "simulated_rank_p10": 7,
+                "simulated_rank_p50": 7,
+                "simulated_rank_p90": 7,
             },
             {
                 "team_number": "7229",
@@ -252,6 +278,18 @@ class TestPredictedTeamCalc:
                 "current_rps": 24,
                 "current_avg_rps": 24 / 11,
                 "predicted_score": 120.0,
+                "mean_simulated_rank": 8.501,
+                "first_seed_chance": 0.0,
+                "captain_chance": 0.499,
+                "simulated_rank_p10": 8,
+                "simulated_rank_p50": 9,
+                "simulated_rank_p90": 9,
+                "mean_simulated_rank": 8.501,
+                "first_seed_chance": 0.0,
+                "captain_chance": 0.499,
+                "simulated_rank_p10": 8,
+                "simulated_rank_p50": 9,
+                "simulated_rank_p90": 9,
             },
             {
                 "team_number": "254",
@@ -262,6 +300,18 @@ class TestPredictedTeamCalc:
                 "current_rps": 23,
                 "current_avg_rps": 23 / 11,
                 "predicted_score": 130.0,
+                "mean_simulated_rank": 2.525,
+                "first_seed_chance": 0.242,
+                "captain_chance": 1.0,
+                "simulated_rank_p10": 1,
+                "simulated_rank_p50": 3,
+                "simulated_rank_p90": 4,
+                "mean_simulated_rank": 2.525,
+                "first_seed_chance": 0.242,
+                "captain_chance": 1.0,
+                "simulated_rank_p10": 1,
+                "simulated_rank_p50": 3,
+                "simulated_rank_p90": 4,
             },
             {
                 "team_number": "971",
@@ -272,6 +322,18 @@ class TestPredictedTeamCalc:
                 "current_rps": 22,
                 "current_avg_rps": 22 / 11,
                 "predicted_score": 140.0,
+                "mean_simulated_rank": 5.503,
+                "first_seed_chance": 0.0,
+                "captain_chance": 1.0,
+                "simulated_rank_p10": 5,
+                "simulated_rank_p50": 6,
+                "simulated_rank_p90": 6,
+                "mean_simulated_rank": 5.503,
+                "first_seed_chance": 0.0,
+                "captain_chance": 1.0,
+                "simulated_rank_p10": 5,
+                "simulated_rank_p50": 6,
+                "simulated_rank_p90": 6,
             },
             {
                 "team_number": "1323",
@@ -282,6 +344,18 @@ class TestPredictedTeamCalc:
                 "current_rps": 21,
                 "current_avg_rps": 21 / 11,
                 "predicted_score": 150.0,
+                "mean_simulated_rank": 2.478,
+                "first_seed_chance": 0.259,
+                "captain_chance": 1.0,
+                "simulated_rank_p10": 1,
+                "simulated_rank_p50": 2,
+                "simulated_rank_p90": 4,
+                "mean_simulated_rank": 2.478,
+                "first_seed_chance": 0.259,
+                "captain_chance": 1.0,
+                "simulated_rank_p10": 1,
+                "simulated_rank_p50": 2,
+                "simulated_rank_p90": 4,
             },
             {
                 "team_number": "2056",
@@ -292,6 +366,18 @@ class TestPredictedTeamCalc:
                 "current_rps": 20,
                 "current_avg_rps": 20 / 11,
                 "predicted_score": 160.0,
+                "mean_simulated_rank": 5.497,
+                "first_seed_chance": 0.0,
+                "captain_chance": 1.0,
+                "simulated_rank_p10": 5,
+                "simulated_rank_p50": 5,
+                "simulated_rank_p90": 6,
+                "mean_simulated_rank": 5.497,
+                "first_seed_chance": 0.0,
+                "captain_chance": 1.0,
+                "simulated_rank_p10": 5,
+                "simulated_rank_p50": 5,
+                "simulated_rank_p90": 6,
             },
             {
                 "team_number": "1114",
@@ -302,6 +388,18 @@ class TestPredictedTeamCalc:
                 "current_rps": 19,
                 "current_avg_rps": 19 / 11,
                 "predicted_score": 170.0,
+                "mean_simulated_rank": 2.505,
+                "first_seed_chance": 0.248,
+                "captain_chance": 1.0,
+                "simulated_rank_p10": 1,
+                "simulated_rank_p50": 3,
+                "simulated_rank_p90": 4,
+                "mean_simulated_rank": 2.505,
+                "first_seed_chance": 0.248,
+                "captain_chance": 1.0,
+                "simulated_rank_p10": 1,
+                "simulated_rank_p50": 3,
+                "simulated_rank_p90": 4,
             },
             {
                 "team_number": "7179",
@@ -312,6 +410,18 @@ class TestPredictedTeamCalc:
                 "current_rps": 18,
                 "current_avg_rps": 18 / 11,
                 "predicted_score": 180.0,
+                "mean_simulated_rank": 2.493,
+                "first_seed_chance": 0.251,
+                "captain_chance": 1.0,
+                "simulated_rank_p10": 1,
+                "simulated_rank_p50": 2,
+                "simulated_rank_p90": 4,
+                "mean_simulated_rank": 2.493,
+                "first_seed_chance": 0.251,
+                "captain_chance": 1.0,
+                "simulated_rank_p10": 1,
+                "simulated_rank_p50": 2,
+                "simulated_rank_p90": 4,
             },
         ]
         self.teams = [
@@ -411,6 +521,50 @@ class TestPredictedTeamCalc:
             rec.message for rec in caplog.records if rec.levelname == "WARNING"
         ]
 
+    def test_calculate_unplayed_matches(self):
+        assert self.test_calc.calculate_unplayed_matches(self.predicted_aim) == {
+            2: {"R": 1.0, "B": 1.0, "red_win_chance": 1.0},
+            3: {"R": 2.0, "B": 1.0, "red_win_chance": 0.0},
+        }
+        self.predicted_aim[4]["win_chance"] = 0.25
+        assert self.test_calc.calculate_unplayed_matches(self.predicted_aim)[3] == {
+            "R": 2.0,
+            "B": 1.0,
+            "red_win_chance": 0.25,
+        }
+
+    def test_simulate_ranks(self):
+        teams = ["1678", "254", "971", "1323"]
+        aim_list = [
+            {"match_number": 1, "alliance_color": "R", "team_list": ["1678", "254"]},
+            {"match_number": 1, "alliance_color": "B", "team_list": ["971", "1323"]},
+            {"match_number": 2, "alliance_color": "R", "team_list": ["1678", "971"]},
+            {"match_number": 2, "alliance_color": "B", "team_list": ["254", "1323"]},
+        ]
+        predicted_aims = [
+            {
+                "match_number": 2,
+                "alliance_color_is_red": red,
+                "has_tba_data": False,
+                "predicted_barge_rp": 0,
+                "predicted_coral_rp": 0,
+                "predicted_score": 0,
+                "win_chance": 0.75 if red else 0.25,
+            }
+            for red in [True, False]
+        ]
+        rank_odds = self.test_calc.simulate_ranks(
+            teams, aim_list, predicted_aims, {1: {"R": 3, "B": 0}}
+        )
+        # 1678 finishes first if it wins match 2, otherwise 254 does
+        assert rank_odds["1678"]["first_seed_chance"] == pytest.approx(0.75, abs=0.02)
+        assert rank_odds["254"]["first_seed_chance"] == pytest.approx(0.25, abs=0.02)
+        assert rank_odds["1678"]["simulated_rank_p10"] == 1
+        assert rank_odds["971"]["simulated_rank_p90"] == 4
+        for team in teams:
+            assert rank_odds[team]["captain_chance"] == 1.0
+        assert sum(odds["mean_simulated_rank"] for odds in rank_odds.values()) == pytest.approx(10)
+
     def test_calculate_predicted_ranks(self):
         updates = self.test_calc.calculate_predicted_ranks(
             self.updates, self.aim_list, self.ranking_data["rankings"]
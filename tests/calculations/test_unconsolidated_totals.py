@@ -456,6 +456,47 @@ class TestUnconsolidatedTotals:
         action_num = self.test_calculator.count_timeline_actions(self.unconsolidated_tims[0])
         assert action_num == 22
 
+    def test_timeline_counter(self):
+        counter = unconsolidated_totals.TimelineCounter(
+            {
+                "tele_coral_L2": {"type": "int", "action_type": "tele_coral_L2", "in_teleop": True},
+                "late_coral_L2": {"type": "int", "action_type": "tele_coral_L2", "time": [0, 100]},
+                "teleop_actions": {"type": "int", "in_teleop": True},
+            },
+            {
+                "tele_incap": {
+                    "type": "int",
+                    "start_action": "start_incap",
+                    "end_action": "end_incap",
+                    "minimum_time": 8,
+                },
+                "intake_cycle_time": {
+                    "type": "int",
+                    "start_action": "tele_intake_station",
+                    "end_action": ["tele_coral_L2"],
+                    "minimum_time": 1,
+                },
+            },
+        )
+        timeline = [
+            {"in_teleop": False, "time": 140, "action_type": "auto_net"},
+            {"in_teleop": True, "time": 130, "action_type": "tele_intake_station"},
+            {"in_teleop": True, "time": 120, "action_type": "tele_coral_L2"},
+            {"in_teleop": True, "time": 110, "action_type": "start_incap"},
+            {"in_teleop": True, "time": 100, "action_type": "end_incap"},
+            {"in_teleop": True, "time": 90, "action_type": "start_incap"},
+            {"in_teleop": True, "time": 85, "action_type": "end_incap"},
+            {"in_teleop": True, "time": 60, "action_type": "tele_coral_L2"},
+        ]
+        assert counter.calculate(timeline) == (
+            {"tele_coral_L2": 2, "late_coral_L2": 1, "teleop_actions": 7},
+            {"tele_incap": 10, "intake_cycle_time": 10},
+        )
+        # Matches the cycle times calculated one at a time
+        assert self.test_calculator.total_time_between_actions(
+            {"timeline": timeline}, "start_incap", "end_incap", 1
+        ) == (10 + 5)
+
     def test_score_fail_type(self):
         score_fails = self.test_calculator.score_fail_type(self.unconsolidated_tims)
         assert score_fails[2]["timeline"][8]["action_type"] == "tele_fail_coral_L2"
@@ -539,6 +580,8 @@ class TestUnconsolidatedTotals:
         }
 
     def test_in_list_check1(self, caplog):
+        # Without inputs there are no documents to write, which is warned about
+        self.test_server.local_db.delete_data("unconsolidated_obj_tim")
         with patch("tba_communicator.tba_request", return_value=self.tba_test_data):
             self.test_calculator.run()
         assert len([rec.message for rec in caplog.records if rec.levelname == "WARNING"]) > 0
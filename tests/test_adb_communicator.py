@@ -97,26 +97,62 @@ def test_uninstall_app():
     utils.run_command = real_run_command
 
 
-def test_pull_device_files():
-    real_get_attached_devices = adb_communicator.get_attached_devices
-    real_run_command = utils.run_command
+def test_get_device_files():
+    fake_output = "12 1700000000 fakedata/fakefile/1_1678_1.txt\n34 1700000001 fakedata/fakefile/pit/pit_data.json\n"
+    with patch("utils.run_command", return_value=fake_output) as run_command:
+        assert {
+            "1_1678_1.txt": [12, 1700000000],
+            "pit/pit_data.json": [34, 1700000001],
+        } == adb_communicator.get_device_files("A1B2C3D4", "fakedata/fakefile")
+    run_command.assert_called_once_with(
+        "adb -s A1B2C3D4 shell find fakedata/fakefile -type f -exec stat -c '%s %Y %n' {} +",
+        return_output=True,
+    )
 
-    with Patcher() as patcher:
-        fake_serials = [["A1B2C3D4", "device"], ["E5F6G7H8", "device"], ["I9J1K2L3", "device"]]
-        adb_communicator.get_attached_devices = MagicMock(return_value=fake_serials)
-        utils.run_command = MagicMock()
-        fake_tablet_path = "fakedata/fakefile"
-        fake_local_path = "fakepath/path"
-        patcher.fs.create_dir(fake_local_path)
 
-        for i in fake_serials:
-            adb_communicator.pull_device_files(fake_local_path, fake_tablet_path, devices=[i[0]])
-            utils.run_command.assert_called_with(
-                f"adb -s {i[0]} pull fakedata/fakefile fakepath/path/{i[0]}"
+def test_pull_device_files(tmp_path):
+    fake_serials = [["A1B2C3D4", "device"], ["E5F6G7H8", "device"], ["I9J1K2L3", "device"]]
+    fake_tablet_path = "fakedata/fakefile"
+    fake_local_path = str(tmp_path)
+    device_files = {"1_1678_1.txt": "12 1700000000"}
+
+    def fake_run_command(command, return_output=False):
+        if " find " in command:
+            return "".join(
+                f"{info} {fake_tablet_path}/{file}\n" for file, info in device_files.items()
+            )
+        # Create the pulled file
+        with open(command.split(" ")[-1], "w"):
+            pass
+
+    # adb_communicator was imported with a fake filesystem, use the real one with tmp_path
+    with patch.object(adb_communicator, "os", os), patch(
+        "utils.run_command", side_effect=fake_run_command
+    ) as run_command:
+        devices = [i[0] for i in fake_serials]
+        assert {
+            device: ["1_1678_1.txt"] for device in devices
+        } == adb_communicator.pull_device_files(fake_local_path, fake_tablet_path, devices)
+        for device in devices:
+            run_command.assert_any_call(
+                f"adb -s {device} pull fakedata/fakefile/1_1678_1.txt {tmp_path}/{device}/1_1678_1.txt"
             )
+            assert os.path.exists(f"{tmp_path}/{device}_manifest.json")
 
-    adb_communicator.get_attached_devices = real_get_attached_devices
-    utils.run_command = real_run_command
+        # Unchanged files aren't pulled again
+        assert {device: [] for device in devices} == adb_communicator.pull_device_files(
+            fake_local_path, fake_tablet_path, devices
+        )
+        # Changed files are pulled again, files deleted from the device are deleted locally
+        device_files = {"1_1678_1.txt": "13 1700000005", "2_1678_1.txt": "12 1700000010"}
+        assert {"A1B2C3D4": ["1_1678_1.txt", "2_1678_1.txt"]} == (
+            adb_communicator.pull_device_files(fake_local_path, fake_tablet_path, ["A1B2C3D4"])
+        )
+        device_files = {}
+        assert {"A1B2C3D4": []} == adb_communicator.pull_device_files(
+            fake_local_path, fake_tablet_path, ["A1B2C3D4"]
+        )
+        assert not os.path.exists(f"{tmp_path}/A1B2C3D4/1_1678_1.txt")
 
 
 def test_adb_remove_files():
@@ -162,15 +198,13 @@ def test_pull_device_data():
             fake_tablet_dir = utils.create_file_path(f"data/devices/{fake_serials[i]}")
             patcher.fs.create_file(f"{fake_tablet_dir}/qrdatathing.txt", contents=fake_qr_data[i])
 
-        # this stuff is for fixing a bug with pyfakefs breaking os.listdir
-        def listdirfix(path):
-            if path == fake_dir_path:
-                return fake_serials
-            elif path == f"{fake_dir_path}/{fake_serials[3]}":
-                return ["Mehul"]
-            else:
-                return ["qrdatathing.txt"]
+        # Only the files pulled from each device are read
+        def fake_pull_device_files(local_file_path, tablet_file_path, devices):
+            if "StandStrategist" in tablet_file_path:
+                return {fake_serials[3]: ["Mehul/team_data.json", "Mehul/tim_data.json"]}
+            return {serial: ["qrdatathing.txt"] for serial in fake_serials[:3]}
 
+        adb_communicator.pull_device_files = Mock(side_effect=fake_pull_device_files)
         test_ss_tims_data = [
             {
                 "team_number": "1678",
@@ -256,8 +290,8 @@ def test_pull_device_data():
         patcher.fs.create_file(f"{fake_dir_path}/RABCDEFG/Mehul/tim_data.json", contents="{}")
         patcher.fs.add_real_file(utils.create_file_path("schema/calc_ss_team.yml"))
 
-        with patch(
-            "pyfakefs.fake_filesystem_unittest.fake_os.FakeOsModule.listdir", side_effect=listdirfix
+        with patch.object(
+            adb_communicator, "has_devices", return_value=[fake_serials[:3], fake_serials[3:]]
         ):
             with patch("re.fullmatch", return_value=True):
                 test_data = adb_communicator.pull_device_data()
@@ -304,21 +338,17 @@ def test_pull_qr_data():
         for i in range(3):
             fake_tablet_dir = utils.create_file_path(f"data/devices/{fake_serials[i]}")
             patcher.fs.create_file(f"{fake_tablet_dir}/qrdatathing.txt", contents=fake_qr_data[i])
+            # Pulled before, so it isn't read again
+            patcher.fs.create_file(f"{fake_tablet_dir}/oldqrdatathing.txt", contents="+OLD")
 
-        # this stuff is for fixing a bug with pyfakefs breaking os.listdir
-        def listdirfix(path):
-            if path == fake_dir_path:
-                return fake_serials
-            else:
-                return ["qrdatathing.txt"]
-
+        # Only the files pulled from each device are read
+        adb_communicator.pull_device_files = Mock(
+            return_value={serial: ["qrdatathing.txt"] for serial in fake_serials}
+        )
         test_db = database.Database()
         database.Database = MagicMock(return_value=test_db)
-        with patch(
-            "pyfakefs.fake_filesystem_unittest.fake_os.FakeOsModule.listdir", side_effect=listdirfix
-        ):
-            with patch("re.fullmatch", return_value=True):
-                test_data = adb_communicator.pull_qr_data()
+        with patch("re.fullmatch", return_value=True):
+            test_data = adb_communicator.pull_qr_data()
     database.Database = real_db
     adb_communicator.pull_device_files = real_pull_device_files
     qr_code_uploader.upload_qr_codes = real_upload_qr_codes
@@ -431,17 +461,17 @@ def test_pull_pit_data():
                 encoding="utf-8",
             )
 
+        # Only the files pulled from each device are read
+        adb_communicator.pull_device_files = Mock(
+            return_value={serial: ["pit_data/pit_data.json"] for serial in fake_serials}
+        )
         test_db = database.Database()
         database.Database = MagicMock(return_value=test_db)
         with patch("re.fullmatch", return_value=True):
-            with patch(
-                "pyfakefs.fake_filesystem_unittest.fake_os.FakeOsModule.listdir",
-                side_effect=os.listdir,
-            ):
-                adb_communicator.pull_pit_data()
-                test_data = test_db.find("raw_obj_pit")
-                for team in test_data:
-                    team.pop("_id")
+            adb_communicator.pull_pit_data()
+            test_data = test_db.find("raw_obj_pit")
+            for team in test_data:
+                team.pop("_id")
     database.Database = real_db
     adb_communicator.pull_device_files = real_pull_device_files
     qr_code_uploader.upload_qr_codes = real_upload_qr_codes
@@ -546,13 +576,13 @@ def test_pull_ss_data():
         ]
         adb_communicator.get_attached_devices = Mock(return_value=fake_serials)
 
-        # this stuff is for fixing a bug with pyfakefs breaking os.listdir
-        def listdirfix(path):
-            if path == fake_dir_path:
-                return fake_serials
-            elif path == f"{fake_dir_path}/{fake_serials[3]}":
-                return ["Mehul"]
+        # Only the files pulled from each device are read
+        def fake_pull_device_files(local_file_path, tablet_file_path, devices):
+            if "StandStrategist" in tablet_file_path:
+                return {fake_serials[3]: ["Mehul/team_data.json", "Mehul/tim_data.json"]}
+            return {serial: [] for serial in fake_serials[:3]}
 
+        adb_communicator.pull_device_files = Mock(side_effect=fake_pull_device_files)
         test_db = database.Database()
         test_db.insert_documents("ss_tim", test_ss_tims_data)
         database.Database = MagicMock(return_value=test_db)
@@ -563,8 +593,8 @@ def test_pull_ss_data():
         patcher.fs.create_file(f"{fake_dir_path}/RABCDEFG/Mehul/tim_data.json", contents="{}")
         patcher.fs.add_real_file(utils.create_file_path("schema/calc_ss_team.yml"))
 
-        with patch(
-            "pyfakefs.fake_filesystem_unittest.fake_os.FakeOsModule.listdir", side_effect=listdirfix
+        with patch.object(
+            adb_communicator, "has_devices", return_value=[fake_serials[:3], fake_serials[3:]]
         ):
             with patch("re.fullmatch", return_value=True):
                 with patch("utils.get_team_list", return_value=["1678", "254"]):
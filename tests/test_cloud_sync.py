@@ -0,0 +1,145 @@
+"""Tests cloud_sync.py"""
+
+from unittest.mock import MagicMock, patch
+import logging
+
+import pymongo
+import pymongo.errors
+
+with patch("logging.getLogger", side_effect=logging.getLogger):
+    import cloud_sync
+
+
+def make_change(operation, collection, _id, document=None):
+    return {
+        "operationType": operation,
+        "ns": {"coll": collection},
+        "documentKey": {"_id": _id},
+        "fullDocument": document,
+    }
+
+
+class TestCloudSync:
+    def setup_method(self, method):
+        self.local_db = MagicMock()
+        self.cloud_db = MagicMock()
+        self.cloud_db.db = {"obj_team": MagicMock(), "obj_tim": MagicMock()}
+        self.stream = MagicMock()
+        self.stream.resume_token = {"_data": "token"}
+        self.local_db.db.watch.return_value = self.stream
+
+    def make_sync(self, tmp_path, resume_token=None):
+        token_file = tmp_path / "token.json"
+        if resume_token is not None:
+            token_file.write_text(f'{{"resume_token": {{"_data": "{resume_token}"}}}}')
+        return cloud_sync.CloudSync(
+            self.local_db, self.cloud_db, ["obj_team", "obj_tim"], str(token_file)
+        )
+
+    def test_init(self, tmp_path):
+        test_sync = self.make_sync(tmp_path)
+        assert test_sync.resume_token is None
+        assert test_sync.needs_full_sync == {"obj_team", "obj_tim"}
+        test_sync = self.make_sync(tmp_path, "saved")
+        assert test_sync.resume_token == {"_data": "saved"}
+        assert test_sync.needs_full_sync == set()
+
+    def test_create_operation(self):
+        document = {"_id": 1, "team_number": "1678"}
+        assert cloud_sync.CloudSync.create_operation(
+            make_change("insert", "obj_team", 1, document)
+        ) == pymongo.ReplaceOne({"_id": 1}, document, upsert=True)
+        assert cloud_sync.CloudSync.create_operation(
+            make_change("update", "obj_team", 1, document)
+        ) == pymongo.ReplaceOne({"_id": 1}, document, upsert=True)
+        assert cloud_sync.CloudSync.create_operation(
+            make_change("delete", "obj_team", 1)
+        ) == pymongo.DeleteOne({"_id": 1})
+        # Documents deleted before the update was looked up
+        assert cloud_sync.CloudSync.create_operation(
+            make_change("update", "obj_team", 1)
+        ) == pymongo.DeleteOne({"_id": 1})
+
+    def test_sync(self, tmp_path):
+        test_sync = self.make_sync(tmp_path, "saved")
+        self.stream.try_next.side_effect = [
+            make_change("insert", "obj_team", 1, {"_id": 1}),
+            make_change("delete", "obj_tim", 2),
+            make_change("insert", "obj_team", 3, {"_id": 3}),
+            # Only the latest change to a document is sent
+            make_change("update", "obj_team", 1, {"_id": 1, "a": 1}),
+            None,
+        ]
+        assert test_sync.sync()
+        self.local_db.db.watch.assert_called_once()
+        assert self.local_db.db.watch.call_args.kwargs["resume_after"] == {"_data": "saved"}
+        self.cloud_db.db["obj_team"].bulk_write.assert_called_once_with(
+            [
+                pymongo.ReplaceOne({"_id": 3}, {"_id": 3}, upsert=True),
+                pymongo.ReplaceOne({"_id": 1}, {"_id": 1, "a": 1}, upsert=True),
+            ],
+            ordered=True,
+        )
+        self.cloud_db.db["obj_tim"].bulk_write.assert_called_once_with(
+            [pymongo.DeleteOne({"_id": 2})], ordered=True
+        )
+        assert test_sync.resume_token == {"_data": "token"}
+        assert test_sync.load_resume_token() == {"_data": "token"}
+        assert test_sync.get_status()["queue_depth"] == 0
+        assert test_sync.get_status()["lag_seconds"] == 0
+
+    def test_sync_full_sync(self, tmp_path):
+        test_sync = self.make_sync(tmp_path)
+        self.stream.try_next.return_value = None
+        self.local_db.find.return_value = [{"_id": 1}]
+        assert test_sync.sync()
+        for collection in ["obj_team", "obj_tim"]:
+            self.cloud_db.db[collection].delete_many.assert_called_once_with({})
+            self.cloud_db.db[collection].insert_many.assert_called_once_with([{"_id": 1}])
+        assert test_sync.needs_full_sync == set()
+
+    def test_sync_connection_error(self, tmp_path):
+        test_sync = self.make_sync(tmp_path, "saved")
+        self.stream.try_next.side_effect = [make_change("delete", "obj_tim", 2), None, None]
+        self.cloud_db.db[
+            "obj_tim"
+        ].bulk_write.side_effect = pymongo.errors.ServerSelectionTimeoutError("timeout")
+        assert not test_sync.sync()
+        # Changes are kept until they are sent
+        assert test_sync.resume_token == {"_data": "saved"}
+        assert test_sync.get_status()["queue_depth"] == 1
+        self.cloud_db.db["obj_tim"].bulk_write.side_effect = None
+        assert test_sync.sync()
+        assert test_sync.get_status()["queue_depth"] == 0
+        assert test_sync.resume_token == {"_data": "token"}
+
+
+class TestCloudSyncWorker:
+    def test_get_wait_time(self):
+        worker = cloud_sync.CloudSyncWorker(MagicMock())
+        assert worker.get_wait_time() == worker.POLL_SECONDS
+        worker.failures = 1
+        assert worker.get_wait_time() == worker.MIN_BACKOFF_SECONDS
+        worker.failures = 3
+        assert worker.get_wait_time() == worker.MIN_BACKOFF_SECONDS * 4
+        worker.failures = 100
+        assert worker.get_wait_time() == worker.MAX_BACKOFF_SECONDS
+
+    def test_run(self):
+        test_sync = MagicMock()
+        worker = cloud_sync.CloudSyncWorker(test_sync)
+
+        def sync():
+            if test_sync.sync.call_count == 3:
+                worker.stop_event.set()
+            return test_sync.sync.call_count != 2
+
+        test_sync.sync.side_effect = sync
+        with patch.object(worker, "POLL_SECONDS", 0), patch.object(
+            worker, "MIN_BACKOFF_SECONDS", 0
+        ):
+            worker.start()
+            worker.join(5)
+        assert test_sync.sync.call_count == 3
+        assert worker.failures == 0
+        test_sync.close.assert_called_once()
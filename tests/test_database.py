@@ -38,6 +38,27 @@ class TestDatabase:
         assert test_db.db.name == TEST_DATABASE_NAME
         assert test_db.name == TEST_DATABASE_NAME
 
+    def test_get_client(self):
+        """Tests that databases with the same connection share a client"""
+        assert database.get_client() is TEST_DB_ACTUAL.client
+        assert database.Database().client is TEST_DB_ACTUAL.client
+        assert database.get_client("test", 80) is database.get_client("test", 80)
+        assert database.get_client("test", 80) is not TEST_DB_ACTUAL.client
+
+    def test_ensure_mongod(self):
+        """Tests only starting mongod if it isn't running"""
+        with patch("database._mongod_ready", False), patch(
+            "database.is_port_open", return_value=True
+        ), patch("start_mongod.start_mongod") as start_mongod:
+            database.ensure_mongod()
+            start_mongod.assert_not_called()
+        with patch("database._mongod_ready", False), patch(
+            "database.is_port_open", return_value=False
+        ), patch("start_mongod.start_mongod") as start_mongod:
+            database.ensure_mongod()
+            database.ensure_mongod()
+            start_mongod.assert_called_once()
+
     def test_schema(self):
         """Compares the schema load to the one in the db file"""
         assert collections == database.COLLECTION_SCHEMA
@@ -68,6 +89,38 @@ class TestDatabase:
         TEST_DB_HELPER.test.insert_one({"test": "test"})
         assert TEST_DB_ACTUAL.find("test", {"test": "test"}) == [TEST_DB_HELPER.test.find_one({})]
 
+    def test_group_by(self):
+        """Tests grouping documents by key"""
+        TEST_DB_HELPER.test.insert_many(
+            [
+                {"team_number": "1678", "match_number": 1, "test": "a"},
+                {"team_number": "1678", "match_number": 1, "test": "b"},
+                {"team_number": "254", "match_number": 2, "test": "a"},
+            ]
+        )
+        grouped = TEST_DB_ACTUAL.group_by("test", ("team_number", "match_number"))
+        assert [doc["test"] for doc in grouped[("1678", 1)]] == ["a", "b"]
+        assert [doc["test"] for doc in grouped[("254", 2)]] == ["a"]
+        assert TEST_DB_ACTUAL.group_by("test", ("test",), {"team_number": "254"}) == {
+            ("a",): TEST_DB_ACTUAL.find("test", {"team_number": "254"})
+        }
+
+    def test_get_document_hashes(self):
+        """Tests hashing documents grouped by key"""
+        TEST_DB_HELPER.test.insert_many(
+            [
+                {"team_number": "1678", "match_number": 1, "test": "a"},
+                {"team_number": "1678", "match_number": 1, "test": "b"},
+                {"team_number": "254", "match_number": 1, "test": "a"},
+            ]
+        )
+        hashes = TEST_DB_ACTUAL.get_document_hashes("test")
+        assert set(hashes.keys()) == {("1678", 1), ("254", 1)}
+        TEST_DB_HELPER.test.update_one({"team_number": "254"}, {"$set": {"test": "c"}})
+        new_hashes = TEST_DB_ACTUAL.get_document_hashes("test")
+        assert new_hashes[("1678", 1)] == hashes[("1678", 1)]
+        assert new_hashes[("254", 1)] != hashes[("254", 1)]
+
     def test_get_tba_cache(self):
         """Tests tba cache read"""
         TEST_DB_HELPER.tba_cache.insert_one({"api_url": "test"})
@@ -89,6 +142,52 @@ class TestDatabase:
         test_cache = TEST_DB_HELPER.tba_cache.find_one({"api_url": "test2"})
         del test_cache["_id"]
         assert test_cache == {"data": {"a": "b"}, "etag": "ETAG", "api_url": "test2"}
+        TEST_DB_ACTUAL.update_tba_cache({"a": "c"}, "test2", "ETAG2", 1700000000.0)
+        test_cache = TEST_DB_HELPER.tba_cache.find_one({"api_url": "test2"})
+        del test_cache["_id"]
+        assert test_cache == {
+            "data": {"a": "c"},
+            "etag": "ETAG2",
+            "expires": 1700000000.0,
+            "api_url": "test2",
+        }
+
+    def test_get_decompression_cache(self):
+        """Tests decompression cache read"""
+        TEST_DB_HELPER.decompression_cache.insert_many(
+            [
+                {"key": "a", "decompressed": [{"team_number": "1678"}]},
+                {"key": "b", "decompressed": None},
+            ]
+        )
+        assert TEST_DB_ACTUAL.get_decompression_cache() == {
+            "a": [{"team_number": "1678"}],
+            "b": None,
+        }
+
+    def test_update_decompression_cache(self):
+        """Tests adding and removing decompression cache entries"""
+        TEST_DB_ACTUAL.update_decompression_cache({"a": [{"team_number": "1678"}], "b": None})
+        assert TEST_DB_ACTUAL.get_decompression_cache() == {
+            "a": [{"team_number": "1678"}],
+            "b": None,
+        }
+        TEST_DB_ACTUAL.update_decompression_cache({"a": [{"team_number": "254"}]}, {"b"})
+        assert TEST_DB_ACTUAL.get_decompression_cache() == {"a": [{"team_number": "254"}]}
+        assert TEST_DB_HELPER.decompression_cache.count_documents({}) == 1
+
+    def test_insert_server_metrics(self):
+        """Tests that metrics are inserted into a capped collection"""
+        test_db = database.Database()
+        test_db.insert_server_metrics([{"type": "cycle", "wall_seconds": 1.5}])
+        assert TEST_DB_HELPER.server_metrics.options()["capped"]
+        test_db.insert_server_metrics([{"type": "calculation", "wall_seconds": 0.5}])
+        assert list(TEST_DB_HELPER.server_metrics.find({}, {"_id": 0})) == [
+            {"type": "cycle", "wall_seconds": 1.5},
+            {"type": "calculation", "wall_seconds": 0.5},
+        ]
+        # Documents can't always be deleted from capped collections, so drop it for other tests
+        TEST_DB_HELPER.server_metrics.drop()
 
     def test_delete_data(self):
         """Tests deletion of data"""
@@ -103,6 +202,57 @@ class TestDatabase:
         TEST_DB_ACTUAL.insert_documents("test", {"test_2": "b"})
         assert TEST_DB_HELPER.test.find_one({"test_2": "b"})
 
+    def test_insert_unique_documents(self):
+        """Tests skipping documents that break the unique index on raw_qr data"""
+        inserted = TEST_DB_ACTUAL.insert_unique_documents("raw_qr", [{"data": "+A"}])
+        assert [document["data"] for document in inserted] == ["+A"]
+        inserted = TEST_DB_ACTUAL.insert_unique_documents(
+            "raw_qr", [{"data": "*B"}, {"data": "+A"}, {"data": "+C"}]
+        )
+        assert [document["data"] for document in inserted] == ["*B", "+C"]
+        assert TEST_DB_HELPER.raw_qr.count_documents({}) == 3
+        assert TEST_DB_ACTUAL.insert_unique_documents("raw_qr", []) == []
+
+    def test_insert_unique_documents_existing_duplicates(self):
+        """Tests skipping duplicates when raw_qr already has duplicates, so it can't be indexed"""
+        TEST_DB_HELPER.raw_qr.drop()
+        TEST_DB_HELPER.raw_qr.insert_many([{"data": "+A"}, {"data": "+A"}])
+        test_db = database.Database()
+        inserted = test_db.insert_unique_documents(
+            "raw_qr", [{"data": "+A"}, {"data": "*B"}, {"data": "*B"}]
+        )
+        assert [document["data"] for document in inserted] == ["*B"]
+        assert test_db.unindexed_collections == {"raw_qr"}
+        assert test_db.insert_unique_documents("raw_qr", [{"data": "+A"}]) == []
+        assert TEST_DB_HELPER.raw_qr.count_documents({}) == 3
+        TEST_DB_HELPER.raw_qr.drop()
+
+    def test_replace_collection_contents(self):
+        """Tests only writing the documents that changed"""
+        TEST_DB_ACTUAL.replace_collection_contents(
+            "obj_team", [{"team_number": "1678", "test": "a"}, {"team_number": "254", "test": "b"}]
+        )
+        unchanged_id = TEST_DB_HELPER.obj_team.find_one({"team_number": "1678"})["_id"]
+        result = TEST_DB_ACTUAL.replace_collection_contents(
+            "obj_team", [{"team_number": "1678", "test": "a"}, {"team_number": "971", "test": "c"}]
+        )
+        assert (result.inserted_count, result.modified_count, result.deleted_count) == (1, 0, 1)
+        assert TEST_DB_HELPER.obj_team.find_one({"team_number": "1678"})["_id"] == unchanged_id
+        assert {doc["team_number"] for doc in TEST_DB_ACTUAL.find("obj_team")} == {"1678", "971"}
+        # Documents outside of the query are left alone
+        TEST_DB_ACTUAL.replace_collection_contents(
+            "obj_team", [{"team_number": "971", "test": "d"}], query={"team_number": "971"}
+        )
+        assert [doc["test"] for doc in TEST_DB_ACTUAL.find("obj_team")] == ["a", "d"]
+        # Nothing to write
+        assert (
+            TEST_DB_ACTUAL.replace_collection_contents(
+                "obj_team",
+                [{"team_number": "1678", "test": "a"}, {"team_number": "971", "test": "d"}],
+            )
+            is None
+        )
+
     def test_update_document(self):
         """Tests updating of documents"""
         TEST_DB_HELPER.test.insert_one({"test": "a"})
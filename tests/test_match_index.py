@@ -0,0 +1,89 @@
+"""Tests match_index.py"""
+
+from match_index import MatchIndex
+
+
+class TestMatchIndex:
+    def setup_method(self, method):
+        self.obj_tims = [
+            {"team_number": "1678", "match_number": 1},
+            {"team_number": "254", "match_number": 1},
+            {"team_number": "971", "match_number": 2},
+        ]
+        self.tba_matches = [
+            {"match_number": 2, "comp_level": "qm", "key": "2024arc_qm2"},
+            {"match_number": 1, "comp_level": "qm", "key": "2024arc_qm1"},
+            {"match_number": 1, "comp_level": "sf", "key": "2024arc_sf1m1"},
+        ]
+        self.aim_list = [
+            {"match_number": 1, "alliance_color": "R", "team_list": ["1678", "254", "971"]},
+            {"match_number": 2, "alliance_color": "B", "team_list": ["1678", "118", "148"]},
+        ]
+        self.index = MatchIndex(self.obj_tims, self.tba_matches, self.aim_list)
+
+    def test_get_obj_tims(self):
+        assert self.index.get_obj_tims(1) == self.obj_tims[:2]
+        assert self.index.get_obj_tims(1, ["254", "971"]) == [self.obj_tims[1]]
+        assert self.index.get_obj_tims(3) == []
+
+    def test_get_tba_match(self):
+        assert self.index.get_tba_match(1) == self.tba_matches[1]
+        assert self.index.get_tba_match(3) is None
+        assert self.index.get_tba_matches() == self.tba_matches[1::-1]
+
+    def test_get_team_aims(self):
+        assert self.index.get_team_aims("1678") == self.aim_list
+        assert self.index.get_team_aims("118") == [self.aim_list[1]]
+        assert self.index.get_team_aims("1323") == []
+
+    def test_get_played_matches(self):
+        def make_match(key, comp_level, match_number, red, blue, played=True, surrogates=()):
+            return {
+                "key": key,
+                "comp_level": comp_level,
+                "match_number": match_number,
+                "score_breakdown": {"red": {}, "blue": {}} if played else None,
+                "alliances": {
+                    "red": {
+                        "team_keys": [f"frc{team}" for team in red],
+                        "surrogate_team_keys": [f"frc{team}" for team in surrogates],
+                    },
+                    "blue": {"team_keys": [f"frc{team}" for team in blue]},
+                },
+            }
+
+        qm1 = make_match("2025caph_qm1", "qm", 1, ["1678", "254", "971"], ["118", "148", "1323"])
+        # 1678 plays a second time as a surrogate, which still counts as a played match
+        qm2 = make_match(
+            "2025caph_qm2",
+            "qm",
+            2,
+            ["1678", "4414", "604"],
+            ["973", "8", "199"],
+            surrogates=["1678"],
+        )
+        # Unplayed
+        qm3 = make_match(
+            "2025caph_qm3", "qm", 3, ["1678", "254", "118"], ["971", "148", "604"], False
+        )
+        # Playoff matches restart at match number 1
+        sf1 = make_match("2025caph_sf1m1", "sf", 1, ["1678", "254", "971"], ["118", "148", "1323"])
+        index = MatchIndex([], [qm1, qm2, qm3, sf1], [])
+        assert index.get_played_matches("1678") == [qm1, qm2]
+        assert index.get_played_matches("254") == [qm1]
+        assert index.get_played_matches("4414") == [qm2]
+        assert index.get_played_matches("1323") == [qm1]
+        assert index.get_played_matches("3476") == []
+        assert set(index.get_played_matches_by_team()) == {
+            "1678",
+            "254",
+            "971",
+            "118",
+            "148",
+            "1323",
+            "4414",
+            "604",
+            "973",
+            "8",
+            "199",
+        }
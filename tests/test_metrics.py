@@ -0,0 +1,112 @@
+"""Tests metrics.py"""
+
+import logging
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+import pymongo.errors
+import pytest
+
+with patch("logging.getLogger", side_effect=logging.getLogger):
+    import metrics
+
+
+def make_started(request_id, command_name, command):
+    return SimpleNamespace(request_id=request_id, command_name=command_name, command=command)
+
+
+def make_succeeded(request_id, reply):
+    return SimpleNamespace(request_id=request_id, reply=reply)
+
+
+def test_record():
+    assert metrics.get_current() is None
+    with metrics.record("OBJTeamCalc") as calc_metrics:
+        assert metrics.get_current() is calc_metrics
+        metrics.record_request("tba", 0.25)
+        metrics.record_request("tba", 0.5)
+    assert metrics.get_current() is None
+    assert calc_metrics.calc_name == "OBJTeamCalc"
+    assert calc_metrics.requests["tba"] == {"count": 2, "seconds": 0.75}
+    assert calc_metrics.requests["doozernet"] == {"count": 0, "seconds": 0.0}
+    assert calc_metrics.wall_seconds >= 0
+    # Metrics are complete even if the calculation raises
+    with pytest.raises(ValueError):
+        with metrics.record("OBJTeamCalc") as calc_metrics:
+            raise ValueError
+    assert calc_metrics.wall_seconds >= 0
+    assert metrics.get_current() is None
+    # Requests outside of a calculation aren't counted
+    metrics.record_request("tba", 1)
+
+
+def test_command_listener():
+    listener = metrics.CommandListener()
+    # Commands outside of a calculation aren't counted
+    listener.started(make_started(1, "find", {"find": "obj_tim"}))
+    with metrics.record("OBJTeamCalc") as calc_metrics:
+        listener.started(make_started(2, "find", {"find": "obj_tim"}))
+        listener.succeeded(make_succeeded(2, {"cursor": {"firstBatch": [{}, {}]}}))
+        listener.started(make_started(3, "getMore", {"getMore": 1, "collection": "obj_tim"}))
+        listener.succeeded(make_succeeded(3, {"cursor": {"nextBatch": [{}]}}))
+        listener.started(make_started(4, "update", {"update": "obj_team"}))
+        listener.succeeded(make_succeeded(4, {"n": 3, "nModified": 1}))
+        listener.started(make_started(5, "insert", {"insert": "obj_team"}))
+        listener.failed(SimpleNamespace(request_id=5))
+        listener.started(make_started(6, "listCollections", {"listCollections": 1}))
+        listener.succeeded(make_succeeded(6, {"cursor": {"firstBatch": [{}]}}))
+    assert calc_metrics.round_trips == 5
+    assert calc_metrics.documents_read == {"obj_tim": 3}
+    assert calc_metrics.documents_written == {"obj_team": 3}
+    assert calc_metrics.pending_commands == {}
+
+
+class TestMetricsCollector:
+    def setup_method(self, method):
+        self.db = MagicMock()
+        self.collector = metrics.MetricsCollector(self.db)
+
+    def make_calc_metrics(self, calc_name, wall_seconds, skipped=False):
+        calc_metrics = metrics.CalcMetrics(calc_name)
+        calc_metrics.wall_seconds = wall_seconds
+        calc_metrics.skipped = skipped
+        calc_metrics.round_trips = 2
+        calc_metrics.documents_read = {"obj_tim": 10}
+        calc_metrics.documents_written = {calc_name: 1}
+        calc_metrics.requests["tba"] = {"count": 1, "seconds": 0.5}
+        return calc_metrics
+
+    def test_get_cycle_summary(self):
+        self.collector.add(self.make_calc_metrics("obj_team", 1.0))
+        self.collector.add(self.make_calc_metrics("pickability", 0.0, skipped=True))
+        summary = self.collector.get_cycle_summary()
+        assert summary["round_trips"] == 4
+        assert summary["documents_read"] == {"obj_tim": 20}
+        assert summary["documents_written"] == {"obj_team": 1, "pickability": 1}
+        assert summary["requests"]["tba"] == {"count": 2, "seconds": 1.0}
+        assert summary["calculations_ran"] == 1
+
+    def test_end_cycle(self):
+        self.collector.add(self.make_calc_metrics("obj_team", 1.0))
+        self.collector.add(self.make_calc_metrics("pickability", 2.0))
+        with patch("metrics.console") as mock_console:
+            summary = self.collector.end_cycle()
+        documents = self.db.insert_server_metrics.call_args.args[0]
+        assert [document["type"] for document in documents] == [
+            "cycle",
+            "calculation",
+            "calculation",
+        ]
+        assert documents[0]["round_trips"] == summary["round_trips"] == 4
+        assert documents[2]["calculation"] == "pickability"
+        assert len({document["cycle_start"] for document in documents}) == 1
+        table = mock_console.print.call_args.args[0]
+        # Slowest calculation first, then the totals
+        assert list(table.columns[0].cells) == ["pickability", "obj_team", "Total (2 ran)"]
+        # A new cycle is started
+        assert self.collector.calc_metrics == []
+
+    def test_end_cycle_database_error(self):
+        self.db.insert_server_metrics.side_effect = pymongo.errors.ServerSelectionTimeoutError()
+        with patch("metrics.console"):
+            self.collector.end_cycle()
@@ -0,0 +1,96 @@
+"""Tests profiler.py"""
+
+import argparse
+import logging
+import os
+import pstats
+import tracemalloc
+from unittest.mock import patch
+
+with patch("logging.getLogger", side_effect=logging.getLogger):
+    import profiler
+
+
+def inner():
+    return sum(range(100_000))
+
+
+def outer():
+    return [inner() for _ in range(3)]
+
+
+def test_get_frame_name():
+    assert profiler.get_frame_name(("/server/src/utils.py", 42, "read_schema")) == (
+        "utils.py:42(read_schema)"
+    )
+    assert profiler.get_frame_name(("~", 0, "<built-in method builtins.sum>")) == (
+        "<built-in method builtins.sum>"
+    )
+
+
+def test_profile(tmp_path):
+    calc_profiler = profiler.CalculationProfiler(str(tmp_path))
+    for _ in range(2):
+        with calc_profiler.profile("OBJTeamCalc"):
+            outer()
+    calc_profiler.write()
+    assert calc_profiler.run_counts["OBJTeamCalc"] == 2
+    stats = pstats.Stats(str(tmp_path / "OBJTeamCalc.pstats"))
+    # Runs are added up
+    assert [calls for (_, _, name), (_, calls, *_) in stats.stats.items() if name == "inner"] == [6]
+    with open(tmp_path / "profile.collapsed") as collapsed_file:
+        lines = collapsed_file.read().splitlines()
+    stacks = [line.rsplit(" ", 1)[0] for line in lines]
+    assert all(stack.startswith("OBJTeamCalc;") for stack in stacks)
+    assert any("(outer);" in stack and stack.endswith("(inner)") for stack in stacks)
+    assert all(int(line.rsplit(" ", 1)[1]) > 0 for line in lines)
+    assert not os.path.exists(tmp_path / "allocations.txt")
+
+
+def test_profile_memory(tmp_path):
+    calc_profiler = profiler.CalculationProfiler(str(tmp_path), trace_memory=True)
+    try:
+        with calc_profiler.profile("PickabilityCalc"):
+            data = [list(range(1000)) for _ in range(100)]
+        assert len(data) == 100
+    finally:
+        tracemalloc.stop()
+    with open(tmp_path / "allocations.txt") as allocations_file:
+        report = allocations_file.read()
+    assert report.startswith("PickabilityCalc (run 1) top allocations:")
+    assert "test_profiler.py" in report
+
+
+def test_get_collapsed_stacks():
+    stats = pstats.Stats.__new__(pstats.Stats)
+    main = ("main.py", 1, "main")
+    calc = ("calc.py", 1, "calc")
+    helper = ("calc.py", 10, "helper")
+    # (primitive calls, calls, self time, cumulative time, callers)
+    stats.stats = {
+        main: (1, 1, 1.0, 10.0, {}),
+        calc: (2, 2, 2.0, 9.0, {main: (2, 2, 2.0, 9.0)}),
+        # Called directly by main and by calc, and recursively by itself
+        helper: (
+            3,
+            4,
+            7.0,
+            7.0,
+            {main: (1, 1, 0.0, 0.0), calc: (2, 2, 7.0, 7.0), helper: (1, 1, 0.0, 0.0)},
+        ),
+    }
+    assert profiler.get_collapsed_stacks(stats, "Calc") == {
+        "Calc;main.py:1(main)": 1_000_000,
+        "Calc;main.py:1(main);calc.py:1(calc)": 2_000_000,
+        "Calc;main.py:1(main);calc.py:1(calc);calc.py:10(helper)": 7_000_000,
+    }
+
+
+def test_from_args():
+    parser = argparse.ArgumentParser()
+    profiler.add_arguments(parser)
+    assert profiler.from_args(parser.parse_args([])) is None
+    assert profiler.from_args(parser.parse_args(["--profile-memory"])) is None
+    args = parser.parse_args(["--profile"])
+    assert args.profile.startswith(os.path.join(str(profiler.utils.MAIN_DIRECTORY), "data"))
+    assert not args.profile_memory
@@ -0,0 +1,97 @@
+"""Tests qr_ingest.py"""
+
+import io
+import os
+import socket
+import threading
+from unittest.mock import MagicMock, patch
+
+with patch("builtins.input", return_value=""):
+    import qr_ingest
+
+
+def test_clean_qr_code():
+    assert qr_ingest.clean_qr_code("+a1$b34\n") == "+A1$B34"
+    assert qr_ingest.clean_qr_code("Q*A1$B34") == "*A1$B34"
+    assert qr_ingest.clean_qr_code("  \n") == ""
+
+
+def test_is_running(tmp_path):
+    pid_file = str(tmp_path / "qr_ingest.pid")
+    with patch("qr_ingest.PID_FILE", pid_file):
+        assert not qr_ingest.is_running()
+        with open(pid_file, "w") as f:
+            f.write(str(os.getpid()))
+        assert qr_ingest.is_running()
+        with open(pid_file, "w") as f:
+            f.write("not a pid")
+        assert not qr_ingest.is_running()
+
+
+class TestQRIngest:
+    def setup_method(self, method):
+        self.upload = MagicMock(side_effect=lambda qrs: qrs)
+        self.test_ingest = qr_ingest.QRIngest(self.upload)
+
+    def test_add(self):
+        assert self.test_ingest.add("+A1$B34\n")
+        # Duplicates and empty lines aren't queued
+        assert not self.test_ingest.add("q+a1$b34")
+        assert not self.test_ingest.add("\n")
+        assert self.test_ingest.add("*A1$B34")
+        assert self.test_ingest.get_batch(timeout=0) == ["+A1$B34", "*A1$B34"]
+
+    def test_get_batch(self):
+        assert self.test_ingest.get_batch(timeout=0) == []
+        self.test_ingest.BATCH_SIZE = 2
+        self.test_ingest.read_lines(io.StringIO("+A\n+B\n+C\n"))
+        assert self.test_ingest.get_batch(timeout=0) == ["+A", "+B"]
+        assert self.test_ingest.get_batch(timeout=0) == ["+C"]
+
+    def test_upload_batch(self):
+        assert self.test_ingest.upload_batch([]) == []
+        self.upload.assert_not_called()
+        self.test_ingest.add("+A")
+        assert self.test_ingest.upload_batch(self.test_ingest.get_batch(timeout=0)) == ["+A"]
+        self.upload.assert_called_once_with(["+A"])
+        # QRs that failed to upload are queued again
+        self.test_ingest.add("+B")
+        self.test_ingest.RETRY_SECONDS = 0
+        self.upload.side_effect = Exception("Database not running")
+        assert self.test_ingest.upload_batch(self.test_ingest.get_batch(timeout=0)) == []
+        assert not self.test_ingest.add("+B")
+        assert not self.test_ingest.add("+A")
+        self.upload.side_effect = lambda qrs: qrs
+        assert self.test_ingest.upload_batch(self.test_ingest.get_batch(timeout=0)) == ["+B"]
+        # Without retrying, failed QRs aren't queued again
+        self.test_ingest.add("+C")
+        self.upload.side_effect = Exception("Database not running")
+        assert self.test_ingest.upload_batch(self.test_ingest.get_batch(timeout=0), False) == []
+        assert self.test_ingest.get_batch(timeout=0) == []
+
+    def test_serve(self):
+        tcp_server = self.test_ingest.serve(0)
+        thread = threading.Thread(target=tcp_server.serve_forever, daemon=True)
+        thread.start()
+        with socket.create_connection(tcp_server.server_address) as connection:
+            connection.sendall(b"+A\n*B\n")
+        assert self.test_ingest.get_batch(timeout=5) + self.test_ingest.get_batch(timeout=5) == [
+            "+A",
+            "*B",
+        ]
+        tcp_server.shutdown()
+        tcp_server.server_close()
+
+    def test_scan_directory(self, tmp_path):
+        device_dir = tmp_path / "A1B2C3D4"
+        device_dir.mkdir()
+        (device_dir / "1_1678_1700000000.txt").write_text("+A\n")
+        (device_dir / "pit_data.json").write_text("{}")
+        # Only files named like QR files are read
+        (device_dir / "notes.txt").write_text("+C\n")
+        assert self.test_ingest.scan_directory(str(tmp_path)) == 1
+        # Unchanged files aren't read again
+        assert self.test_ingest.scan_directory(str(tmp_path)) == 0
+        (device_dir / "1_1700000001.txt").write_text("*B\n")
+        assert self.test_ingest.scan_directory(str(tmp_path)) == 1
+        assert self.test_ingest.get_batch(timeout=0) == ["+A", "*B"]
@@ -0,0 +1,95 @@
+"""Tests query_stats.py"""
+
+import json
+import logging
+from unittest.mock import patch
+
+import pytest
+
+with patch("logging.getLogger", side_effect=logging.getLogger):
+    import metrics
+    import query_stats
+
+
+@pytest.fixture
+def fake_database():
+    """Returns a database whose methods are tracked, and clears the stats afterwards"""
+    with patch("query_stats.ENABLED", True):
+
+        class FakeDatabase:
+            @query_stats.track()
+            def find(self, collection, query={}):
+                return []
+
+            @query_stats.track()
+            def group_by(self, collection, key_fields, query={}):
+                # Tracked methods calling each other are only counted once
+                return self.find(collection, query)
+
+            @query_stats.track("tba_cache")
+            def get_tba_cache(self, api_url):
+                return None
+
+    yield FakeDatabase()
+    query_stats._stats.clear()
+
+
+def test_track_disabled():
+    def find(self, collection, query={}):
+        return []
+
+    with patch("query_stats.ENABLED", False):
+        assert query_stats.track()(find) is find
+
+
+def test_get_query_shape():
+    assert query_stats.get_query_shape(None) == "{}"
+    assert query_stats.get_query_shape({}) == "{}"
+    assert query_stats.get_query_shape({"team_number": "1678"}) == query_stats.get_query_shape(
+        {"team_number": "254"}
+    )
+    assert query_stats.get_query_shape({"match_number": {"$in": [1, 2, 3]}}) == (
+        '{"match_number": {"$in": ["int"]}}'
+    )
+    assert query_stats.get_query_shape({"team_number": "1678"}) != query_stats.get_query_shape(
+        {"team_number": 1678}
+    )
+
+
+def test_track(fake_database):
+    with metrics.record("OBJTeamCalc"):
+        for team in ["1678", "254", "971"]:
+            fake_database.find("obj_tim", {"team_number": team})
+        fake_database.group_by("ss_tim", ("team_number",), query={"team_number": "1678"})
+    fake_database.get_tba_cache("event/2024cave/matches")
+    report = {
+        (row["caller"], row["collection"], row["method"]): row for row in query_stats.get_report()
+    }
+    assert report[("OBJTeamCalc", "obj_tim", "find")]["calls"] == 3
+    assert report[("OBJTeamCalc", "obj_tim", "find")]["query_shape"] == '{"team_number": "str"}'
+    assert report[("OBJTeamCalc", "ss_tim", "group_by")]["calls"] == 1
+    # Calls outside of a calculation are attributed to the calling function
+    assert report[("test_query_stats.test_track", "tba_cache", "get_tba_cache")]["calls"] == 1
+    assert len(report) == 3
+
+
+def test_end_cycle(fake_database, tmp_path):
+    report_path = str(tmp_path / "query_stats.json")
+    for team in range(5):
+        fake_database.find("obj_tim", {"team_number": str(team)})
+    fake_database.find("obj_team")
+    with patch("query_stats.ENABLED", True), patch("query_stats.REPEAT_THRESHOLD", 3), patch(
+        "query_stats.utils.create_file_path", return_value=report_path
+    ), patch("query_stats.console"), patch.object(query_stats.log, "warning") as mock_warning:
+        report = query_stats.end_cycle()
+    assert {row["query_shape"]: row["repeated"] for row in report} == {
+        '{"team_number": "str"}': True,
+        "{}": False,
+    }
+    mock_warning.assert_called_once()
+    with open(report_path) as report_file:
+        assert json.load(report_file) == report
+    # Stats are reset for the next cycle
+    assert query_stats.get_report() == []
+    with patch("query_stats.ENABLED", False):
+        assert query_stats.end_cycle() is None
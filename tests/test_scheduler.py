@@ -0,0 +1,160 @@
+"""Tests scheduler.py"""
+
+from unittest.mock import MagicMock, patch
+import logging
+
+import yaml
+
+with patch("logging.getLogger", side_effect=logging.getLogger):
+    import scheduler
+    import utils
+
+
+def make_calc(inputs, outputs=None, name="MagicMock"):
+    calc = MagicMock()
+    calc.inputs = inputs
+    calc.outputs = outputs
+    calc.watched_collections = NotImplemented
+    calc.name = name
+    return calc
+
+
+def load_calculations():
+    """Returns a calculation for each entry in `calculations.yml` with its inputs and outputs"""
+    with open(utils.create_file_path("src/calculations.yml")) as calculations_file:
+        calculation_load_list = yaml.load(calculations_file, Loader=utils.YAML_LOADER)
+    return [
+        make_calc(calc.get("inputs"), calc.get("outputs"), calc["class_name"])
+        for calc in calculation_load_list
+    ]
+
+
+class TestCalculationScheduler:
+    def setup_method(self, method):
+        self.source = make_calc([], ["tba_tim"])
+        self.obj_tims = make_calc(["unconsolidated_totals", "tba_tim"], ["obj_tim"])
+        self.obj_team = make_calc(["obj_tim", "ss_tim"], ["obj_team"])
+        self.test_server = MagicMock()
+        self.test_server.calculations = [self.source, self.obj_tims, self.obj_team]
+        self.test_scheduler = scheduler.CalculationScheduler(self.test_server)
+
+    def test_init(self):
+        assert self.test_scheduler.sources == [self.source]
+        assert self.test_scheduler.watched == {
+            "unconsolidated_totals",
+            "tba_tim",
+            "obj_tim",
+            "ss_tim",
+        }
+        assert self.test_scheduler.first_cycle
+
+    def test_get_triggered_calculations(self):
+        assert self.test_scheduler.get_triggered_calculations({"tba_tim"}) == [self.obj_tims]
+        assert self.test_scheduler.get_triggered_calculations({"ss_tim", "tba_tim"}) == [
+            self.obj_tims,
+            self.obj_team,
+        ]
+        assert self.test_scheduler.get_triggered_calculations({"raw_qr"}) == []
+
+    def test_wait_for_changes(self):
+        self.test_scheduler.stream = MagicMock()
+        self.test_scheduler.stream.try_next.side_effect = [
+            {"ns": {"coll": "obj_tim"}},
+            {"ns": {"coll": "ss_tim"}},
+            {"ns": {"coll": "obj_tim"}},
+            None,
+        ]
+        assert self.test_scheduler.wait_for_changes(10) == {"obj_tim", "ss_tim"}
+        # Times out without any changes
+        self.test_scheduler.stream.try_next.side_effect = None
+        self.test_scheduler.stream.try_next.return_value = None
+        assert self.test_scheduler.wait_for_changes(0) == set()
+
+    def test_get_trigger_collections(self):
+        calc = make_calc(None)
+        assert scheduler.CalculationScheduler.get_trigger_collections(calc) == set()
+        # Falls back to watched collections without inputs
+        calc.watched_collections = ["obj_tim"]
+        assert scheduler.CalculationScheduler.get_trigger_collections(calc) == {"obj_tim"}
+        calc.inputs = ["obj_team", "tba_team"]
+        assert scheduler.CalculationScheduler.get_trigger_collections(calc) == {
+            "obj_team",
+            "tba_team",
+        }
+
+    def test_get_triggered_calculations_ran(self):
+        # obj_tims already read what the source wrote, but obj_team hasn't read obj_tims' writes
+        assert self.test_scheduler.get_triggered_calculations(
+            {"tba_tim", "obj_tim"}, [self.source, self.obj_tims]
+        ) == [self.obj_team]
+        assert (
+            self.test_scheduler.get_triggered_calculations(
+                {"obj_tim"}, [self.source, self.obj_tims, self.obj_team]
+            )
+            == []
+        )
+        # Changes by calculations that ran later trigger calculations that ran earlier
+        assert self.test_scheduler.get_triggered_calculations({"tba_tim"}, [self.obj_tims]) == [
+            self.obj_tims
+        ]
+
+    def test_calculations_yml(self):
+        calculations = load_calculations()
+        self.test_server.calculations = calculations
+        test_scheduler = scheduler.CalculationScheduler(self.test_server)
+        assert [calc.name for calc in test_scheduler.sources] == ["QRInput", "TBATIMCalc"]
+
+        def get_triggered(changed, ran=()):
+            return [calc.name for calc in test_scheduler.get_triggered_calculations(changed, ran)]
+
+        # Every collection a calculation reads triggers it
+        for collection in ["obj_team", "subj_team", "tba_team", "auto_paths"]:
+            assert "PickabilityCalc" in get_triggered({collection})
+        assert "SimPrecisionCalc" in get_triggered({"auto_pim"})
+        assert "ScoutPrecisionCalc" in get_triggered({"sim_precision"})
+        for collection in ["tba_team", "obj_tim"]:
+            assert "PredictedAimCalc" in get_triggered({collection})
+        assert "PredictedElims" in get_triggered({"tba_team"})
+        # Calculations aren't triggered by their own writes after running
+        assert "PredictedAimCalc" not in get_triggered({"predicted_aim"}, calculations)
+        assert "AutoPathCalc" not in get_triggered({"auto_pim"}, calculations)
+        # DataFlagging writes obj_tim after the calculations that read it ran
+        assert get_triggered({"obj_tim"}, calculations) == [
+            "TBATeamCalc",
+            "AutoPIMCalc",
+            "OBJTeamCalc",
+            "PredictedAimCalc",
+            "DataAccuracy",
+        ]
+
+    def test_run_cycle(self):
+        self.test_scheduler.stream = MagicMock()
+        # Changes made while the first cycle ran are drained, not dropped
+        self.test_scheduler.stream.try_next.side_effect = [{"ns": {"coll": "ss_tim"}}, None, None]
+        with patch.object(self.test_scheduler, "DEBOUNCE_SECONDS", 0):
+            self.test_scheduler.run_cycle()
+        self.test_scheduler.stream.close.assert_not_called()
+        assert [call.args for call in self.test_server.run_calculations.call_args_list] == [
+            (),
+            ([self.obj_team],),
+        ]
+        self.test_server.run_calculations.reset_mock()
+
+        self.test_scheduler.stream.try_next.side_effect = [
+            {"ns": {"coll": "tba_tim"}},
+            None,
+            None,
+        ]
+        with patch.object(self.test_scheduler, "DEBOUNCE_SECONDS", 0):
+            self.test_scheduler.run_cycle()
+        # The source's own write to tba_tim only triggers obj_tims
+        assert [call.args for call in self.test_server.run_calculations.call_args_list] == [
+            ([self.source],),
+            ([self.obj_tims],),
+        ]
+
+    def test_run_cycle_without_stream(self):
+        self.test_scheduler.stream = None
+        for _ in range(2):
+            self.test_scheduler.run_cycle()
+        assert [call.args for call in self.test_server.run_calculations.call_args_list] == [(), ()]
@@ -0,0 +1,117 @@
+"""Tests server.py"""
+
+from unittest.mock import MagicMock, patch
+import logging
+
+with patch("logging.getLogger", side_effect=logging.getLogger):
+    from server import Server
+
+
+def make_calc(inputs, outputs):
+    calc = MagicMock()
+    calc.inputs = inputs
+    calc.outputs = outputs
+    return calc
+
+
+def make_incremental_server(document_hashes):
+    test_server = Server.__new__(Server)
+    test_server.incremental = True
+    test_server.seen_hashes = {}
+    test_server.local_db = MagicMock()
+    test_server.local_db.get_document_hashes.return_value = document_hashes
+    test_server.metrics_collector = MagicMock()
+    test_server.calc_profiler = None
+    return test_server
+
+
+def make_incremental_calc(external_hashes=None):
+    calc = make_calc(["obj_tim"], ["obj_team"])
+    calc.INCREMENTAL = True
+    calc.watched_collections = ["obj_tim"]
+    calc.get_external_hashes.return_value = external_hashes or {}
+    # Record the dirty keys each run was given
+    calc.dirty_keys_by_run = []
+    calc.run.side_effect = lambda: calc.dirty_keys_by_run.append(calc.dirty_keys)
+    return calc
+
+
+class TestServer:
+    def test_get_changed_keys(self):
+        old_hashes = {("1678", 1): "a", ("254", 1): "b", ("971", 1): "c"}
+        new_hashes = {("1678", 1): "a", ("254", 1): "d", ("118", 1): "e"}
+        assert Server.get_changed_keys(old_hashes, new_hashes) == {
+            ("254", 1),
+            ("971", 1),
+            ("118", 1),
+        }
+        assert Server.get_changed_keys(old_hashes, old_hashes) == set()
+
+    def test_get_dependencies(self):
+        calculations = [
+            make_calc([], ["raw_qr"]),
+            make_calc([], ["tba_tim"]),
+            make_calc(["raw_qr"], ["unconsolidated_obj_tim"]),
+            make_calc(["unconsolidated_obj_tim", "tba_tim"], ["obj_tim"]),
+            make_calc(["obj_tim"], ["obj_team"]),
+            # Writes to a collection read by an earlier calculation
+            make_calc([], ["tba_tim"]),
+            # Unknown outputs depend on everything before it
+            make_calc(["obj_team"], None),
+            make_calc(["raw_qr"], ["test"]),
+        ]
+        assert Server.get_dependencies(calculations) == {
+            0: set(),
+            1: set(),
+            2: {0},
+            3: {1, 2},
+            4: {3},
+            5: {1, 3},
+            6: {0, 1, 2, 3, 4, 5},
+            7: {0, 6},
+        }
+
+    def test_run_calculation(self):
+        test_server = make_incremental_server({("1678", 1): "a"})
+        calc = make_incremental_calc()
+        test_server.run_calculation(calc)
+        calc.run.assert_called_once()
+        calc_metrics = test_server.metrics_collector.add.call_args.args[0]
+        assert calc_metrics.calc_name == "MagicMock"
+        assert not calc_metrics.skipped
+        # Nothing changed, so the calculation is skipped
+        test_server.run_calculation(calc)
+        calc.run.assert_called_once()
+        assert test_server.metrics_collector.add.call_args.args[0].skipped
+
+    def test_run_calculation_dirty_keys(self):
+        test_server = make_incremental_server({("1678", 1): "a", ("254", 1): "b"})
+        calc = make_incremental_calc({"tba_played_matches": {("1678", None): "1"}})
+        # Everything is recalculated on the first run
+        assert test_server._run_calculation(calc)
+        test_server.local_db.get_document_hashes.return_value = {("1678", 1): "a", ("254", 1): "c"}
+        assert test_server._run_calculation(calc)
+        # Changes to external inputs are found like changes to watched collections
+        calc.get_external_hashes.return_value = {"tba_played_matches": {("1678", None): "2"}}
+        assert test_server._run_calculation(calc)
+        assert not test_server._run_calculation(calc)
+        assert calc.dirty_keys_by_run == [
+            None,
+            {"obj_tim": {("254", 1)}, "tba_played_matches": set()},
+            {"obj_tim": set(), "tba_played_matches": {("1678", None)}},
+        ]
+        # Hashes are only stored per calculation
+        assert list(test_server.seen_hashes) == ["MagicMock"]
+
+    def test_run_calculation_not_incremental(self):
+        test_server = make_incremental_server({("1678", 1): "a"})
+        calc = make_incremental_calc()
+        calc.INCREMENTAL = False
+        for _ in range(2):
+            assert test_server._run_calculation(calc)
+        test_server.incremental = False
+        calc.INCREMENTAL = True
+        assert test_server._run_calculation(calc)
+        assert calc.run.call_count == 3
+        test_server.local_db.get_document_hashes.assert_not_called()
+        assert test_server.seen_hashes == {}
@@ -0,0 +1,134 @@
+"""Tests tba_communicator.py"""
+
+from unittest.mock import MagicMock, patch
+import logging
+import time
+
+import pytest
+import requests
+
+with patch("logging.getLogger", side_effect=logging.getLogger):
+    import tba_communicator
+
+
+@pytest.fixture
+def cycle_cache():
+    """Turns the per-cycle cache on, and off again afterwards"""
+    tba_communicator.start_cycle()
+    yield
+    tba_communicator._cycle_cache.clear()
+    tba_communicator._cycle_cache_locks.clear()
+    tba_communicator._cycle_cache_enabled = False
+
+
+def test_tba_request_cycle_cache(cycle_cache):
+    response = [{"key": "2025caph_qm1", "alliances": {"red": {"team_keys": ["frc1678"]}}}]
+    with patch("tba_communicator._send_tba_request", return_value=response) as mock_send:
+        first = tba_communicator.tba_request("event/2025caph/matches")
+        second = tba_communicator.tba_request("event/2025caph/matches")
+        # Each endpoint is only requested once per cycle
+        mock_send.assert_called_once_with("event/2025caph/matches", True)
+        assert first == second == response
+        # Callers get copies, so they can't modify each other's data
+        first[0]["alliances"]["red"]["team_keys"].append("frc254")
+        assert first is not second
+        assert tba_communicator.tba_request("event/2025caph/matches") == response
+        # Unmodified responses are cached separately
+        tba_communicator.tba_request("event/2025caph/matches", modify=False)
+        assert mock_send.call_count == 2
+
+
+def test_start_cycle(cycle_cache):
+    with patch("tba_communicator._send_tba_request", return_value=[]) as mock_send:
+        tba_communicator.tba_request("event/2025caph/teams/simple")
+        assert tba_communicator._cycle_cache_locks
+        tba_communicator.start_cycle()
+        assert tba_communicator._cycle_cache == {}
+        assert tba_communicator._cycle_cache_locks == {}
+        tba_communicator.tba_request("event/2025caph/teams/simple")
+        assert mock_send.call_count == 2
+
+
+def test_tba_request_failures_not_cached(cycle_cache):
+    with patch("tba_communicator._send_tba_request", side_effect=[None, []]) as mock_send:
+        assert tba_communicator.tba_request("event/2025caph/teams/simple") is None
+        assert tba_communicator.tba_request("event/2025caph/teams/simple") == []
+        assert mock_send.call_count == 2
+
+
+def test_tba_request_without_cycle():
+    with patch("tba_communicator._send_tba_request", return_value=[]) as mock_send:
+        for _ in range(2):
+            tba_communicator.tba_request("event/2025caph/teams/simple")
+        assert mock_send.call_count == 2
+        assert tba_communicator._cycle_cache == {}
+
+
+@pytest.fixture
+def cache_db():
+    """Patches the `tba_cache` database and the API key"""
+    with patch("tba_communicator._get_cache_db") as mock_get_cache_db, patch(
+        "tba_communicator.get_api_key", return_value="key"
+    ):
+        yield mock_get_cache_db.return_value
+
+
+def make_response(status_code, data=None, headers=None):
+    response = MagicMock()
+    response.status_code = status_code
+    response.json.return_value = data
+    response.headers = headers or {}
+    return response
+
+
+def test_send_tba_request_etag(cache_db):
+    cache_db.get_tba_cache.return_value = None
+    headers = {"ETag": 'W/"123"', "Cache-Control": "public, max-age=60"}
+    with patch(
+        "tba_communicator.requests.get", return_value=make_response(200, ["frc1678"], headers)
+    ) as mock_get, patch("tba_communicator.time.time", return_value=1000):
+        assert tba_communicator._send_tba_request("event/2025caph/teams/keys") == ["frc1678"]
+    assert "If-None-Match" not in mock_get.call_args.kwargs["headers"]
+    cache_db.update_tba_cache.assert_called_once_with(
+        ["frc1678"], "event/2025caph/teams/keys", 'W/"123"', 1060
+    )
+
+
+def test_send_tba_request_not_modified(cache_db):
+    cache_db.get_tba_cache.return_value = {"data": ["frc1678"], "etag": 'W/"123"', "expires": 0}
+    with patch(
+        "tba_communicator.requests.get",
+        return_value=make_response(304, headers={"Cache-Control": "max-age=30"}),
+    ) as mock_get, patch("tba_communicator.time.time", return_value=1000):
+        assert tba_communicator._send_tba_request("event/2025caph/teams/keys") == ["frc1678"]
+    assert mock_get.call_args.kwargs["headers"]["If-None-Match"] == 'W/"123"'
+    mock_get.return_value.json.assert_not_called()
+    # The cached response is valid for another max-age
+    cache_db.update_tba_cache.assert_called_once_with(
+        ["frc1678"], "event/2025caph/teams/keys", 'W/"123"', 1030
+    )
+
+
+def test_send_tba_request_fresh(cache_db):
+    cache_db.get_tba_cache.return_value = {
+        "data": ["frc1678"],
+        "etag": 'W/"123"',
+        "expires": time.time() + 60,
+    }
+    with patch("tba_communicator.requests.get") as mock_get:
+        assert tba_communicator._send_tba_request("event/2025caph/teams/keys") == ["frc1678"]
+    mock_get.assert_not_called()
+    cache_db.update_tba_cache.assert_not_called()
+
+
+def test_send_tba_request_connection_error(cache_db):
+    cache_db.get_tba_cache.return_value = {"data": ["frc1678"], "etag": 'W/"123"', "expires": 0}
+    with patch(
+        "tba_communicator.requests.get", side_effect=requests.exceptions.ConnectionError
+    ) as mock_get:
+        assert tba_communicator._send_tba_request("event/2025caph/teams/keys") == ["frc1678"]
+        mock_get.assert_called_once()
+        # Nothing to fall back to
+        cache_db.get_tba_cache.return_value = None
+        assert tba_communicator._send_tba_request("event/2025caph/teams/keys") is None
+    cache_db.update_tba_cache.assert_not_called()
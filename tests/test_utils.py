@@ -75,6 +75,29 @@ def test_get_schema_filenames():
     assert "obj_pit_collection_schema.yml" in schema_names
 
 
+def test_read_schema_cache(tmp_path):
+    schema_path = "schema/calc_tba_team_schema.yml"
+    with patch("utils.SCHEMA_CACHE_DIRECTORY", str(tmp_path)), patch.dict(
+        utils._internal_schemas, clear=True
+    ):
+        schema = utils.read_schema(schema_path)
+        cache_path = utils._get_schema_cache_path(schema_path)
+        assert os.path.exists(cache_path)
+        mtime = os.stat(utils.create_file_path(schema_path, False)).st_mtime_ns
+        assert utils._read_cached_schema(schema_path, mtime) == schema
+        # Caches of an older version of the schema file are ignored
+        assert utils._read_cached_schema(schema_path, mtime - 1) is None
+        # Cached schemas are used instead of parsing the schema file again
+        utils._write_cached_schema(schema_path, mtime, {"cached": True})
+        with patch("yaml.load") as mock_load:
+            assert utils._inner_read_schema(schema_path) == {"cached": True}
+            mock_load.assert_not_called()
+        # Corrupt caches are ignored
+        with open(cache_path, "wb") as cache_file:
+            cache_file.write(b"not a pickle")
+        assert utils._inner_read_schema(schema_path) == schema
+
+
 def test_unprefix_schema_dict():
     assert utils.unprefix_schema_dict({"a.b": {"c.d": "e", "f.g": {"h.i": "j"}}}) == {
         "b": {"d": "e", "g": {"i": "j"}}